@@ -0,0 +1,11 @@
+const { v4: uuidv4 } = require('uuid')
+
+// Correlation ID shared with the ML service: reuse the caller's X-Request-ID or mint one
+const requestId = (req, res, next) => {
+  const incoming = req.get('X-Request-ID')
+  req.id = incoming && /^[\w.-]{1,128}$/.test(incoming) ? incoming : uuidv4()
+  res.set('X-Request-ID', req.id)
+  next()
+}
+
+module.exports = requestId
@@ -73,6 +73,9 @@ router.post('/', auth, upload.single('image'), async (req, res) => {
     const mlResponse = await axios.post(`${mlServiceUrl}/predict`, formData, {
       headers: {
         'Content-Type': 'multipart/form-data',
+        'X-Request-ID': req.id,
+        // Let the ML service drop the request instead of computing past our timeout
+        'X-Request-Timeout-Ms': '29000',
       },
       timeout: 30000 // 30 second timeout
     })
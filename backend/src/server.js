@@ -16,6 +16,7 @@ const userRoutes = require('./routes/users')
 
 const logger = require('./utils/logger')
 const errorHandler = require('./middleware/errorHandler')
+const requestId = require('./middleware/requestId')
 const { connectDB } = require('./config/simpleDatabase')
 
 const app = express()
@@ -33,6 +34,7 @@ app.use(cors({
 }))
 
 // Compression and logging
+app.use(requestId)
 app.use(compression())
 app.use(morgan('combined', { stream: { write: message => logger.info(message.trim()) } }))
 
@@ -92,7 +94,10 @@ app.post('/api/test-predict', async (req, res) => {
 
     if (plant && ['potato', 'tomato'].includes(String(plant).toLowerCase())) {
       try {
-        await axios.post(`${mlServiceUrl}/model/switch`, { plant: String(plant).toLowerCase() }, { timeout: 10000 })
+        await axios.post(`${mlServiceUrl}/model/switch`, { plant: String(plant).toLowerCase() }, {
+          headers: { 'X-Request-ID': req.id },
+          timeout: 10000
+        })
       } catch (switchErr) {
         logger.warn('Model switch request failed:', switchErr.message)
       }
@@ -104,6 +109,9 @@ app.post('/api/test-predict', async (req, res) => {
     const mlResponse = await axios.post(`${mlServiceUrl}/predict`, formData, {
       headers: {
         ...formData.getHeaders(),
+        'X-Request-ID': req.id,
+        // Let the ML service drop the request instead of computing past our timeout
+        'X-Request-Timeout-Ms': '29000',
       },
       timeout: 30000
     })
@@ -0,0 +1,110 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from app.metrics import ADMISSION_QUEUE, REJECTED
+
+# Remaining time budget the caller is willing to wait, in milliseconds (the backend
+# sends its own HTTP timeout); requests without it get DEFAULT_REQUEST_TIMEOUT_S
+TIMEOUT_HEADER = 'X-Request-Timeout-Ms'
+
+class Overloaded(Exception):
+    """The admission queue is full; ``retry_after`` is a hint in whole seconds"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Service overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before its inference could run"""
+
+def request_deadline(timeout_ms: Optional[float], default_timeout_s: float) -> float:
+    """Absolute ``time.monotonic()`` deadline for a request"""
+    budget = timeout_ms / 1000.0 if timeout_ms is not None else default_timeout_s
+    return time.monotonic() + max(budget, 0.0)
+
+class AdmissionController:
+    """Bounded concurrency with a bounded FIFO queue and per-request deadlines.
+
+    At most ``max_in_flight`` requests hold a slot; up to ``max_queue`` more wait in
+    arrival order. Further requests are shed immediately with ``Overloaded``, and a
+    queued request whose deadline passes leaves the queue with ``DeadlineExceeded``
+    instead of being computed for a client that has given up.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, ewma_alpha: float = 0.2):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        self._ewma_alpha = ewma_alpha
+        self._service_time = 0.1
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for w in self._waiters if not w.done())
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained"""
+        backlog = (self.queued + 1) * self._service_time / max(self.max_in_flight, 1)
+        return max(1, math.ceil(backlog))
+
+    @asynccontextmanager
+    async def admit(self, deadline: float):
+        if time.monotonic() >= deadline:
+            REJECTED.labels('deadline').inc()
+            raise DeadlineExceeded("Deadline passed before admission")
+        if self.in_flight < self.max_in_flight and not self.queued:
+            self.in_flight += 1
+        else:
+            if self.queued >= self.max_queue:
+                REJECTED.labels('queue_full').inc()
+                raise Overloaded(self.retry_after())
+            await self._wait_for_slot(deadline)
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self._service_time += self._ewma_alpha * (elapsed - self._service_time)
+            self._release()
+
+    async def _wait_for_slot(self, deadline: float):
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_QUEUE.set(self.queued)
+        try:
+            await asyncio.wait([waiter], timeout=deadline - time.monotonic())
+        except asyncio.CancelledError:
+            # Client went away while queued; hand on a slot we may have just received
+            self._abandon(waiter)
+            raise
+        if not waiter.done():
+            self._abandon(waiter)
+            REJECTED.labels('deadline').inc()
+            raise DeadlineExceeded("Deadline passed while queued")
+        ADMISSION_QUEUE.set(self.queued)
+
+    def _abandon(self, waiter: asyncio.Future):
+        if waiter.done() and not waiter.cancelled():
+            self._release()
+        else:
+            waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        ADMISSION_QUEUE.set(self.queued)
+
+    def _release(self):
+        # Hand the slot straight to the oldest live waiter so queued requests stay FIFO
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
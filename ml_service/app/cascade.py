@@ -0,0 +1,68 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import torch
+
+from app.admission import DeadlineExceeded
+
+class EscalationBatcher:
+    """Coalesces requests escalated by the cascade into batched full-model passes.
+
+    The first pending request opens a window of ``max_wait`` seconds; the batch is
+    dispatched when the window closes or ``max_batch`` requests have joined. Requests
+    whose deadline has passed by then are failed with ``DeadlineExceeded`` instead of
+    being computed. Note that admission control (``MAX_IN_FLIGHT``) also bounds how
+    many requests can be waiting here at once.
+    """
+
+    def __init__(self, run_batch: Callable[[torch.Tensor], Awaitable[torch.Tensor]], max_batch: int = 8,
+                 max_wait: float = 0.01):
+        self._run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self._pending: List[Tuple[torch.Tensor, Optional[float], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def submit(self, input_tensor: torch.Tensor, deadline: Optional[float] = None) -> torch.Tensor:
+        """Logits of the full model for a ``(1, C, H, W)`` input"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((input_tensor, deadline, future))
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        now = time.monotonic()
+        batch = []
+        for input_tensor, deadline, future in pending:
+            if future.done():
+                continue  # caller was cancelled while waiting
+            if deadline is not None and now >= deadline:
+                future.set_exception(DeadlineExceeded("Deadline passed before escalation"))
+                continue
+            batch.append((input_tensor, future))
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        try:
+            outputs = await self._run_batch(torch.cat([input_tensor for input_tensor, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), row in zip(batch, outputs):
+            if not future.done():
+                future.set_result(row.unsqueeze(0))
@@ -1,18 +1,138 @@
 import os
+import re
+from typing import List
 from pydantic_settings import BaseSettings
 
+# Onboarded crop names become file names under PROTOTYPE_DIR
+PLANT_NAME_PATTERN = re.compile(r'[a-z0-9_-]+')
+
 class Settings(BaseSettings):
     MODEL_PATH: str = "models/potato_model_best.pth"
     POTATO_MODEL_PATH: str = "models/potato_model_best.pth"
     # Point directly to the trained tomato checkpoint produced by training script
     TOMATO_MODEL_PATH: str = "ml_training/models/tomato/tomato_model_best.pth"
     TOMATO_INVERT_OUTPUT: bool = True
+    # Architecture used when a checkpoint does not record one (and for the pretrained fallback)
+    MODEL_ARCHITECTURE: str = "efficientnet_b0"
+    # Serve distilled student checkpoints instead of the full models when configured
+    USE_STUDENT_MODEL: bool = False
+    POTATO_STUDENT_MODEL_PATH: str = "ml_training/models/potato/potato_student_best.pth"
+    TOMATO_STUDENT_MODEL_PATH: str = "ml_training/models/tomato/tomato_student_best.pth"
+    # Reported in responses and metric labels when a checkpoint does not record its own
+    MODEL_VERSION: str = "1.0.0"
+    # Hot reload: the served checkpoint (and cascade student) is polled every interval; a
+    # file that changed and then stayed unchanged for one more poll is loaded in the
+    # background, warmed up by MODEL_WARMUP_RUNS self-test passes and swapped in atomically
+    MODEL_WATCH_ENABLED: bool = True
+    MODEL_WATCH_INTERVAL_S: float = 5.0
+    MODEL_WARMUP_RUNS: int = 2
+    # Shadow evaluation: SHADOW_FRACTION of /predict requests are also classified by the
+    # candidate checkpoint in the background (batched, on its own thread) and compared on
+    # /model/shadow. Its compute is capped: a bounded queue that drops instead of waiting,
+    # no batches while the primary is saturated, and at most SHADOW_MAX_BUSY_FRACTION of
+    # wall time. Empty path disables; /admin/shadow starts and stops it at runtime
+    SHADOW_MODEL_PATH: str = ""
+    SHADOW_FRACTION: float = 0.1
+    SHADOW_MAX_BATCH: int = 8
+    SHADOW_BATCH_WAIT_MS: float = 50.0
+    SHADOW_MAX_QUEUE: int = 32
+    SHADOW_MAX_BUSY_FRACTION: float = 0.25
+    SHADOW_MAX_DELAY_S: float = 30.0
     DATASET_PATH: str = "dataset"
     MLFLOW_TRACKING_URI: str = "http://localhost:5000"
     LOG_LEVEL: str = "INFO"
+    # "json" for structured records, "text" for local development
+    LOG_FORMAT: str = "json"
+    # Fraction of successful requests whose INFO records are kept; errors are always logged
+    LOG_SUCCESS_SAMPLE_RATE: float = 0.1
+    # Test-time augmentation: below this top-class probability, average over the
+    # flipped/rotated views (the training chain's flips and 90-degree rotations)
+    TTA_ENABLED: bool = False
+    TTA_CONFIDENCE_THRESHOLD: float = 0.7
+    TTA_VIEWS: List[str] = ["hflip", "vflip", "rot90", "rot270"]
+    # Two-stage cascade: the student checkpoint answers first and predictions below the
+    # confidence threshold escalate to the full model, batched across concurrent requests
+    # (ml_training/cascade_thresholds.py picks a threshold from the test split)
+    CASCADE_ENABLED: bool = False
+    CASCADE_CONFIDENCE_THRESHOLD: float = 0.9
+    CASCADE_MAX_BATCH: int = 8
+    CASCADE_BATCH_WAIT_MS: float = 10.0
+    # Pre-inference quality gate: "off", "flag" (report issues in the response) or
+    # "reject" (HTTP 422 before the forward pass). Metrics are measured with the longest
+    # side downscaled to QUALITY_ANALYSIS_SIZE
+    QUALITY_GATE_MODE: str = "flag"
+    QUALITY_ANALYSIS_SIZE: int = 256
+    QUALITY_MIN_BLUR_VARIANCE: float = 50.0
+    QUALITY_MIN_BRIGHTNESS: float = 40.0
+    QUALITY_MAX_BRIGHTNESS: float = 220.0
+    QUALITY_MAX_CLIPPED_FRACTION: float = 0.5
+    QUALITY_MIN_GREEN_RATIO: float = 0.05
+    # Fast decode: JPEGs are decoded at reduced scale so the longest side is about this
+    # many pixels (0 keeps full resolution); the leaf ROI crop then runs on that copy
+    DECODE_MAX_SIDE: int = 0
+    LEAF_ROI_ENABLED: bool = False
+    LEAF_ROI_MARGIN: float = 0.1
+    LEAF_ROI_MIN_AREA: float = 0.02
+    # Embedding-distance OOD scoring, enabled when the reference file for the plant exists
+    POTATO_OOD_REFERENCE_PATH: str = "ml_training/models/potato/potato_ood_reference.npz"
+    TOMATO_OOD_REFERENCE_PATH: str = "ml_training/models/tomato/tomato_ood_reference.npz"
+    # Tiled inference (/predict/tiled) for high-resolution multi-leaf photos: tile size in
+    # source pixels and overlap fraction; tiles grow until at most TILE_MAX_COUNT are cut
+    TILE_SIZE: int = 512
+    TILE_OVERLAP: float = 0.25
+    TILE_MAX_COUNT: int = 16
+    TILE_BATCH_SIZE: int = 8
+    TILE_DISEASE_THRESHOLD: float = 0.5
+    # Tiles with less leaf-coloured area than this are background and excluded from the verdict
+    TILE_MIN_LEAF_RATIO: float = 0.1
+    # Similar-case retrieval: per-plant embedding index directories (built offline by
+    # build_similarity_index.py); IVF lists probed per query and images per /similar call
+    POTATO_SIMILARITY_INDEX_PATH: str = "ml_training/models/potato/similarity_index"
+    TOMATO_SIMILARITY_INDEX_PATH: str = "ml_training/models/tomato/similarity_index"
+    SIMILARITY_NPROBE: int = 16
+    SIMILARITY_MAX_BATCH: int = 32
+    # Append every full-model /predict embedding to the index as an unverified case
+    SIMILARITY_APPEND_PREDICTIONS: bool = False
+    # Few-shot onboarded crops: <PROTOTYPE_DIR>/<plant>_prototypes.npz written by onboard_crop.py;
+    # /model/switch accepts any plant with a prototype file
+    PROTOTYPE_DIR: str = "ml_training/models/prototypes"
+    # Admission control for /predict: concurrent inferences, queued requests behind them,
+    # and the deadline applied when the caller sends no X-Request-Timeout-Ms header
+    MAX_IN_FLIGHT: int = 2
+    MAX_QUEUE: int = 16
+    DEFAULT_REQUEST_TIMEOUT_S: float = 30.0
+    # Admin endpoints (/admin/*) are disabled unless a token is configured
+    ADMIN_TOKEN: str = ""
+    PROFILE_MAX_SECONDS: float = 60.0
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     
+    def model_path_for(self, plant: str) -> str:
+        """Checkpoint to serve for ``plant``, preferring the student when enabled"""
+        if self.USE_STUDENT_MODEL:
+            return self.POTATO_STUDENT_MODEL_PATH if plant == 'potato' else self.TOMATO_STUDENT_MODEL_PATH
+        return self.POTATO_MODEL_PATH if plant == 'potato' else self.TOMATO_MODEL_PATH
+
+    def ood_reference_path_for(self, plant: str) -> str:
+        return self.POTATO_OOD_REFERENCE_PATH if plant == 'potato' else self.TOMATO_OOD_REFERENCE_PATH
+
+    def prototype_path_for(self, plant: str) -> str:
+        """Prototype file of an onboarded crop; raises ValueError for names that could escape PROTOTYPE_DIR"""
+        if not PLANT_NAME_PATTERN.fullmatch(plant):
+            raise ValueError(f"Invalid plant name {plant!r}: use lowercase letters, digits, '_' and '-'")
+        directory = os.path.realpath(self.PROTOTYPE_DIR)
+        path = os.path.realpath(os.path.join(directory, f"{plant}_prototypes.npz"))
+        if os.path.commonpath([directory, path]) != directory:
+            raise ValueError(f"Prototype path for {plant!r} resolves outside PROTOTYPE_DIR")
+        return path
+
+    def similarity_index_path_for(self, plant: str) -> str:
+        return self.POTATO_SIMILARITY_INDEX_PATH if plant == 'potato' else self.TOMATO_SIMILARITY_INDEX_PATH
+
+    def cascade_path_for(self, plant: str) -> str:
+        """First-stage checkpoint of the cascade for ``plant``"""
+        return self.POTATO_STUDENT_MODEL_PATH if plant == 'potato' else self.TOMATO_STUDENT_MODEL_PATH
+
     class Config:
         env_file = ".env"
         extra = "ignore"  # Ignore extra fields in .env file
@@ -0,0 +1,124 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+# Correlation ID of the request being handled; set by the middleware in main.py from
+# the backend's X-Request-ID header (or a fresh one when absent)
+request_id_var: ContextVar[Optional[str]] = ContextVar('request_id', default=None)
+# Whether INFO/DEBUG records of the current request are kept (see RequestSamplingFilter)
+request_sampled_var: ContextVar[bool] = ContextVar('request_sampled', default=True)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Accepted incoming IDs; anything else (log injection, oversized values) gets a fresh ID
+REQUEST_ID_PATTERN = re.compile(r'[\w.-]{1,128}', re.ASCII)
+
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+def incoming_request_id(value: Optional[str]) -> str:
+    """The caller's request ID when it is well-formed, otherwise a new one"""
+    return value if value and REQUEST_ID_PATTERN.fullmatch(value) else new_request_id()
+
+def sample_request(rate: float) -> bool:
+    """Decide once per request whether its non-error records are logged"""
+    sampled = rate >= 1.0 or random.random() < rate
+    request_sampled_var.set(sampled)
+    return sampled
+
+class RequestContextFilter(logging.Filter):
+    """Stamps every record with the current request's correlation ID"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class RequestSamplingFilter(logging.Filter):
+    """Drops records below WARNING emitted while handling an unsampled request.
+
+    Warnings and errors are always kept, as is everything logged outside a request.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or request_sampled_var.get()
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra={...}`` keys become top-level fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and key not in payload:
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, default=str)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Keeps records structured: only the message and traceback are rendered before queuing"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def configure_logging(level: str = 'INFO', json_format: bool = True):
+    """Route all records through a queue so formatting and I/O happen off the event loop.
+
+    Filters run in the calling thread (they need the request's context variables);
+    the ``QueueListener`` thread formats and writes to stdout.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if json_format else logging.Formatter(
+        '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(RequestSamplingFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Flush queued records; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
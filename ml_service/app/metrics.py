@@ -0,0 +1,104 @@
+import time
+from contextlib import contextmanager
+
+import torch
+from prometheus_client import Counter, Gauge, Histogram
+
+# Exposed on /metrics by prometheus_fastapi_instrumentator (default registry)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGES = ('upload_read', 'decode', 'quality', 'transform', 'queue_wait', 'cascade_forward', 'forward', 'tta_forward',
+          'tile_forward', 'shadow_forward', 'postprocess', 'similarity_search')
+
+STAGE_LATENCY = Histogram(
+    'plant_predict_stage_seconds',
+    'Time spent in each stage of /predict',
+    ['stage', 'plant', 'model_version'],
+    buckets=STAGE_BUCKETS
+)
+IN_FLIGHT = Gauge(
+    'plant_predict_in_flight_requests',
+    'Prediction requests currently being handled',
+    ['plant', 'model_version']
+)
+BATCH_SIZE = Gauge(
+    'plant_predict_batch_size',
+    'Number of images in the most recent forward pass',
+    ['plant', 'model_version']
+)
+ADMISSION_QUEUE = Gauge(
+    'plant_predict_queued_requests',
+    'Prediction requests waiting for an inference slot'
+)
+REJECTED = Counter(
+    'plant_predict_rejected_total',
+    'Prediction requests shed by admission control',
+    ['reason']
+)
+TTA_APPLIED = Counter(
+    'plant_predict_tta_total',
+    'Predictions below the confidence threshold that ran test-time augmentation',
+    ['plant', 'model_version']
+)
+CASCADE_REQUESTS = Counter(
+    'plant_cascade_requests_total',
+    'Predictions answered by the cascade model (accepted) or escalated to the full model',
+    ['plant', 'outcome']
+)
+CASCADE_SAVED_SECONDS = Counter(
+    'plant_cascade_saved_seconds_total',
+    'Estimated full-model forward time avoided by accepted cascade predictions',
+    ['plant']
+)
+QUALITY_CHECKS = Counter(
+    'plant_quality_gate_total',
+    'Images seen by the quality gate by outcome (passed, flagged, rejected)',
+    ['plant', 'outcome']
+)
+QUALITY_ISSUES = Counter(
+    'plant_quality_issues_total',
+    'Quality gate failures by reason (blurry, underexposed, not_leaf, out_of_distribution, ...)',
+    ['plant', 'reason']
+)
+MODEL_MEMORY = Gauge(
+    'plant_model_memory_bytes',
+    'Bytes held by the loaded model parameters and buffers',
+    ['plant', 'model_version']
+)
+MODEL_RELOADS = Counter(
+    'plant_model_reloads_total',
+    'Model swaps by trigger (startup, switch, watch) and outcome (swapped, failed)',
+    ['plant', 'trigger', 'outcome']
+)
+SHADOW_PREDICTIONS = Counter(
+    'plant_shadow_predictions_total',
+    'Sampled /predict requests re-run on the shadow candidate, by agreement with the served model',
+    ['plant', 'candidate_version', 'outcome']
+)
+SHADOW_DROPPED = Counter(
+    'plant_shadow_dropped_total',
+    'Sampled requests the shadow candidate skipped (queue_full, stale, plant_mismatch, error)',
+    ['plant', 'reason']
+)
+
+def _stage_histogram(stage: str, plant: str, model_version: str):
+    # A fixed stage set keeps dashboards and the label cardinality in step with the code
+    if stage not in STAGES:
+        raise ValueError(f"Unknown /predict stage {stage!r}; add it to STAGES")
+    return STAGE_LATENCY.labels(stage, plant, model_version)
+
+@contextmanager
+def observe_stage(stage: str, plant: str, model_version: str):
+    """Record the wall time of the enclosed block under ``stage``"""
+    histogram = _stage_histogram(stage, plant, model_version)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+def observe_duration(stage: str, plant: str, model_version: str, seconds: float):
+    _stage_histogram(stage, plant, model_version).observe(seconds)
+
+def model_memory_bytes(model: torch.nn.Module) -> int:
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
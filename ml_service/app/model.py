@@ -1,21 +1,117 @@
+import asyncio
+import contextvars
+import math
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import torch
 import torch.nn as nn
 import torchvision.transforms as transforms
 from PIL import Image
 import numpy as np
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import timm
 
+from app.config import settings
+from app.preprocessing import leaf_mask, serving_preprocessing
+from app.prototypes import PrototypeClassifier
+from app.pruning import apply_pruning_spec
+from app.similarity import EmbeddingIndex, open_index
+from app.profiling import profiler
+from app.admission import DeadlineExceeded
+from app.cascade import EscalationBatcher
+from app.metrics import (BATCH_SIZE, CASCADE_REQUESTS, CASCADE_SAVED_SECONDS, MODEL_MEMORY, TTA_APPLIED,
+                         model_memory_bytes, observe_duration, observe_stage)
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_INPUT_SIZE = 224
+
+def build_inference_transform(input_size: int = DEFAULT_INPUT_SIZE):
+    """Deterministic resize/normalize pipeline for a model trained at ``input_size``"""
+    return transforms.Compose([
+        transforms.Resize((input_size, input_size)),
+        transforms.CenterCrop(input_size),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    ])
+
+# Views matching the flips and right-angle rotations of the training augmentation chain
+TTA_TRANSFORMS = {
+    'hflip': lambda x: x.flip(3),
+    'vflip': lambda x: x.flip(2),
+    'rot90': lambda x: torch.rot90(x, 1, dims=(2, 3)),
+    'rot180': lambda x: torch.rot90(x, 2, dims=(2, 3)),
+    'rot270': lambda x: torch.rot90(x, 3, dims=(2, 3)),
+}
+
+def build_tta_views(input_tensor: torch.Tensor, views) -> torch.Tensor:
+    """Stack the augmented views of a ``(1, C, H, W)`` input into one batch"""
+    return torch.cat([TTA_TRANSFORMS[name](input_tensor) for name in views])
+
+def forward_with_embedding(model: nn.Module, input_tensor: torch.Tensor):
+    """Logits plus the pooled pre-classifier embedding from a single timm forward pass"""
+    embedding = model.forward_head(model.forward_features(input_tensor), pre_logits=True)
+    return model.get_classifier()(embedding), embedding
+
+def tile_grid(height: int, width: int, tile_size: int, overlap: float, max_tiles: int):
+    """Overlapping ``(x0, y0, x1, y1)`` tiles covering the image, row-major, plus ``(rows, cols)``
+
+    The tile size grows until the grid has at most ``max_tiles`` tiles, so the cost of
+    a tiled prediction is bounded regardless of the upload resolution.
+    """
+    def axis(length, size, stride):
+        if length <= size:
+            return [(0, length)]
+        count = math.ceil((length - size) / stride) + 1
+        # Spread the tiles evenly so the last one ends exactly at the border
+        starts = [round(i * (length - size) / (count - 1)) for i in range(count)]
+        return [(s, s + size) for s in starts]
+
+    size = max(1, tile_size)
+    while True:
+        stride = max(1, int(size * (1.0 - overlap)))
+        ys, xs = axis(height, size, stride), axis(width, size, stride)
+        if len(ys) * len(xs) <= max(1, max_tiles) or size >= max(height, width):
+            break
+        size = int(size * 1.25) + 1
+    boxes = [(x0, y0, x1, y1) for y0, y1 in ys for x0, x1 in xs]
+    return boxes, len(ys), len(xs)
+
 class PlantDiseaseModel:
     def __init__(self):
         self.model = None
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.current_plant: str = 'potato'
         self.model_val_accuracy: Optional[float] = None
+        # Architecture and input size come from the checkpoint when it records them,
+        # so distilled students (e.g. mobilenetv3_small_100 at 160px) load unchanged
+        self.architecture: str = settings.MODEL_ARCHITECTURE
+        self.input_size: int = DEFAULT_INPUT_SIZE
+        self.model_version: str = settings.MODEL_VERSION
+        # Checkpoint the network was loaded from (None when serving the pretrained fallback)
+        self.model_path: Optional[str] = None
+        # Forward passes run on one dedicated thread: requests queue there instead of
+        # blocking the event loop, and the wait is reported as the queue_wait stage
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+        # Optional first stage of a cascade (see load_cascade_model): a cheap model whose
+        # confident answers are returned directly; the rest escalate to self.model in batches
+        self.cascade_model: Optional[nn.Module] = None
+        self.cascade_transform = None
+        self._escalation = EscalationBatcher(self._run_escalation, settings.CASCADE_MAX_BATCH,
+                                             settings.CASCADE_BATCH_WAIT_MS / 1000.0)
+        # Running per-image full-model forward time, used to report the latency the cascade saves
+        self._full_forward_s = 0.0
+        # Optional out-of-distribution reference (see load_ood_reference): L2-normalised class
+        # centroids of training embeddings and the cosine distance beyond which inputs are OOD
+        self.ood_centroids: Optional[torch.Tensor] = None
+        self.ood_threshold: Optional[float] = None
+        # Past cases searched by /similar (see app/similarity.py and build_similarity_index.py)
+        self.similarity_index: Optional[EmbeddingIndex] = None
+        # Crops onboarded from a few labelled images (onboard_crop.py) are classified by
+        # nearest prototype over an existing backbone's embeddings until a head is trained
+        self.prototypes: Optional[PrototypeClassifier] = None
 
         # Default to potato classes
         self.class_names = ['diseased_potato', 'healthy_potato']
@@ -46,36 +142,40 @@ class PlantDiseaseModel:
         self.disease_mapping = dict(self._potato_disease_mapping)
 
         # Define transforms for inference
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.CenterCrop(224),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
+        self.transform = build_inference_transform(self.input_size)
 
     async def load_model(self, model_path: str):
         """Load the trained model"""
+        self.prototypes = None
+        self.model_path = None
         try:
             if not os.path.exists(model_path):
                 logger.warning(f"Model file not found at {model_path}, using pretrained model")
                 # Create a pretrained model for demo purposes
-                self.model = timm.create_model('efficientnet_b0', pretrained=True, num_classes=len(self.class_names))
+                self.architecture = settings.MODEL_ARCHITECTURE
+                self.model = timm.create_model(self.architecture, pretrained=True, num_classes=len(self.class_names))
                 self.model_val_accuracy = None
+                self.input_size = DEFAULT_INPUT_SIZE
+                self.model_version = settings.MODEL_VERSION
             else:
                 # Load the actual trained model
                 checkpoint = torch.load(model_path, map_location=self.device)
-                self.model = timm.create_model('efficientnet_b0', pretrained=False, num_classes=len(self.class_names))
-                state_dict = checkpoint.get('model_state_dict', checkpoint)
-                self.model.load_state_dict(state_dict)
+                self.model, self.architecture, self.input_size = self._network_from_checkpoint(checkpoint)
                 # Attempt to load metadata
                 class_names_from_ckpt = checkpoint.get('class_names')
                 if isinstance(class_names_from_ckpt, (list, tuple)) and len(class_names_from_ckpt) == len(self.class_names):
                     self.class_names = list(class_names_from_ckpt)
                 self.model_val_accuracy = float(checkpoint.get('val_acc')) if 'val_acc' in checkpoint else None
-                logger.info(f"Loaded trained {self.current_plant} model from {model_path}")
+                self.model_version = str(checkpoint.get('model_version', settings.MODEL_VERSION))
+                self.model_path = model_path
+                logger.info(f"Loaded trained {self.current_plant} {self.architecture} model from {model_path}")
             
+            self.transform = build_inference_transform(self.input_size)
             self.model.to(self.device)
             self.model.eval()
+            MODEL_MEMORY.labels(self.current_plant, self.model_version).set(model_memory_bytes(self.model))
+            self.load_ood_reference(settings.ood_reference_path_for(self.current_plant))
+            self.load_similarity_index(settings.similarity_index_path_for(self.current_plant))
             logger.info(f"Model loaded successfully on {self.device}")
             logger.info(f"Model classes: {self.class_names}")
             if self.model_val_accuracy is not None:
@@ -84,15 +184,186 @@ class PlantDiseaseModel:
         except Exception as e:
             logger.error(f"Error loading model: {e}")
             # Fallback to pretrained model
-            self.model = timm.create_model('efficientnet_b0', pretrained=True, num_classes=len(self.class_names))
+            self.architecture = settings.MODEL_ARCHITECTURE
+            self.input_size = DEFAULT_INPUT_SIZE
+            self.model_version = settings.MODEL_VERSION
+            self.transform = build_inference_transform(self.input_size)
+            self.model = timm.create_model(self.architecture, pretrained=True, num_classes=len(self.class_names))
             self.model.to(self.device)
             self.model.eval()
 
+    async def self_test(self, runs: int = 1):
+        """Warm up a freshly loaded model and check it yields a probability distribution over its classes
+
+        Runs the networks ``predict`` uses ``runs`` times on synthetic leaf-coloured, dark
+        and noise images and raises ``ValueError`` on missing, non-finite or unnormalised
+        probabilities. It bypasses ``predict`` so warm-up never shows up in the metrics.
+        """
+        rng = np.random.default_rng(0)
+        probes = [np.full((256, 256, 3), (60, 140, 50), np.uint8), np.zeros((256, 256, 3), np.uint8),
+                  rng.integers(0, 256, (256, 256, 3), dtype=np.uint8)]
+        loop = asyncio.get_running_loop()
+        for _ in range(max(runs, 1)):
+            for probe in probes:
+                probabilities = (await loop.run_in_executor(self._executor, self._self_test_pass, probe))[0]
+                probabilities = probabilities.numpy().astype(np.float64)
+                if len(probabilities) != len(self.class_names) or not np.isfinite(probabilities).all():
+                    raise ValueError(f"Self-test produced invalid probabilities {probabilities.tolist()}")
+                if abs(probabilities.sum() - 1.0) > 1e-3:
+                    raise ValueError(f"Self-test probabilities sum to {probabilities.sum():.4f}")
+
+    def _self_test_pass(self, image: np.ndarray) -> torch.Tensor:
+        """Class probabilities of one image through the cascade and full model, on the inference thread"""
+        image = Image.fromarray(image)
+        with torch.no_grad():
+            if self.cascade_model is not None:
+                self.cascade_model(self.cascade_transform(image).unsqueeze(0).to(self.device))
+            input_tensor = self.transform(image).unsqueeze(0).to(self.device)
+            if self.prototypes is not None:
+                probabilities = self.prototypes.probabilities(forward_with_embedding(self.model, input_tensor)[1])
+            else:
+                probabilities = torch.softmax(self.model(input_tensor), dim=1)
+            return self._align_probabilities(probabilities).cpu()
+
+    def close(self):
+        """Stop the inference thread and drop the networks; only once no request uses this instance"""
+        self._executor.shutdown(wait=True)
+        self.model = None
+        self.cascade_model = None
+        self.prototypes = None
+        self.ood_centroids = None
+        self.similarity_index = None
+        if self.device.type == 'cuda':
+            torch.cuda.empty_cache()
+
+    def _network_from_checkpoint(self, checkpoint: Dict[str, Any], num_classes: Optional[int] = None):
+        """Rebuild the network a checkpoint was saved from; returns ``(network, architecture, input_size)``"""
+        # train.py records 'model_name', train_tomato.py records 'model_architecture'
+        architecture = checkpoint.get('model_name') or checkpoint.get('model_architecture') or settings.MODEL_ARCHITECTURE
+        input_size = int(checkpoint.get('input_size', DEFAULT_INPUT_SIZE))
+        network = timm.create_model(architecture, pretrained=False, num_classes=num_classes or len(self.class_names))
+        if checkpoint.get('pruning'):
+            # Structurally pruned checkpoints (ml_training/prune.py) have narrower blocks
+            apply_pruning_spec(network, checkpoint['pruning'])
+        network.load_state_dict(checkpoint.get('model_state_dict', checkpoint))
+        return network, architecture, input_size
+
+    def load_backbone(self, model_path: str):
+        """Network of any trained checkpoint, with its own head, for use as an embedding backbone"""
+        checkpoint = torch.load(model_path, map_location=self.device)
+        num_classes = len(checkpoint.get('class_names') or self._potato_class_names)
+        network, architecture, input_size = self._network_from_checkpoint(checkpoint, num_classes)
+        version = str(checkpoint.get('model_version', settings.MODEL_VERSION))
+        return network.to(self.device).eval(), architecture, input_size, version
+
+    async def load_prototype_crop(self, plant: str, path: str):
+        """Serve ``plant`` by nearest-prototype classification over the recorded backbone"""
+        prototypes = PrototypeClassifier.load(path)
+        self.model, self.architecture, self.input_size, self.model_version = self.load_backbone(
+            prototypes.backbone_checkpoint)
+        if self.model.get_classifier().in_features != prototypes.prototypes.shape[1]:
+            raise ValueError(f"Prototypes in {path} do not match the embeddings of {prototypes.backbone_checkpoint}")
+        self.prototypes = prototypes
+        self.current_plant = plant
+        self.class_names = list(prototypes.class_names)
+        self.plant_mapping = {name: plant for name in self.class_names}
+        self.disease_mapping = {name: None if name.startswith('healthy_') else name.replace(f'_{plant}', '')
+                                for name in self.class_names}
+        self.model_val_accuracy = prototypes.metadata.get('holdout_accuracy')
+        self.transform = build_inference_transform(self.input_size)
+        # Plant-specific extras are trained against the potato/tomato heads; none apply here
+        self.cascade_model = None
+        self.ood_centroids = None
+        self.ood_threshold = None
+        self.similarity_index = None
+        MODEL_MEMORY.labels(self.current_plant, self.model_version).set(model_memory_bytes(self.model))
+        logger.info(f"Serving {plant} from {len(self.class_names)} prototypes over {self.architecture} "
+                    f"({prototypes.backbone_checkpoint})")
+
+    def load_ood_reference(self, path: str):
+        """Load class centroids written by ml_training/ood_reference.py; OOD scoring stays off without them"""
+        self.ood_centroids = None
+        self.ood_threshold = None
+        if not path or not os.path.exists(path):
+            return
+        try:
+            reference = np.load(path)
+            centroids = torch.nn.functional.normalize(torch.from_numpy(reference['centroids']).float(), dim=1)
+            num_features = self.model.get_classifier().in_features
+            if centroids.shape[1] != num_features:
+                raise ValueError(f"centroids have {centroids.shape[1]} features, model embeddings {num_features}")
+            self.ood_centroids = centroids.to(self.device)
+            self.ood_threshold = float(reference['threshold'])
+            logger.info(f"Loaded OOD reference ({centroids.shape[0]} centroids) from {path}")
+        except Exception as e:
+            logger.error(f"Error loading OOD reference, OOD scoring disabled: {e}")
+
+    def load_similarity_index(self, path: str):
+        self.similarity_index = open_index(path)
+        if self.similarity_index is not None:
+            index_version = self.similarity_index.meta.get('model_version')
+            if self.similarity_index.dim != self.model.get_classifier().in_features:
+                logger.error(f"Similarity index dimension {self.similarity_index.dim} does not match the model")
+                self.similarity_index = None
+            elif index_version and index_version != self.model_version:
+                logger.warning(f"Similarity index was built with model {index_version}, serving {self.model_version}")
+            index_preprocessing = self.similarity_index.meta.get('preprocessing')
+            if index_preprocessing != serving_preprocessing():
+                logger.warning(f"Similarity index was built with preprocessing {index_preprocessing}, "
+                               f"serving {serving_preprocessing()}; rebuild it with build_similarity_index.py")
+
+    async def embed(self, images: List[np.ndarray], deadline: Optional[float] = None) -> np.ndarray:
+        """Pooled pre-classifier embeddings of ``images`` from one batched forward pass"""
+        labels = (self.current_plant, self.model_version)
+        with observe_stage('transform', *labels):
+            batch = torch.stack([self.transform(Image.fromarray(image)) for image in images]).to(self.device)
+        _, embedding = await self._run_forward(batch, labels, deadline, embed=True)
+        return embedding.cpu().numpy()
+
+    def _classify(self, images: List[np.ndarray]) -> torch.Tensor:
+        batch = torch.stack([self.transform(Image.fromarray(image)) for image in images]).to(self.device)
+        with torch.no_grad():
+            return self._align_probabilities(torch.softmax(self.model(batch), dim=1)).cpu()
+
+    async def classify_batch(self, images: List[np.ndarray], stage: str = 'forward') -> torch.Tensor:
+        """Class probabilities of ``images``; transform and forward both run on the inference thread"""
+        started = time.perf_counter()
+        probabilities = await asyncio.get_running_loop().run_in_executor(self._executor, self._classify, images)
+        observe_duration(stage, self.current_plant, self.model_version, time.perf_counter() - started)
+        return probabilities
+
+    def ood_score(self, embedding: torch.Tensor) -> float:
+        """Cosine distance from ``embedding`` to the nearest training class centroid"""
+        embedding = torch.nn.functional.normalize(embedding.float(), dim=1)
+        return float(1.0 - (embedding @ self.ood_centroids.T).max().item())
+
+    async def load_cascade_model(self, model_path: str):
+        """Load the cheap first-stage model of the cascade; the cascade stays off if it cannot be loaded"""
+        self.cascade_model = None
+        if not os.path.exists(model_path):
+            logger.warning(f"Cascade model not found at {model_path}, serving the full model only")
+            return
+        try:
+            checkpoint = torch.load(model_path, map_location=self.device)
+            class_names = checkpoint.get('class_names')
+            if class_names is not None and list(class_names) != list(self.class_names):
+                raise ValueError(f"class order {list(class_names)} differs from the full model's {self.class_names}")
+            network, architecture, input_size = self._network_from_checkpoint(checkpoint)
+            self.cascade_model = network.to(self.device).eval()
+            self.cascade_transform = build_inference_transform(input_size)
+            logger.info(f"Loaded cascade {architecture} model ({input_size}px) from {model_path}")
+        except Exception as e:
+            logger.error(f"Error loading cascade model, serving the full model only: {e}")
+
     async def switch_plant(self, plant: str, model_path: Optional[str] = None):
         """Switch the active plant model and class mappings."""
         plant_norm = plant.lower().strip()
         if plant_norm not in ("potato", "tomato"):
-            raise ValueError("Unsupported plant. Use 'potato' or 'tomato'.")
+            prototype_path = settings.prototype_path_for(plant_norm)
+            if not os.path.exists(prototype_path):
+                raise ValueError("Unsupported plant. Use 'potato', 'tomato' or an onboarded crop.")
+            await self.load_prototype_crop(plant_norm, prototype_path)
+            return
 
         self.current_plant = plant_norm
 
@@ -108,62 +379,226 @@ class PlantDiseaseModel:
         # Reload model with appropriate number of classes
         if model_path:
             await self.load_model(model_path)
+            if settings.CASCADE_ENABLED:
+                await self.load_cascade_model(settings.cascade_path_for(plant_norm))
         else:
             # If no path provided, keep current weights but rebuild head to match classes
+            self.cascade_model = None
             try:
-                self.model = timm.create_model('efficientnet_b0', pretrained=True, num_classes=len(self.class_names))
+                self.model = timm.create_model(self.architecture, pretrained=True, num_classes=len(self.class_names))
                 self.model.to(self.device)
                 self.model.eval()
             except Exception:
                 # Last resort: keep current model but warn about class mismatch
                 logger.warning("Switched plant without loading weights; using generic pretrained head.")
 
-    async def predict(self, image: np.ndarray) -> Dict[str, Any]:
-        """Make prediction on the input image"""
+    def _forward(self, model: nn.Module, input_tensor: torch.Tensor, submitted: float, labels: tuple,
+                 deadline: Optional[float] = None, stage: str = 'forward', embed: bool = False,
+                 follow_up: bool = False):
+        """Runs on the inference thread; records queue wait and forward time.
+
+        With ``embed`` returns ``(outputs, embedding)`` from the same pass. A ``follow_up``
+        pass (e.g. TTA views of an answered request) only records its own stage time.
+        """
+        started = time.perf_counter()
+        if not follow_up:
+            observe_duration('queue_wait', *labels, started - submitted)
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceeded("Deadline passed before the forward pass")
+        if not follow_up:
+            BATCH_SIZE.labels(*labels).set(input_tensor.shape[0])
+        with torch.no_grad(), profiler.forward_context():
+            outputs = forward_with_embedding(model, input_tensor) if embed else model(input_tensor)
+        observe_duration(stage, *labels, time.perf_counter() - started)
+        return outputs
+
+    async def _run_forward(self, input_tensor: torch.Tensor, labels: tuple, deadline: Optional[float],
+                           stage: str = 'forward', model: Optional[nn.Module] = None, embed: bool = False,
+                           follow_up: bool = False):
+        # Copy the request context so records from the inference thread keep the correlation ID
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, context.run, self._forward, model or self.model, input_tensor, time.perf_counter(),
+            labels, deadline, stage, embed, follow_up
+        )
+
+    async def _run_escalation(self, batch: torch.Tensor) -> torch.Tensor:
+        """Full-model pass over a batch of escalated inputs (called by the EscalationBatcher)"""
+        started = time.perf_counter()
+        outputs = await self._run_forward(batch, (self.current_plant, self.model_version), None)
+        per_image = (time.perf_counter() - started) / batch.shape[0]
+        self._full_forward_s = per_image if not self._full_forward_s else 0.8 * self._full_forward_s + 0.2 * per_image
+        return outputs
+
+    async def _cascade_first_stage(self, cascade_tensor: torch.Tensor, labels: tuple, deadline: Optional[float]):
+        """Probabilities from the cascade model, or ``None`` when the input must escalate"""
+        started = time.perf_counter()
+        outputs = await self._run_forward(cascade_tensor, labels, deadline, stage='cascade_forward',
+                                          model=self.cascade_model)
+        probabilities = torch.softmax(outputs, dim=1)
+        if probabilities.max().item() >= settings.CASCADE_CONFIDENCE_THRESHOLD:
+            CASCADE_REQUESTS.labels(self.current_plant, 'accepted').inc()
+            saved = self._full_forward_s - (time.perf_counter() - started)
+            if saved > 0:
+                CASCADE_SAVED_SECONDS.labels(self.current_plant).inc(saved)
+            return probabilities
+        CASCADE_REQUESTS.labels(self.current_plant, 'escalated').inc()
+        return None
+
+    def _align_probabilities(self, probabilities: torch.Tensor) -> torch.Tensor:
+        """Optional inversion safeguard for tomato checkpoints with flipped label heads"""
+        if (self.current_plant == 'tomato' and getattr(settings, 'TOMATO_INVERT_OUTPUT', False)
+                and probabilities.shape[1] == 2):
+            return probabilities[:, [1, 0]]
+        return probabilities
+
+    async def predict_tiled(self, image: np.ndarray, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Classify overlapping tiles of a large image and aggregate them into a heatmap and verdict
+
+        Tiles are ``TILE_SIZE`` source pixels with ``TILE_OVERLAP`` overlap, enlarged as
+        needed so at most ``TILE_MAX_COUNT`` are cut, and run ``TILE_BATCH_SIZE`` at a time.
+        Tiles with too little leaf-coloured area are left out of the verdict (``None`` in
+        the heatmap). The image is diseased when any leaf tile's disease probability
+        reaches ``TILE_DISEASE_THRESHOLD``, since a lesion on one leaf is enough.
+        """
+        labels = (self.current_plant, self.model_version)
+        healthy_idx = [i for i, name in enumerate(self.class_names) if name.startswith('healthy_')]
+        with observe_stage('transform', *labels):
+            height, width = image.shape[:2]
+            boxes, rows, cols = tile_grid(height, width, settings.TILE_SIZE, settings.TILE_OVERLAP,
+                                          settings.TILE_MAX_COUNT)
+            leaf = leaf_mask(image[::4, ::4])
+            leaf_ratios = [float(leaf[y0 // 4:max(y1 // 4, y0 // 4 + 1), x0 // 4:max(x1 // 4, x0 // 4 + 1)].mean())
+                           for x0, y0, x1, y1 in boxes]
+            tiles = torch.stack([self.transform(Image.fromarray(image[y0:y1, x0:x1])) for x0, y0, x1, y1 in boxes])
+        
+        outputs = []
+        for start in range(0, len(boxes), settings.TILE_BATCH_SIZE):
+            batch = tiles[start:start + settings.TILE_BATCH_SIZE].to(self.device)
+            if self.prototypes is not None:
+                _, embedding = await self._run_forward(batch, labels, deadline, stage='tile_forward', embed=True)
+                outputs.append(self.prototypes.probabilities(embedding))
+            else:
+                logits = await self._run_forward(batch, labels, deadline, stage='tile_forward')
+                outputs.append(torch.softmax(logits, dim=1))
+        
+        with observe_stage('postprocess', *labels):
+            probabilities = self._align_probabilities(torch.cat(outputs))
+            disease = (1.0 - probabilities[:, healthy_idx].sum(1)).tolist()
+            is_leaf = [ratio >= settings.TILE_MIN_LEAF_RATIO for ratio in leaf_ratios]
+            # Fall back to every tile when none looks like leaf (e.g. unusual lighting)
+            scored = [d for d, keep in zip(disease, is_leaf) if keep] or disease
+            heatmap = [[disease[r * cols + c] if is_leaf[r * cols + c] or not any(is_leaf) else None
+                        for c in range(cols)] for r in range(rows)]
+            worst = max(scored)
+            diseased = worst >= settings.TILE_DISEASE_THRESHOLD
+            mean_probabilities = probabilities[[i for i, keep in enumerate(is_leaf) if keep] or slice(None)].mean(0)
+            predicted_idx = int(mean_probabilities.argmax())
+            if diseased and self.class_names[predicted_idx].startswith('healthy_'):
+                # Report the most likely disease class of the worst tile
+                worst_tile = probabilities[disease.index(worst)].clone()
+                worst_tile[healthy_idx] = 0.0
+                predicted_idx = int(worst_tile.argmax())
+            predicted_class = self.class_names[predicted_idx]
+            return {
+                'prediction': 'diseased' if diseased else 'healthy',
+                'confidence': worst if diseased else 1.0 - worst,
+                'class_idx': predicted_idx,
+                'predicted_class': predicted_class,
+                'plant_type': self.plant_mapping.get(predicted_class, 'unknown'),
+                'disease_type': self.disease_mapping.get(predicted_class, None),
+                'heatmap': heatmap,
+                'grid': {'rows': rows, 'cols': cols, 'boxes': boxes},
+                'diseased_fraction': sum(d >= settings.TILE_DISEASE_THRESHOLD for d in scored) / len(scored),
+            }
+
+    def postprocess(self, probabilities: torch.Tensor) -> Dict[str, Any]:
+        """Prediction fields for one image's ``(1, C)`` class probabilities (output alignment included)"""
+        probabilities = self._align_probabilities(probabilities)
+        confidence, predicted_idx = torch.max(probabilities, 1)
+        predicted_class = self.class_names[predicted_idx.item()]
+        return {
+            'prediction': 'healthy' if predicted_class.startswith('healthy_') else 'diseased',
+            'confidence': confidence.item(),
+            'class_idx': predicted_idx.item(),
+            'predicted_class': predicted_class,
+            'plant_type': self.plant_mapping.get(predicted_class, 'unknown'),
+            'disease_type': self.disease_mapping.get(predicted_class, None),
+            'all_probabilities': probabilities.cpu().numpy()[0].tolist(),
+        }
+
+    async def predict(self, image: np.ndarray, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Make prediction on the input image, skipping the forward pass once ``deadline`` has passed"""
         try:
-            # Convert numpy array to PIL Image
+            labels = (self.current_plant, self.model_version)
+            # One 'transform' observation per request: the PIL conversion plus the transform
+            # of each model the request reaches (the full model's only on escalation)
+            transform_started = time.perf_counter()
             if isinstance(image, np.ndarray):
                 image = Image.fromarray(image)
             
-            # Apply transforms
-            input_tensor = self.transform(image).unsqueeze(0).to(self.device)
+            ood_score = None
+            embedding = None
             
-            # Make prediction
-            with torch.no_grad():
-                outputs = self.model(input_tensor)
-                probabilities = torch.softmax(outputs, dim=1)
-
-                # Optional inversion safeguard for tomato checkpoints with flipped label heads
-                if self.current_plant == 'tomato':
-                    try:
-                        from app.config import settings
-                        if getattr(settings, 'TOMATO_INVERT_OUTPUT', False) and probabilities.shape[1] == 2:
-                            probabilities = probabilities[:, [1, 0]]
-                    except Exception:
-                        pass
-                confidence, predicted_idx = torch.max(probabilities, 1)
-                
-                predicted_class = self.class_names[predicted_idx.item()]
-                confidence_score = confidence.item()
-                
-                # Determine if healthy or diseased
-                is_healthy = predicted_class.startswith('healthy_')
-                prediction = 'healthy' if is_healthy else 'diseased'
-                
-                # Get plant type and disease type
-                plant_type = self.plant_mapping.get(predicted_class, 'unknown')
-                disease_type = self.disease_mapping.get(predicted_class, None)
+            # Cascade: confident answers from the cheap model skip the full model entirely
+            probabilities = None
+            served_by = 'full'
+            transform_s = 0.0
+            if self.cascade_model is not None:
+                cascade_tensor = self.cascade_transform(image).unsqueeze(0).to(self.device)
+                transform_s = time.perf_counter() - transform_started
+                probabilities = await self._cascade_first_stage(cascade_tensor, labels, deadline)
+                served_by = 'cascade' if probabilities is not None else 'escalated'
+                transform_started = time.perf_counter()
+            
+            if probabilities is not None:
+                observe_duration('transform', *labels, transform_s)
+            else:
+                input_tensor = self.transform(image).unsqueeze(0).to(self.device)
+                observe_duration('transform', *labels, transform_s + time.perf_counter() - transform_started)
                 
-                return {
-                    'prediction': prediction,
-                    'confidence': confidence_score,
-                    'class_idx': predicted_idx.item(),
-                    'predicted_class': predicted_class,
-                    'plant_type': plant_type,
-                    'disease_type': disease_type,
-                    'all_probabilities': probabilities.cpu().numpy()[0].tolist()
-                }
+                # Make prediction; escalations are coalesced into batches across requests
+                if served_by == 'escalated':
+                    outputs = await self._escalation.submit(input_tensor, deadline)
+                elif self.ood_centroids is not None or self.similarity_index is not None or self.prototypes is not None:
+                    # The embedding comes from the same pass; it scores OOD, feeds the similarity
+                    # index and classifies onboarded crops
+                    outputs, embedding = await self._run_forward(input_tensor, labels, deadline, embed=True)
+                    if self.ood_centroids is not None:
+                        ood_score = self.ood_score(embedding)
+                else:
+                    outputs = await self._run_forward(input_tensor, labels, deadline)
+                if self.prototypes is not None:
+                    probabilities = self.prototypes.probabilities(embedding)
+                    served_by = 'prototypes'
+                else:
+                    probabilities = torch.softmax(outputs, dim=1)
+            
+            # Low-confidence predictions get one extra batched pass over flipped/rotated views,
+            # only while the deadline allows: TTA must never turn a computed answer into a 504
+            tta_applied = False
+            if (served_by in ('full', 'escalated') and settings.TTA_ENABLED and settings.TTA_VIEWS
+                    and probabilities.max().item() < settings.TTA_CONFIDENCE_THRESHOLD
+                    and (deadline is None or time.monotonic() < deadline)):
+                views = build_tta_views(input_tensor, settings.TTA_VIEWS)
+                view_outputs = await self._run_forward(views, labels, None, stage='tta_forward', follow_up=True)
+                probabilities = torch.cat([probabilities, torch.softmax(view_outputs, dim=1)]).mean(0, keepdim=True)
+                TTA_APPLIED.labels(*labels).inc()
+                tta_applied = True
+            
+            with observe_stage('postprocess', *labels):
+                result = self.postprocess(probabilities)
+                result.update({
+                    'tta': tta_applied,
+                    'served_by': served_by,
+                    'ood_score': ood_score,
+                    'ood': ood_score is not None and ood_score > self.ood_threshold,
+                    'embedding': embedding.cpu().numpy()[0] if embedding is not None else None
+                })
+                return result
                 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"Prediction error: {e}")
             raise
@@ -1,16 +1,29 @@
+import cv2
 import numpy as np
 from PIL import Image, ImageOps
 import io
 import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
-def preprocess_image(image_data: bytes) -> np.ndarray:
+# OpenCV hue (0-180) band counted as leaf tissue: green through yellowing chlorosis
+LEAF_HUE_RANGE = (20, 90)
+# Minimum saturation/value for a pixel to count towards the green ratio
+LEAF_MIN_SATURATION = 40
+LEAF_MIN_VALUE = 40
+
+def preprocess_image(image_data: bytes, max_side: Optional[int] = None, leaf_roi: bool = False) -> np.ndarray:
     """
     Preprocess uploaded image for model inference
     
     Args:
         image_data: Raw image bytes
+        max_side: Decode at reduced resolution so the longest side is about this many
+            pixels (JPEG DCT scaling, then integer reduction); None keeps full resolution
+        leaf_roi: Crop to the detected leaf (see ``leaf_bounding_box``) after decoding
         
     Returns:
         Preprocessed image as numpy array
@@ -18,22 +31,89 @@ def preprocess_image(image_data: bytes) -> np.ndarray:
     try:
         # Convert bytes to PIL Image
         image = Image.open(io.BytesIO(image_data))
+        if max_side:
+            # JPEG decoders can downscale by 1/2, 1/4 or 1/8 while decoding
+            image.draft('RGB', (max_side, max_side))
 
         # Normalize EXIF orientation and convert to RGB
         image = ImageOps.exif_transpose(image)
         if image.mode != 'RGB':
             image = image.convert('RGB')
+        if max_side:
+            factor = max(image.size) // max_side
+            if factor > 1:
+                image = image.reduce(factor)
 
         # Do not resize here; model's transform handles resize/normalize deterministically
         image_array = np.array(image)
+        if leaf_roi:
+            box = leaf_bounding_box(image_array, margin=settings.LEAF_ROI_MARGIN,
+                                    min_area=settings.LEAF_ROI_MIN_AREA)
+            if box is not None:
+                x0, y0, x1, y1 = box
+                image_array = image_array[y0:y1, x0:x1]
 
-        logger.info(f"Image preprocessed: {image_array.shape}")
+        logger.debug("Image preprocessed", extra={'shape': image_array.shape})
         return image_array
         
     except Exception as e:
         logger.error(f"Image preprocessing error: {e}")
         raise ValueError(f"Failed to preprocess image: {e}")
 
+def serving_preprocessing() -> Dict[str, Any]:
+    """The decode settings /predict and /similar apply, recorded with indexes built from them"""
+    recorded: Dict[str, Any] = {'decode_max_side': settings.DECODE_MAX_SIDE or None,
+                                'leaf_roi': settings.LEAF_ROI_ENABLED}
+    if settings.LEAF_ROI_ENABLED:
+        recorded.update(leaf_roi_margin=settings.LEAF_ROI_MARGIN, leaf_roi_min_area=settings.LEAF_ROI_MIN_AREA)
+    return recorded
+
+def leaf_mask(image: np.ndarray) -> np.ndarray:
+    """Boolean mask of leaf-coloured pixels of an RGB image"""
+    hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    return ((hue >= LEAF_HUE_RANGE[0]) & (hue <= LEAF_HUE_RANGE[1])
+            & (saturation >= LEAF_MIN_SATURATION) & (value >= LEAF_MIN_VALUE))
+
+def leaf_bounding_box(image: np.ndarray, analysis_size: int = 128, margin: float = 0.1,
+                      min_area: float = 0.02) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Square-ish box around the largest leaf-coloured region, found by colour segmentation
+    
+    Args:
+        image: RGB uint8 array
+        analysis_size: Longest side of the copy the mask is computed on
+        margin: Fraction of the box size added on every side
+        min_area: Smallest region (fraction of the frame) treated as a leaf
+        
+    Returns:
+        ``(x0, y0, x1, y1)`` in ``image`` pixels, or None when no leaf region is found
+        or the box would cover nearly the whole frame anyway
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, analysis_size / max(height, width))
+    small = image if scale == 1.0 else cv2.resize(
+        image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    mask = leaf_mask(small).astype(np.uint8)
+    kernel = np.ones((3, 3), np.uint8)
+    mask = cv2.morphologyEx(cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel), cv2.MORPH_CLOSE, kernel, iterations=2)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count < 2:
+        return None
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    x, y, w, h, area = stats[largest]
+    if area < min_area * mask.size:
+        return None
+
+    # Grow to a square (the model input is square) plus margin, in full-resolution pixels
+    side = max(w, h) * (1.0 + 2 * margin) / scale
+    cx, cy = (x + w / 2) / scale, (y + h / 2) / scale
+    x0, y0 = int(max(0, cx - side / 2)), int(max(0, cy - side / 2))
+    x1, y1 = int(min(width, cx + side / 2)), int(min(height, cy + side / 2))
+    if (x1 - x0) * (y1 - y0) > 0.9 * width * height:
+        return None
+    return x0, y0, x1, y1
+
 def validate_image(image_data: bytes) -> bool:
     """
     Validate uploaded image
@@ -65,3 +145,53 @@ def validate_image(image_data: bytes) -> bool:
         
     except Exception:
         return False
+
+def image_quality_metrics(image: np.ndarray, analysis_size: int = 256) -> Dict[str, float]:
+    """Blur, exposure and leaf-colour statistics of an RGB image, computed at reduced resolution
+
+    Args:
+        image: RGB uint8 array as returned by ``preprocess_image``
+        analysis_size: Longest side the image is downscaled to before measuring
+
+    Returns:
+        Dict with ``blur_variance`` (variance of the Laplacian; low means blurry),
+        ``brightness`` (mean luma, 0-255), ``clipped_fraction`` (pixels crushed to
+        black or blown to white) and ``green_ratio`` (fraction of leaf-coloured pixels)
+    """
+    # Cheap strided subsample down to ~2x the analysis size, then area-average the rest
+    step = max(1, max(image.shape[:2]) // (2 * analysis_size))
+    if step > 1:
+        image = np.ascontiguousarray(image[::step, ::step])
+    height, width = image.shape[:2]
+    scale = analysis_size / max(height, width)
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    leaf = leaf_mask(image)
+    return {
+        'blur_variance': float(cv2.Laplacian(gray, cv2.CV_32F).var()),
+        'brightness': float(gray.mean()),
+        'clipped_fraction': float(((gray <= 5) | (gray >= 250)).mean()),
+        'green_ratio': float(leaf.mean()),
+    }
+
+def quality_issues(metrics: Dict[str, float]) -> List[str]:
+    """Names of the configured quality thresholds ``metrics`` fails"""
+    issues = []
+    if metrics['blur_variance'] < settings.QUALITY_MIN_BLUR_VARIANCE:
+        issues.append('blurry')
+    if metrics['brightness'] < settings.QUALITY_MIN_BRIGHTNESS:
+        issues.append('underexposed')
+    elif metrics['brightness'] > settings.QUALITY_MAX_BRIGHTNESS:
+        issues.append('overexposed')
+    if metrics['clipped_fraction'] > settings.QUALITY_MAX_CLIPPED_FRACTION:
+        issues.append('clipped')
+    if metrics['green_ratio'] < settings.QUALITY_MIN_GREEN_RATIO:
+        issues.append('not_leaf')
+    return issues
+
+def check_image_quality(image: np.ndarray) -> Dict[str, Any]:
+    """Run the pre-inference quality gate; ``issues`` is empty for acceptable images"""
+    metrics = image_quality_metrics(image, settings.QUALITY_ANALYSIS_SIZE)
+    return {'metrics': metrics, 'issues': quality_issues(metrics)}
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profile is requested while another one is running"""
+
+class StackSampler:
+    """Samples the Python stacks of every thread at a fixed interval.
+
+    Stacks are aggregated in the collapsed ("folded") format read by flamegraph.pl,
+    speedscope and inferno: ``thread;outer;...;inner count`` per line. Nothing is
+    hooked into the interpreter, so the cost is one ``sys._current_frames`` walk per
+    interval on a background thread, and zero when no profile is running.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        name = getattr(code, 'co_qualname', code.co_name)
+        module = frame.f_globals.get('__name__', code.co_filename)
+        return f"{name} ({module}:{frame.f_lineno})"
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f'thread-{ident}'))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self) -> str:
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+class OperatorStats:
+    """Per-operator totals from ``torch.profiler`` runs around individual forward passes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.forward_passes = 0
+        self.ops: Dict[str, Dict[str, float]] = defaultdict(lambda: {'calls': 0, 'self_cpu_us': 0.0, 'cpu_us': 0.0})
+
+    @contextmanager
+    def record(self):
+        from torch.profiler import ProfilerActivity, profile
+        with profile(activities=[ProfilerActivity.CPU], record_shapes=False) as prof:
+            yield
+        with self._lock:
+            self.forward_passes += 1
+            for event in prof.key_averages():
+                op = self.ops[event.key]
+                op['calls'] += event.count
+                op['self_cpu_us'] += event.self_cpu_time_total
+                op['cpu_us'] += event.cpu_time_total
+
+    def table(self, top: int = 30):
+        rows = sorted(self.ops.items(), key=lambda item: item[1]['self_cpu_us'], reverse=True)[:top]
+        total = sum(op['self_cpu_us'] for op in self.ops.values()) or 1.0
+        return [{'operator': name, **op, 'self_cpu_pct': 100.0 * op['self_cpu_us'] / total} for name, op in rows]
+
+class ProfilingController:
+    """Runs at most one timed profiling session for the whole process.
+
+    While a session is active, ``PlantDiseaseModel`` wraps each forward pass in
+    ``forward_context()`` to collect the operator breakdown; otherwise that call
+    returns a shared ``nullcontext`` and costs a single attribute check.
+    """
+
+    def __init__(self):
+        self._operators: Optional[OperatorStats] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self._lock.locked()
+
+    def forward_context(self):
+        operators = self._operators
+        return operators.record() if operators is not None else _NULL_CONTEXT
+
+    async def run(self, seconds: float, interval: float = 0.005, include_torch: bool = True,
+                  top_operators: int = 30) -> Dict[str, Any]:
+        if self._lock.locked():
+            raise ProfilerBusy("A profiling session is already running")
+        async with self._lock:
+            sampler = StackSampler(interval)
+            self._operators = OperatorStats() if include_torch else None
+            operators = self._operators
+            logger.info(f"Profiling for {seconds:.1f}s (interval {interval * 1000:.1f} ms, torch={include_torch})")
+            started = time.perf_counter()
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                sampler.stop()
+                self._operators = None
+            return {
+                'duration_s': time.perf_counter() - started,
+                'interval_ms': interval * 1000,
+                'samples': sampler.samples,
+                'folded': sampler.folded(),
+                'forward_passes': operators.forward_passes if operators else 0,
+                'torch_operators': operators.table(top_operators) if operators else [],
+            }
+
+_NULL_CONTEXT = nullcontext()
+
+profiler = ProfilingController()
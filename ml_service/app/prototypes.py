@@ -0,0 +1,53 @@
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+
+class PrototypeClassifier:
+    """Nearest-prototype classifier over backbone embeddings, for crops without a trained head.
+
+    Each class is represented by the L2-normalised mean embedding of its labelled
+    images; probabilities are a softmax over cosine similarities divided by
+    ``temperature``. Class names follow the service convention (``healthy_<crop>``
+    for the healthy class) so predictions map to healthy/diseased unchanged.
+    """
+
+    def __init__(self, prototypes: np.ndarray, class_names: List[str], backbone_checkpoint: str,
+                 temperature: float = 0.05, metadata: Optional[Dict] = None):
+        prototypes = np.asarray(prototypes, dtype=np.float32)
+        self.prototypes = torch.from_numpy(prototypes / np.linalg.norm(prototypes, axis=1, keepdims=True))
+        self.class_names = list(class_names)
+        self.backbone_checkpoint = backbone_checkpoint
+        self.temperature = temperature
+        self.metadata = metadata or {}
+
+    @classmethod
+    def from_embeddings(cls, embeddings: np.ndarray, labels: List[str], backbone_checkpoint: str,
+                        temperature: float = 0.05, metadata: Optional[Dict] = None) -> 'PrototypeClassifier':
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        labels = np.asarray(labels)
+        class_names = sorted(set(labels.tolist()))
+        prototypes = np.stack([embeddings[labels == name].mean(0) for name in class_names])
+        metadata = dict(metadata or {}, support={name: int((labels == name).sum()) for name in class_names})
+        return cls(prototypes, class_names, backbone_checkpoint, temperature, metadata)
+
+    def probabilities(self, embeddings: torch.Tensor) -> torch.Tensor:
+        embeddings = torch.nn.functional.normalize(embeddings.float(), dim=1)
+        similarity = embeddings @ self.prototypes.to(embeddings.device).T
+        return torch.softmax(similarity / self.temperature, dim=1)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, prototypes=self.prototypes.numpy(), class_names=np.array(self.class_names),
+                 backbone_checkpoint=self.backbone_checkpoint, temperature=self.temperature,
+                 metadata=np.array(json.dumps(self.metadata)))
+
+    @classmethod
+    def load(cls, path: str) -> 'PrototypeClassifier':
+        data = np.load(path)
+        metadata = json.loads(str(data['metadata'])) if 'metadata' in data else {}
+        return cls(data['prototypes'], [str(c) for c in data['class_names']], str(data['backbone_checkpoint']),
+                   float(data['temperature']), metadata)
@@ -0,0 +1,60 @@
+import logging
+from typing import Any, Dict
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+def shrink_inverted_residual(block: nn.Module, keep: torch.Tensor):
+    """Keep only the expansion channels ``keep`` of a timm ``InvertedResidual`` block in place.
+
+    The expansion width appears in conv_pw/bn1 (outputs), conv_dw/bn2 (depthwise),
+    the squeeze-excite convs and conv_pwl (inputs); the block's input and output
+    widths are unchanged, so the rest of the network is untouched.
+    """
+    keep = keep.to(block.conv_pw.weight.device)
+    _slice_conv(block.conv_pw, keep, dim=0)
+    _slice_bn(block.bn1, keep)
+    _slice_conv(block.conv_dw, keep, dim=0)
+    block.conv_dw.in_channels = block.conv_dw.groups = len(keep)
+    _slice_bn(block.bn2, keep)
+    se = getattr(block, 'se', None)
+    if se is not None and hasattr(se, 'conv_reduce'):
+        _slice_conv(se.conv_reduce, keep, dim=1)
+        _slice_conv(se.conv_expand, keep, dim=0)
+    _slice_conv(block.conv_pwl, keep, dim=1)
+
+def apply_pruning_spec(model: nn.Module, spec: Dict[str, Any]) -> nn.Module:
+    """Reshape a freshly created timm model to match a pruned checkpoint.
+
+    ``spec`` is the ``pruning`` entry written by ``ml_training/prune.py``:
+    ``expansion_channels`` maps block names to their remaining width and
+    ``dropped_blocks`` lists residual blocks replaced by identities. Weights are
+    overwritten by ``load_state_dict`` afterwards, so the kept channels are simply
+    the first ``width`` ones here.
+    """
+    for name, width in spec.get('expansion_channels', {}).items():
+        shrink_inverted_residual(model.get_submodule(name), torch.arange(int(width)))
+    for name in spec.get('dropped_blocks', []):
+        parent_name, _, index = name.rpartition('.')
+        model.get_submodule(parent_name)[int(index)] = nn.Identity()
+    logger.info(f"Applied pruning spec: {len(spec.get('expansion_channels', {}))} narrowed blocks, "
+                f"{len(spec.get('dropped_blocks', []))} dropped blocks")
+    return model
+
+def _slice_conv(conv: nn.Conv2d, keep: torch.Tensor, dim: int):
+    conv.weight = nn.Parameter(conv.weight.data.index_select(dim, keep).clone())
+    if dim == 0:
+        if conv.bias is not None:
+            conv.bias = nn.Parameter(conv.bias.data.index_select(0, keep).clone())
+        conv.out_channels = len(keep)
+    else:
+        conv.in_channels = len(keep)
+
+def _slice_bn(bn: nn.BatchNorm2d, keep: torch.Tensor):
+    bn.weight = nn.Parameter(bn.weight.data.index_select(0, keep).clone())
+    bn.bias = nn.Parameter(bn.bias.data.index_select(0, keep).clone())
+    bn.running_mean = bn.running_mean.index_select(0, keep).clone()
+    bn.running_var = bn.running_var.index_select(0, keep).clone()
+    bn.num_features = len(keep)
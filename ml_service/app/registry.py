@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional, Tuple
+
+from app.config import settings
+from app.metrics import MODEL_RELOADS
+from app.model import PlantDiseaseModel
+from app.shadow import ShadowEvaluator
+
+logger = logging.getLogger(__name__)
+
+# How often a retired model checks whether its last request has finished
+DRAIN_POLL_S = 0.05
+
+def watched_files(plant: str, model_path: Optional[str]) -> List[str]:
+    """Checkpoints whose replacement should reload the model for ``plant`` (none for prototype crops)"""
+    if plant not in ('potato', 'tomato'):
+        return []
+    paths = [model_path or settings.model_path_for(plant)]
+    if settings.CASCADE_ENABLED:
+        paths.append(settings.cascade_path_for(plant))
+    return paths
+
+def file_signature(paths: List[str]) -> Tuple:
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+class ModelRegistry:
+    """Owns the served ``PlantDiseaseModel`` and replaces it without dropping requests.
+
+    Requests hold a lease on the instance that was active when they arrived and use it
+    throughout, so a swap is a single reference assignment. A replacement is loaded on
+    a worker thread and warmed up by its self-test before the swap. The previous
+    instance keeps serving its leases and is closed once the last one is released.
+
+    A second checkpoint can be evaluated on live traffic as ``shadow`` before it is
+    promoted (see app/shadow.py). It is stopped when a switch changes the active plant.
+    """
+
+    def __init__(self):
+        self.active: Optional[PlantDiseaseModel] = None
+        self._leases: Counter = Counter()
+        self._signature: Tuple = ()
+        self._reload_lock = asyncio.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+        self._retiring = set()
+        self.shadow: Optional[ShadowEvaluator] = None
+
+    @asynccontextmanager
+    async def lease(self):
+        """The active model (None before startup), kept open until the block exits"""
+        model = self.active
+        if model is None:
+            yield None
+            return
+        key = id(model)
+        self._leases[key] += 1
+        try:
+            yield model
+        finally:
+            self._leases[key] -= 1
+            if self._leases[key] <= 0:
+                del self._leases[key]
+
+    def activate(self, model: PlantDiseaseModel, trigger: str = 'startup', signature: Optional[Tuple] = None):
+        """Serve ``model`` from now on; the previous instance is closed after its requests drain"""
+        previous, self.active = self.active, model
+        if signature is None:
+            signature = file_signature(watched_files(model.current_plant, model.model_path))
+        self._signature = signature
+        MODEL_RELOADS.labels(model.current_plant, trigger, 'swapped').inc()
+        logger.info(f"Serving {model.current_plant} model {model.model_version} ({model.model_path or 'no checkpoint'})")
+        if previous is not None and previous is not model:
+            task = asyncio.get_running_loop().create_task(self._retire(previous))
+            self._retiring.add(task)
+            task.add_done_callback(self._retiring.discard)
+
+    async def _retire(self, model: PlantDiseaseModel):
+        while self._leases.get(id(model)):
+            await asyncio.sleep(DRAIN_POLL_S)
+        await asyncio.to_thread(model.close)
+        logger.info(f"Released {model.current_plant} model {model.model_version} after in-flight requests drained")
+
+    async def load(self, plant: str, model_path: Optional[str], require_checkpoint: bool = False) -> PlantDiseaseModel:
+        """A new, self-tested model for ``plant``; the active one is untouched"""
+        candidate = PlantDiseaseModel()
+        try:
+            # switch_plant only awaits synchronous loading code: run it on a worker thread
+            # (with its own loop) so torch.load and weight copies don't stall requests
+            await asyncio.to_thread(asyncio.run, candidate.switch_plant(plant, model_path))
+            if require_checkpoint and candidate.model_path != model_path:
+                raise ValueError(f"Could not load checkpoint {model_path}")
+            current = self.active
+            if (current is not None and current.similarity_index is not None and candidate.similarity_index is not None
+                    and current.similarity_index.path == candidate.similarity_index.path):
+                # One writer per index directory: requests still on the old model may append to it
+                candidate.similarity_index = current.similarity_index
+            await candidate.self_test(settings.MODEL_WARMUP_RUNS)
+        except Exception:
+            await asyncio.to_thread(candidate.close)
+            raise
+        return candidate
+
+    async def switch(self, plant: str, model_path: Optional[str], trigger: str = 'switch',
+                     require_checkpoint: bool = False) -> PlantDiseaseModel:
+        """Load, warm up and atomically swap in the model for ``plant``"""
+        async with self._reload_lock:
+            signature = file_signature(watched_files(plant, model_path))
+            try:
+                candidate = await self.load(plant, model_path, require_checkpoint)
+            except Exception:
+                MODEL_RELOADS.labels(plant, trigger, 'failed').inc()
+                raise
+            self.activate(candidate, trigger, signature)
+            if self.shadow is not None and self.shadow.plant != candidate.current_plant:
+                # The candidate was built for the previous plant and would only see mismatches
+                logger.info(f"Active plant is now {candidate.current_plant}, stopping the {self.shadow.plant} shadow")
+                await self.stop_shadow()
+            return candidate
+
+    async def watch(self, interval: float):
+        """Reload the active model when one of its checkpoint files is replaced"""
+        pending = None
+        while True:
+            await asyncio.sleep(interval)
+            model = self.active
+            if model is None or self._reload_lock.locked():
+                continue
+            paths = watched_files(model.current_plant, model.model_path)
+            signature = file_signature(paths)
+            if signature == self._signature:
+                pending = None
+                continue
+            if signature != pending:
+                # Wait until the file stops changing: it may still be being copied
+                pending = signature
+                continue
+            pending = None
+            # A checkpoint that fails to load is not retried until it changes again
+            self._signature = signature
+            if not os.path.exists(paths[0]):
+                continue
+            logger.info(f"Checkpoint change detected for {model.current_plant}, reloading {paths[0]}")
+            try:
+                await self.switch(model.current_plant, paths[0], trigger='watch', require_checkpoint=True)
+            except Exception as e:
+                logger.error(f"Hot reload of {paths[0]} failed, keeping model {model.model_version}: {e}")
+
+    async def start_shadow(self, model_path: str, fraction: float,
+                           primary_busy: Optional[Callable[[], bool]] = None) -> ShadowEvaluator:
+        """Compare the checkpoint at ``model_path`` with the active model on ``fraction`` of requests"""
+        # Under the reload lock so the active plant cannot change while the candidate loads
+        async with self._reload_lock:
+            plant = self.active.current_plant if self.active is not None else 'potato'
+            candidate = await self.load(plant, model_path, require_checkpoint=True)
+            previous, self.shadow = self.shadow, ShadowEvaluator(
+                candidate, fraction, settings.SHADOW_MAX_BATCH, settings.SHADOW_BATCH_WAIT_MS / 1000.0,
+                settings.SHADOW_MAX_QUEUE, settings.SHADOW_MAX_BUSY_FRACTION, settings.SHADOW_MAX_DELAY_S,
+                primary_busy)
+        if previous is not None:
+            await previous.close()
+        logger.info(f"Shadowing {fraction:.0%} of {plant} traffic with {model_path} ({candidate.model_version})")
+        return self.shadow
+
+    async def stop_shadow(self):
+        shadow, self.shadow = self.shadow, None
+        if shadow is not None:
+            await shadow.close()
+            logger.info(f"Stopped shadow evaluation of {shadow.candidate.model_version} after {shadow.compared} comparisons")
+
+    def start_watching(self, interval: float):
+        if self._watch_task is None:
+            self._watch_task = asyncio.get_running_loop().create_task(self.watch(interval))
+
+    async def stop(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+        await self.stop_shadow()
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import random
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from app.metrics import SHADOW_DROPPED, SHADOW_PREDICTIONS
+from app.model import PlantDiseaseModel
+
+logger = logging.getLogger(__name__)
+
+# Latency samples kept for the reported percentiles
+LATENCY_WINDOW = 1024
+
+def percentiles_ms(samples) -> Optional[Dict[str, float]]:
+    if not samples:
+        return None
+    p50, p95 = np.percentile(np.asarray(samples) * 1000.0, [50, 95])
+    return {'p50': round(float(p50), 2), 'p95': round(float(p95), 2)}
+
+class ShadowEvaluator:
+    """Runs a sampled fraction of /predict traffic through a candidate model off the request path.
+
+    ``submit`` only queues a reference to the decoded image, after the primary
+    prediction has been computed. A background task batches the queue through the
+    candidate on the candidate's own inference thread and compares the results with
+    the primary's. The candidate's compute is capped three ways:
+
+    * the queue is bounded and full means the sample is dropped, never waited for
+    * batches wait while ``primary_busy()`` reports the primary saturated; samples
+      older than ``max_delay`` are dropped instead of piling up
+    * after each batch the worker idles so shadow compute stays under
+      ``max_busy_fraction`` of wall time
+    """
+
+    def __init__(self, candidate: PlantDiseaseModel, fraction: float, max_batch: int = 8, max_wait: float = 0.05,
+                 max_queue: int = 32, max_busy_fraction: float = 0.25, max_delay: float = 30.0,
+                 primary_busy: Optional[Callable[[], bool]] = None):
+        self.candidate = candidate
+        self.plant = candidate.current_plant
+        self.fraction = fraction
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.max_busy_fraction = min(max(max_busy_fraction, 0.01), 1.0)
+        self.max_delay = max_delay
+        self.primary_busy = primary_busy or (lambda: False)
+        self._pending: deque = deque()
+        self._worker: Optional[asyncio.Task] = None
+        self._closed = False
+        # Set by close() to cut the worker's waits short
+        self._closing = asyncio.Event()
+        self.started = time.time()
+        self.compared = 0
+        self.agreed = 0
+        self.verdicts_agreed = 0
+        self.confidence_delta = 0.0
+        self.primary_class_delta = 0.0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.confusion: Dict[str, Counter] = {}
+        self.primary_versions: Counter = Counter()
+        self.dropped: Counter = Counter()
+        self.primary_latency: deque = deque(maxlen=LATENCY_WINDOW)
+        self.shadow_latency: deque = deque(maxlen=LATENCY_WINDOW)
+
+    def _drop(self, reason: str, count: int = 1):
+        self.dropped[reason] += count
+        SHADOW_DROPPED.labels(self.plant, reason).inc(count)
+
+    def submit(self, image: np.ndarray, primary: Dict[str, Any], plant: str, model_version: str,
+               primary_latency: float):
+        """Queue ``image`` for the candidate with probability ``fraction``; never blocks"""
+        if self._closed or random.random() >= self.fraction:
+            return
+        if plant != self.plant:
+            self._drop('plant_mismatch')
+            return
+        if len(self._pending) >= self.max_queue:
+            self._drop('queue_full')
+            return
+        self._pending.append((image, primary, model_version, primary_latency, time.monotonic()))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._drain())
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.max_delay
+        while self._pending and self._pending[0][-1] < cutoff:
+            self._pending.popleft()
+            self._drop('stale')
+
+    async def _pause(self, seconds: float):
+        """Sleep for ``seconds`` or until close() is called"""
+        try:
+            await asyncio.wait_for(self._closing.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _drain(self):
+        while self._pending and not self._closed:
+            if len(self._pending) < self.max_batch:
+                await self._pause(self.max_wait)
+            while self.primary_busy() and not self._closed:
+                await self._pause(self.max_wait)
+                self._expire()
+            self._expire()
+            if not self._pending or self._closed:
+                break
+            batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            started = time.perf_counter()
+            try:
+                probabilities = await self.candidate.classify_batch([item[0] for item in batch], 'shadow_forward')
+            except Exception as e:
+                logger.warning(f"Shadow batch failed on candidate {self.candidate.model_version}: {e}")
+                self._drop('error', len(batch))
+                continue
+            elapsed = time.perf_counter() - started
+            self.batches += 1
+            self.busy_seconds += elapsed
+            for item, row in zip(batch, probabilities):
+                self._record(item, row, elapsed / len(batch))
+            # Idle so that shadow compute stays under max_busy_fraction of wall time
+            await self._pause(elapsed * (1.0 / self.max_busy_fraction - 1.0))
+
+    def _record(self, item, probabilities, shadow_latency: float):
+        _, primary, model_version, primary_latency, _ = item
+        class_names = self.candidate.class_names
+        shadow_idx = int(probabilities.argmax())
+        shadow_class = class_names[shadow_idx]
+        primary_class = primary['predicted_class']
+        agreed = shadow_class == primary_class
+        self.compared += 1
+        self.agreed += agreed
+        self.verdicts_agreed += shadow_class.startswith('healthy_') == primary_class.startswith('healthy_')
+        self.confidence_delta += float(probabilities[shadow_idx]) - float(primary['confidence'])
+        if primary_class in class_names:
+            self.primary_class_delta += abs(float(probabilities[class_names.index(primary_class)])
+                                            - float(primary['confidence']))
+        self.confusion.setdefault(primary_class, Counter())[shadow_class] += 1
+        self.primary_versions[model_version] += 1
+        self.primary_latency.append(primary_latency)
+        self.shadow_latency.append(shadow_latency)
+        SHADOW_PREDICTIONS.labels(self.plant, self.candidate.model_version, 'agree' if agreed else 'disagree').inc()
+
+    def summary(self) -> Dict[str, Any]:
+        n = max(self.compared, 1)
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {
+            'plant': self.plant,
+            'candidate': {'path': self.candidate.model_path, 'version': self.candidate.model_version,
+                          'architecture': self.candidate.architecture},
+            'primaryVersions': dict(self.primary_versions),
+            'fraction': self.fraction,
+            'compared': self.compared,
+            'queued': len(self._pending),
+            'dropped': dict(self.dropped),
+            'agreement': self.agreed / n if self.compared else None,
+            'verdictAgreement': self.verdicts_agreed / n if self.compared else None,
+            # Candidate top-class confidence minus the primary's, and how far the candidate's
+            # probability for the primary's class is from the primary's confidence
+            'meanConfidenceDelta': self.confidence_delta / n if self.compared else None,
+            'meanPrimaryClassDelta': self.primary_class_delta / n if self.compared else None,
+            'confusion': {primary: dict(counts) for primary, counts in self.confusion.items()},
+            'latencyMs': {
+                # Primary: whole predict call per request; shadow: batched forward per image
+                'primary': percentiles_ms(self.primary_latency),
+                'shadowPerImage': percentiles_ms(self.shadow_latency),
+            },
+            'meanBatchSize': self.compared / self.batches if self.batches else None,
+            'busyFraction': self.busy_seconds / elapsed,
+            'since': self.started,
+        }
+
+    async def close(self):
+        """Stop sampling, let a running batch finish (and count in the report) and release the candidate"""
+        self._closed = True
+        self._pending.clear()
+        self._closing.set()
+        if self._worker is not None:
+            try:
+                await self._worker
+            except Exception as e:
+                logger.warning(f"Shadow worker failed while closing: {e}")
+        await asyncio.to_thread(self.candidate.close)
@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per block when scanning the memory map (bounds the float32 working set)
+SCAN_BLOCK = 65536
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def default_nlist(count: int) -> int:
+    """Number of IVF lists for ``count`` vectors; small indexes are searched exactly"""
+    if count < 20000:
+        return 0
+    return int(min(65536, 4 * np.sqrt(count)))
+
+class EmbeddingIndex:
+    """Append-only cosine-similarity index over float16 embeddings in a directory.
+
+    Layout:
+
+    * ``vectors.f16``  - L2-normalised embeddings, ``count x dim`` float16, memory-mapped
+    * ``lists.i32``    - IVF list of every row (-1 until the index is trained)
+    * ``centroids.npy``- IVF coarse centroids (absent for exact search)
+    * ``items.jsonl`` + ``offsets.i64`` - per-row metadata, read only for returned hits
+    * ``meta.json``    - dimension, row count, model version, architecture and image preprocessing
+
+    Search probes the ``nprobe`` lists whose centroids are closest to each query and
+    scores only their rows; queries in a batch that probe the same list share one
+    matrix multiply. Appends are assigned to their nearest centroid immediately and
+    are visible to the next search.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with open(self.path / 'meta.json') as f:
+            self.meta = json.load(f)
+        self.dim = int(self.meta['dim'])
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def create(cls, path: str, dim: int, model_version: str = '', architecture: str = '',
+               preprocessing: Optional[Dict[str, Any]] = None) -> 'EmbeddingIndex':
+        directory = Path(path)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in ('vectors.f16', 'lists.i32', 'items.jsonl', 'offsets.i64', 'centroids.npy'):
+            if (directory / name).exists():
+                (directory / name).unlink()
+        for name in ('vectors.f16', 'lists.i32', 'items.jsonl', 'offsets.i64'):
+            (directory / name).touch()
+        meta = {'dim': dim, 'count': 0, 'nlist': 0, 'model_version': model_version,
+                'architecture': architecture, 'preprocessing': preprocessing, 'created': time.time()}
+        with open(directory / 'meta.json', 'w') as f:
+            json.dump(meta, f, indent=2)
+        return cls(path)
+
+    @property
+    def count(self) -> int:
+        return int(self.meta['count'])
+
+    @property
+    def nlist(self) -> int:
+        return 0 if self.centroids is None else len(self.centroids)
+
+    def _load(self):
+        count = self.count
+        self.vectors = (np.memmap(self.path / 'vectors.f16', dtype=np.float16, mode='r', shape=(count, self.dim))
+                        if count else np.zeros((0, self.dim), np.float16))
+        self.offsets = np.fromfile(self.path / 'offsets.i64', dtype=np.int64)[:count]
+        centroids_path = self.path / 'centroids.npy'
+        self.centroids = np.load(centroids_path) if centroids_path.exists() else None
+        lists = np.fromfile(self.path / 'lists.i32', dtype=np.int32)[:count]
+        # Rows grouped by list: self._order[self._starts[c]:self._starts[c + 1]] belong to list c
+        if self.centroids is not None:
+            self._order = np.argsort(lists, kind='stable').astype(np.int64)
+            self._starts = np.searchsorted(lists[self._order], np.arange(self.nlist + 1))
+        self._tail: Dict[int, List[int]] = {}
+
+    def _write_meta(self):
+        with open(self.path / 'meta.json.tmp', 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(self.path / 'meta.json.tmp', self.path / 'meta.json')
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Nearest IVF list of each (normalised) vector"""
+        if self.centroids is None:
+            return np.full(len(vectors), -1, np.int32)
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def add(self, vectors: np.ndarray, items: List[Dict[str, Any]]) -> np.ndarray:
+        """Append embeddings and their metadata; returns the new row ids"""
+        vectors = normalize_rows(vectors)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape}")
+        if len(items) != len(vectors):
+            raise ValueError("One metadata item is required per vector")
+        lists = self.assign(vectors)
+        with self._lock:
+            start = self.count
+            with open(self.path / 'items.jsonl', 'ab') as f:
+                offset = f.tell()
+                offsets = []
+                for item in items:
+                    line = (json.dumps(item, default=str) + '\n').encode()
+                    offsets.append(offset)
+                    f.write(line)
+                    offset += len(line)
+            with open(self.path / 'offsets.i64', 'ab') as f:
+                np.asarray(offsets, np.int64).tofile(f)
+            with open(self.path / 'lists.i32', 'ab') as f:
+                lists.tofile(f)
+            with open(self.path / 'vectors.f16', 'ab') as f:
+                vectors.astype(np.float16).tofile(f)
+            self.meta['count'] = start + len(vectors)
+            self._write_meta()
+            tail = self._tail
+            self.vectors = np.memmap(self.path / 'vectors.f16', dtype=np.float16, mode='r',
+                                     shape=(self.count, self.dim))
+            self.offsets = np.concatenate([self.offsets, np.asarray(offsets, np.int64)])
+            for row, list_id in enumerate(lists, start):
+                tail.setdefault(int(list_id), []).append(row)
+        return np.arange(start, start + len(vectors))
+
+    def train(self, nlist: Optional[int] = None, iterations: int = 10, sample_size: int = 200000, seed: int = 0):
+        """Fit IVF centroids by spherical k-means on a sample and reassign every row"""
+        nlist = default_nlist(self.count) if nlist is None else nlist
+        centroids_path = self.path / 'centroids.npy'
+        if nlist <= 0 or self.count < nlist:
+            if centroids_path.exists():
+                centroids_path.unlink()
+            lists = np.full(self.count, -1, np.int32)
+        else:
+            rng = np.random.default_rng(seed)
+            sample_ids = np.sort(rng.choice(self.count, min(sample_size, self.count), replace=False))
+            sample = normalize_rows(self.vectors[sample_ids])
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+            for _ in range(iterations):
+                assignment = np.concatenate([np.argmax(block @ centroids.T, axis=1)
+                                             for block in np.array_split(sample, max(1, len(sample) // SCAN_BLOCK))])
+                order = np.argsort(assignment, kind='stable')
+                present, starts = np.unique(assignment[order], return_index=True)
+                sums = np.add.reduceat(sample[order], starts, axis=0)
+                empty = np.setdiff1d(np.arange(nlist), present)
+                centroids[present] = sums
+                # Reseed empty lists with random sample points
+                centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+                centroids = normalize_rows(centroids)
+            np.save(centroids_path, centroids)
+            self.centroids = centroids
+            lists = np.concatenate([self.assign(self.vectors[s:s + SCAN_BLOCK].astype(np.float32))
+                                    for s in range(0, self.count, SCAN_BLOCK)])
+        with self._lock:
+            lists.astype(np.int32).tofile(self.path / 'lists.i32')
+            self.meta['nlist'] = int(nlist) if centroids_path.exists() else 0
+            self._write_meta()
+            self._load()
+        logger.info(f"Trained similarity index {self.path}: {self.count} vectors, {self.nlist} lists")
+
+    def _list_rows(self, list_id: int) -> np.ndarray:
+        base = self._order[self._starts[list_id]:self._starts[list_id + 1]]
+        tail = self._tail.get(list_id)
+        return np.concatenate([base, np.asarray(tail, np.int64)]) if tail else base
+
+    @staticmethod
+    def _merge(best_scores, best_ids, query_rows, scores, row_ids, k):
+        """Fold ``scores`` (len(query_rows) x len(row_ids)) into the running top-k"""
+        if scores.shape[1] > k:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, top, axis=1)
+            ids = row_ids[top]
+        else:
+            ids = np.broadcast_to(row_ids, scores.shape)
+        all_scores = np.concatenate([best_scores[query_rows], scores], axis=1)
+        all_ids = np.concatenate([best_ids[query_rows], ids], axis=1)
+        keep = np.argsort(-all_scores, axis=1)[:, :k]
+        best_scores[query_rows] = np.take_along_axis(all_scores, keep, axis=1)
+        best_ids[query_rows] = np.take_along_axis(all_ids, keep, axis=1)
+
+    def search(self, queries: np.ndarray, k: int = 5, nprobe: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-``k`` cosine similarities and row ids for each query (ids are -1 past the end)"""
+        queries = normalize_rows(np.atleast_2d(queries))
+        best_scores = np.full((len(queries), k), -np.inf, np.float32)
+        best_ids = np.full((len(queries), k), -1, np.int64)
+        with self._lock:
+            vectors, count = self.vectors, self.count
+            if count == 0:
+                return best_scores, best_ids
+            all_queries = np.arange(len(queries))
+            if self.centroids is None:
+                for start in range(0, count, SCAN_BLOCK):
+                    block = np.asarray(vectors[start:start + SCAN_BLOCK], dtype=np.float32)
+                    self._merge(best_scores, best_ids, all_queries, queries @ block.T,
+                                np.arange(start, start + len(block)), k)
+                return best_scores, best_ids
+            probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :min(nprobe, self.nlist)]
+            list_rows = {int(c): self._list_rows(int(c)) for c in np.unique(probes)}
+        for list_id, rows in list_rows.items():
+            if len(rows) == 0:
+                continue
+            query_rows = np.nonzero((probes == list_id).any(axis=1))[0]
+            block = np.asarray(vectors[np.sort(rows)], dtype=np.float32)
+            self._merge(best_scores, best_ids, query_rows, queries[query_rows] @ block.T, np.sort(rows), k)
+        return best_scores, best_ids
+
+    def items(self, ids) -> List[Optional[Dict[str, Any]]]:
+        """Metadata of the given row ids (None for -1 padding)"""
+        results = []
+        with open(self.path / 'items.jsonl', 'rb') as f:
+            for row in ids:
+                if row < 0:
+                    results.append(None)
+                    continue
+                f.seek(int(self.offsets[row]))
+                results.append(json.loads(f.readline()))
+        return results
+
+def open_index(path: str) -> Optional[EmbeddingIndex]:
+    """The index at ``path``, or None when it has not been built"""
+    if not path or not (Path(path) / 'meta.json').exists():
+        return None
+    try:
+        index = EmbeddingIndex(path)
+        logger.info(f"Opened similarity index {path} ({index.count} vectors, {index.nlist} lists)")
+        return index
+    except Exception as e:
+        logger.error(f"Error opening similarity index {path}: {e}")
+        return None
@@ -0,0 +1,356 @@
+"""Load-testing and latency benchmark for the ML service.
+
+Starts ``main:app`` under uvicorn (or targets ``--url``), replays real dataset images
+and records throughput, latency percentiles, status codes and server memory over
+time for each workload:
+
+* ``single``  - one image per request, drawn from the whole manifest
+* ``batched`` - requests arrive in bursts of ``--burst-size`` at once
+* ``cached``  - a handful of identical images replayed over and over
+* ``switch``  - predictions interleaved with ``/model/switch`` between potato and tomato
+
+Load is closed-loop at ``--concurrency`` by default; ``--rate`` switches to an
+open-loop Poisson arrival process at that many requests per second. Results are
+written as JSON (one file per run, tagged with the git commit) so runs can be
+compared with ``python -m benchmarks.load_test compare old.json new.json``.
+
+    cd ml_service
+    python -m benchmarks.load_test run --workloads single cached --concurrency 8 --requests 400
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import mimetypes
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+SERVICE_DIR = Path(__file__).resolve().parents[1]
+REPO_ROOT = SERVICE_DIR.parent
+WORKLOADS = ('single', 'batched', 'cached', 'switch')
+
+def load_images(manifests: List[Path], limit: int, seed: int = 0) -> List[Dict]:
+    """Read up to ``limit`` existing images from dataset manifests as ``{'path', 'plant', 'data'}``"""
+    rows = []
+    for manifest in manifests:
+        with open(manifest, newline='') as f:
+            for row in csv.DictReader(f):
+                path = REPO_ROOT / row['image_path'].replace('\\', '/')
+                if path.exists():
+                    rows.append({'path': path, 'plant': row.get('plant_type', 'potato')})
+    if not rows:
+        raise FileNotFoundError(f"No images from {[str(m) for m in manifests]} exist on disk")
+    random.Random(seed).shuffle(rows)
+    rows = rows[:limit]
+    for row in rows:
+        row['data'] = row['path'].read_bytes()
+    return rows
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return float('nan')
+    k = (len(sorted_values) - 1) * q / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of ``pid`` in MiB (psutil when available, else /proc)"""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / 2 ** 20
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+class ServiceProcess:
+    """``uvicorn main:app`` in a subprocess on a free local port"""
+
+    def __init__(self, workers: int = 1, env: Optional[Dict[str, str]] = None, startup_timeout: float = 180.0):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.workers = workers
+        self.env = {**os.environ, **(env or {})}
+        self.startup_timeout = startup_timeout
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(self.port),
+             '--workers', str(self.workers), '--log-level', 'warning'],
+            cwd=SERVICE_DIR, env=self.env
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Service exited during startup with code {self.process.returncode}")
+            try:
+                if httpx.get(f'{self.url}/health', timeout=1.0).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.5)
+        self.__exit__(None, None, None)
+        raise TimeoutError(f"Service did not become healthy within {self.startup_timeout:.0f}s")
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        return False
+
+class MemorySampler:
+    """Samples server RSS every ``interval`` seconds while a workload runs"""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self, start: float):
+        while True:
+            value = rss_mb(self.pid)
+            if value is not None:
+                self.samples.append({'t': round(time.perf_counter() - start, 3), 'rss_mb': round(value, 1)})
+            await asyncio.sleep(self.interval)
+
+    def start(self, start: float):
+        if self.pid:
+            self._task = asyncio.create_task(self._run(start))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+class Workload:
+    """Yields the request to send for the ``i``-th arrival"""
+
+    def __init__(self, name: str, images: List[Dict], args):
+        self.name = name
+        self.images = images if name != 'cached' else images[:args.cached_images]
+        self.switch_every = args.switch_every
+        self.rng = random.Random(args.seed)
+
+    def request(self, i: int):
+        if self.name == 'switch' and i % self.switch_every == 0:
+            plant = 'tomato' if (i // self.switch_every) % 2 else 'potato'
+            return 'switch', ('POST', '/model/switch', {'json': {'plant': plant}})
+        image = self.rng.choice(self.images)
+        content_type = mimetypes.guess_type(image['path'].name)[0] or 'image/jpeg'
+        files = {'file': (image['path'].name, image['data'], content_type)}
+        return 'predict', ('POST', '/predict', {'files': files})
+
+async def _send(client: httpx.AsyncClient, workload: Workload, i: int, records: List[Dict], start: float):
+    kind, (method, path, kwargs) = workload.request(i)
+    sent = time.perf_counter()
+    try:
+        response = await client.request(method, path, **kwargs)
+        status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    done = time.perf_counter()
+    records.append({'kind': kind, 'status': status, 'latency_ms': (done - sent) * 1000,
+                    'sent_s': sent - start})
+
+async def run_workload(url: str, workload: Workload, args, server_pid: Optional[int]) -> Dict:
+    records: List[Dict] = []
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.burst_size) * 2)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        # Warm up the model and connection pool outside the measurement window
+        await asyncio.gather(*[_send(client, Workload('single', workload.images, args), i, [], 0.0)
+                               for i in range(args.warmup)])
+        sampler = MemorySampler(server_pid, args.memory_interval)
+        start = time.perf_counter()
+        sampler.start(start)
+
+        if args.rate:
+            # Open loop: Poisson arrivals regardless of how fast the service answers
+            # (bursts arrive at rate / burst_size so the request rate stays ``--rate``)
+            rng = random.Random(args.seed)
+            burst = args.burst_size if workload.name == 'batched' else 1
+            pending = []
+            next_arrival = start
+            for first in range(0, args.requests, burst):
+                next_arrival += rng.expovariate(args.rate / burst)
+                await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+                pending += [asyncio.create_task(_send(client, workload, i, records, start))
+                            for i in range(first, min(first + burst, args.requests))]
+            await asyncio.gather(*pending)
+        elif workload.name == 'batched':
+            # Closed loop in bursts: each round fires burst_size requests at once and waits for all
+            for round_start in range(0, args.requests, args.burst_size):
+                await asyncio.gather(*[_send(client, workload, i, records, start)
+                                       for i in range(round_start, min(round_start + args.burst_size, args.requests))])
+        else:
+            # Closed loop: ``concurrency`` virtual users each send the next request when the last returns
+            counter = iter(range(args.requests))
+
+            async def user():
+                for i in counter:
+                    await _send(client, workload, i, records, start)
+
+            await asyncio.gather(*[user() for _ in range(args.concurrency)])
+
+        elapsed = time.perf_counter() - start
+        await sampler.stop()
+    return summarize(workload.name, records, elapsed, sampler.samples)
+
+def summarize(name: str, records: List[Dict], elapsed: float, memory: List[Dict]) -> Dict:
+    ok = sorted(r['latency_ms'] for r in records if r['status'] == 200 and r['kind'] == 'predict')
+    statuses = Counter(str(r['status']) for r in records)
+    rss = [m['rss_mb'] for m in memory]
+    return {
+        'workload': name,
+        'requests': len(records),
+        'predictions_ok': len(ok),
+        'errors': sum(1 for r in records if r['status'] != 200),
+        'status_counts': dict(statuses),
+        'duration_s': elapsed,
+        'throughput_rps': len(ok) / elapsed if elapsed > 0 else 0.0,
+        'latency_ms': {
+            'mean': statistics.fmean(ok) if ok else float('nan'),
+            'p50': percentile(ok, 50),
+            'p95': percentile(ok, 95),
+            'p99': percentile(ok, 99),
+            'max': ok[-1] if ok else float('nan'),
+        },
+        'memory_mb': {
+            'start': rss[0] if rss else None,
+            'peak': max(rss) if rss else None,
+            'end': rss[-1] if rss else None,
+            'samples': memory,
+        },
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def _run_all(url: str, images: List[Dict], args, server_pid: Optional[int]) -> List[Dict]:
+    results = []
+    for name in args.workloads:
+        logger.info(f"Running workload '{name}'")
+        result = await run_workload(url, Workload(name, images, args), args, server_pid)
+        lat = result['latency_ms']
+        logger.info(f"{name}: {result['throughput_rps']:.1f} req/s, p50 {lat['p50']:.1f} ms, "
+                    f"p95 {lat['p95']:.1f} ms, p99 {lat['p99']:.1f} ms, {result['errors']} errors")
+        results.append(result)
+    return results
+
+def run(args) -> Path:
+    manifests = args.manifests or [REPO_ROOT / 'dataset' / 'labels.csv', REPO_ROOT / 'dataset' / 'tomato_labels.csv']
+    images = load_images([Path(m) for m in manifests], args.images, args.seed)
+    logger.info(f"Loaded {len(images)} images ({sum(len(i['data']) for i in images) / 2 ** 20:.1f} MiB)")
+
+    if args.url:
+        results = asyncio.run(_run_all(args.url, images, args, args.server_pid))
+    else:
+        with ServiceProcess(args.server_workers) as service:
+            results = asyncio.run(_run_all(service.url, images, args, service.process.pid))
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'host': {'cpu_count': os.cpu_count(), 'python': sys.version.split()[0]},
+        'config': {k: v for k, v in vars(args).items() if k not in ('func',)},
+        'results': results,
+    }
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    output = output_dir / f"load_{stamp}_{report['commit'] or 'nogit'}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    logger.info(f"Results written to {output}")
+    return output
+
+def compare(args):
+    """Print throughput and latency changes between two result files"""
+    with open(args.baseline) as f:
+        baseline = {r['workload']: r for r in json.load(f)['results']}
+    with open(args.candidate) as f:
+        candidate = {r['workload']: r for r in json.load(f)['results']}
+    print(f"{'workload':<10} {'metric':<14} {'baseline':>10} {'candidate':>10} {'change':>8}")
+    for name in candidate:
+        if name not in baseline:
+            continue
+        rows = [('throughput_rps', baseline[name]['throughput_rps'], candidate[name]['throughput_rps'])]
+        rows += [(f'{q}_ms', baseline[name]['latency_ms'][q], candidate[name]['latency_ms'][q])
+                 for q in ('p50', 'p95', 'p99')]
+        rows.append(('peak_rss_mb', baseline[name]['memory_mb']['peak'], candidate[name]['memory_mb']['peak']))
+        for metric, old, new in rows:
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else float('nan')
+            print(f"{name:<10} {metric:<14} {old:>10.1f} {new:>10.1f} {change:>+7.1f}%")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Load-test the ML service')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run workloads and write a JSON report')
+    run_parser.add_argument('--workloads', nargs='+', choices=WORKLOADS, default=list(WORKLOADS))
+    run_parser.add_argument('--url', type=str, default=None, help='Target a running service instead of starting one')
+    run_parser.add_argument('--server-pid', type=int, default=None, help='PID to sample memory from with --url')
+    run_parser.add_argument('--server-workers', type=int, default=1, help='uvicorn workers for the started service')
+    run_parser.add_argument('--manifests', nargs='*', default=None, help='Dataset manifests to replay images from')
+    run_parser.add_argument('--images', type=int, default=200, help='Distinct images to load')
+    run_parser.add_argument('--requests', type=int, default=200, help='Requests per workload')
+    run_parser.add_argument('--concurrency', type=int, default=4, help='Closed-loop virtual users')
+    run_parser.add_argument('--rate', type=float, default=None, help='Open-loop Poisson arrival rate (req/s)')
+    run_parser.add_argument('--burst-size', type=int, default=8, help='Requests per burst in the batched workload')
+    run_parser.add_argument('--cached-images', type=int, default=4, help='Distinct images in the cached workload')
+    run_parser.add_argument('--switch-every', type=int, default=10, help='Requests between model switches')
+    run_parser.add_argument('--warmup', type=int, default=5, help='Unmeasured warm-up requests per workload')
+    run_parser.add_argument('--timeout', type=float, default=60.0, help='Per-request timeout in seconds')
+    run_parser.add_argument('--memory-interval', type=float, default=0.5, help='Seconds between RSS samples')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--output-dir', type=str, default='benchmarks/results')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.set_defaults(func=compare)
+    return parser
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    args = build_parser().parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
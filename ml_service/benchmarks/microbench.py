@@ -0,0 +1,237 @@
+"""Per-stage microbenchmarks for the prediction path.
+
+Times each stage of a ``/predict`` request in isolation:
+
+* ``decode``     - ``preprocess_image`` on JPEG/PNG/WEBP bytes at several resolutions
+* ``transform``  - ``PlantDiseaseModel.transform`` on the decoded image
+* ``forward``    - the network across batch sizes, torch thread counts and backends
+                   (eager, channels_last, TorchScript trace, ``torch.compile``)
+* ``postprocess``- softmax, then ``PlantDiseaseModel.postprocess`` (output alignment, argmax, response dict)
+* ``predict``    - ``PlantDiseaseModel.predict`` end to end, for reference, with and
+                   without test-time augmentation forced on
+
+Results can be saved as a named baseline and later runs compared against it; a case
+whose median regresses by more than ``--threshold`` is flagged and the command exits
+non-zero, so it can gate CI.
+
+    cd ml_service
+    python -m benchmarks.microbench --save-baseline main
+    python -m benchmarks.microbench --compare main --threshold 0.1
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import torch
+import timm
+from PIL import Image
+
+from app.config import settings
+from app.model import PlantDiseaseModel
+from app.preprocessing import preprocess_image
+from benchmarks.load_test import REPO_ROOT, git_commit
+
+logger = logging.getLogger(__name__)
+
+BASELINE_DIR = Path(__file__).resolve().parent / 'baselines'
+FORMATS = {'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+BACKENDS = ('eager', 'channels_last', 'torchscript', 'compile')
+
+def time_call(fn: Callable[[], object], repeat: int, warmup: int, min_time: float = 0.0) -> Dict[str, float]:
+    """Median/mean/p95/min of ``fn`` in milliseconds over at least ``repeat`` calls"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < repeat or time.perf_counter() - started < min_time:
+        t0 = time.perf_counter_ns()
+        fn()
+        timings.append((time.perf_counter_ns() - t0) / 1e6)
+    timings.sort()
+    return {
+        'median_ms': statistics.median(timings),
+        'mean_ms': statistics.fmean(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'min_ms': timings[0],
+        'stdev_ms': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'runs': len(timings),
+    }
+
+def source_image(seed: int = 0) -> Image.Image:
+    """A real leaf photo from the dataset when one exists, otherwise a synthetic textured image"""
+    for folder in ('dataset/diseased/potato', 'dataset/healthy/potato', 'dataset/diseased/tomato'):
+        directory = REPO_ROOT / folder
+        if directory.is_dir():
+            for path in sorted(directory.iterdir()):
+                if path.suffix.lower() in ('.jpg', '.jpeg', '.png'):
+                    return Image.open(path).convert('RGB')
+    rng = np.random.default_rng(seed)
+    base = np.linspace(0, 255, 512, dtype=np.float32)[None, :, None] * np.array([0.3, 0.8, 0.2])
+    noise = rng.normal(0, 25, (512, 512, 3))
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+
+def encode(image: Image.Image, size: int, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    image.resize((size, size), Image.BILINEAR).save(buffer, format=FORMATS[fmt], quality=90)
+    return buffer.getvalue()
+
+def build_model(checkpoint: Optional[str]) -> PlantDiseaseModel:
+    model = PlantDiseaseModel()
+    if checkpoint:
+        asyncio.run(model.load_model(checkpoint))
+    else:
+        # Weights do not affect timing; avoid downloading pretrained weights
+        model.model = timm.create_model(settings.MODEL_ARCHITECTURE, pretrained=False,
+                                        num_classes=len(model.class_names)).eval()
+    return model
+
+def forward_fn(network: torch.nn.Module, backend: str, batch: torch.Tensor) -> Callable[[], object]:
+    if backend == 'channels_last':
+        network = network.to(memory_format=torch.channels_last)
+        batch = batch.contiguous(memory_format=torch.channels_last)
+    elif backend == 'torchscript':
+        with torch.no_grad():
+            network = torch.jit.optimize_for_inference(torch.jit.trace(network, batch))
+    elif backend == 'compile':
+        network = torch.compile(network)
+
+    def run():
+        with torch.inference_mode():
+            return network(batch)
+    return run
+
+def postprocess(model: PlantDiseaseModel, outputs: torch.Tensor) -> Dict:
+    """The work ``PlantDiseaseModel.predict`` does after the forward pass, through the model's own code"""
+    return model.postprocess(torch.softmax(outputs, dim=1))
+
+def run_suite(args) -> List[Dict]:
+    logging.getLogger('app').setLevel(logging.WARNING)
+    model = build_model(args.checkpoint)
+    image = source_image()
+    results = []
+
+    def record(stage: str, params: Dict, timing: Dict):
+        key = stage + '[' + ','.join(f'{k}={v}' for k, v in params.items()) + ']'
+        results.append({'case': key, 'stage': stage, 'params': params, **timing})
+        logger.info(f"{key:<60} median {timing['median_ms']:9.3f} ms  p95 {timing['p95_ms']:9.3f} ms")
+
+    torch.set_num_threads(args.threads[0])
+    for fmt in args.formats:
+        for size in args.image_sizes:
+            data = encode(image, size, fmt)
+            record('decode', {'format': fmt, 'size': size},
+                   time_call(lambda: preprocess_image(data), args.repeat, args.warmup, args.min_time))
+            decoded = Image.fromarray(preprocess_image(data))
+            if fmt == args.formats[0]:
+                record('transform', {'size': size},
+                       time_call(lambda: model.transform(decoded), args.repeat, args.warmup, args.min_time))
+
+    network = model.model.to('cpu').eval()
+    size = model.input_size
+    for backend in args.backends:
+        for threads in args.threads:
+            torch.set_num_threads(threads)
+            for batch_size in args.batch_sizes:
+                batch = torch.randn(batch_size, 3, size, size)
+                try:
+                    fn = forward_fn(network, backend, batch)
+                    timing = time_call(fn, args.repeat, args.warmup, args.min_time)
+                except Exception as e:
+                    logger.warning(f"Skipping forward[{backend}] batch {batch_size}: {e}")
+                    continue
+                timing['per_image_ms'] = timing['median_ms'] / batch_size
+                record('forward', {'backend': backend, 'threads': threads, 'batch': batch_size}, timing)
+            network = network.to(memory_format=torch.contiguous_format)
+
+    torch.set_num_threads(args.threads[0])
+    with torch.inference_mode():
+        outputs = network(torch.randn(1, 3, size, size))
+    record('postprocess', {}, time_call(lambda: postprocess(model, outputs), args.repeat * 10, args.warmup))
+
+    decoded = preprocess_image(encode(image, args.image_sizes[0], args.formats[0]))
+    loop = asyncio.new_event_loop()
+    record('predict', {'size': args.image_sizes[0]},
+           time_call(lambda: loop.run_until_complete(model.predict(decoded)), args.repeat, args.warmup, args.min_time))
+    # Upper bound on the TTA cost: every request falls below the confidence threshold
+    tta_settings = (settings.TTA_ENABLED, settings.TTA_CONFIDENCE_THRESHOLD)
+    settings.TTA_ENABLED, settings.TTA_CONFIDENCE_THRESHOLD = True, 1.01
+    record('predict', {'size': args.image_sizes[0], 'tta': len(settings.TTA_VIEWS)},
+           time_call(lambda: loop.run_until_complete(model.predict(decoded)), args.repeat, args.warmup, args.min_time))
+    settings.TTA_ENABLED, settings.TTA_CONFIDENCE_THRESHOLD = tta_settings
+    loop.close()
+    return results
+
+def compare_to_baseline(results: List[Dict], baseline: Dict, threshold: float) -> List[Dict]:
+    """Cases whose median is more than ``threshold`` (fraction) slower than the baseline"""
+    previous = {r['case']: r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(result['case'])
+        if old is None:
+            continue
+        change = result['median_ms'] / old['median_ms'] - 1.0
+        result['baseline_median_ms'] = old['median_ms']
+        result['change'] = change
+        if change > threshold:
+            regressions.append(result)
+    return regressions
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    parser = argparse.ArgumentParser(description='Microbenchmarks for each stage of the prediction path')
+    parser.add_argument('--checkpoint', type=str, default=None, help='Checkpoint to load (default: untrained network)')
+    parser.add_argument('--formats', nargs='+', choices=list(FORMATS), default=list(FORMATS))
+    parser.add_argument('--image-sizes', type=int, nargs='+', default=[256, 1024, 3000])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, torch.get_num_threads()])
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=['eager', 'channels_last', 'torchscript'])
+    parser.add_argument('--repeat', type=int, default=20, help='Minimum timed calls per case')
+    parser.add_argument('--warmup', type=int, default=3, help='Untimed calls per case')
+    parser.add_argument('--min-time', type=float, default=0.0, help='Minimum seconds of timed calls per case')
+    parser.add_argument('--save-baseline', type=str, default=None, help='Store results as this named baseline')
+    parser.add_argument('--compare', type=str, default=None, help='Compare against this named baseline')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Median slowdown fraction flagged as a regression')
+    parser.add_argument('--output', type=str, default=None, help='Also write the full results to this JSON file')
+    args = parser.parse_args()
+    args.threads = sorted(set(args.threads))
+
+    results = run_suite(args)
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'torch': torch.__version__,
+        'architecture': settings.MODEL_ARCHITECTURE,
+        'config': vars(args),
+        'results': results,
+    }
+
+    regressions = []
+    if args.compare:
+        with open(BASELINE_DIR / f'{args.compare}.json') as f:
+            regressions = compare_to_baseline(results, json.load(f), args.threshold)
+        for r in regressions:
+            logger.warning(f"REGRESSION {r['case']}: {r['baseline_median_ms']:.3f} -> {r['median_ms']:.3f} ms "
+                           f"({r['change']:+.1%})")
+        logger.info(f"{len(regressions)} regression(s) beyond {args.threshold:.0%} against baseline '{args.compare}'")
+        report['regressions'] = [r['case'] for r in regressions]
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(BASELINE_DIR / f'{args.save_baseline}.json', 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Baseline '{args.save_baseline}' saved to {BASELINE_DIR}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Accuracy/latency comparison of the decode variants for ``/predict``.
+
+Runs every labelled image of a dataset split through ``preprocess_image`` and
+``PlantDiseaseModel.predict`` under each variant:
+
+* ``full``        - full-resolution decode, whole frame (the default service path)
+* ``fast``        - reduced-resolution decode (``--max-side``), whole frame
+* ``roi``         - full-resolution decode, cropped to the detected leaf
+* ``fast_roi``    - reduced-resolution decode with the leaf crop computed on it
+
+and reports accuracy, the fraction of images that were cropped, and decode/predict
+latency percentiles, so ``DECODE_MAX_SIDE`` and ``LEAF_ROI_ENABLED`` can be set on
+evidence rather than intuition.
+
+    cd ml_service
+    python -m benchmarks.roi_compare --manifest ../dataset/tomato_labels.csv --plant tomato \
+        --checkpoint ../ml_training/models/tomato/tomato_model_best.pth --max-side 512
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from app.model import PlantDiseaseModel
+from app.preprocessing import preprocess_image
+from benchmarks.load_test import REPO_ROOT, git_commit, percentile
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = ('full', 'fast', 'roi', 'fast_roi')
+
+def load_labelled(manifest: Path, split: str, limit: int) -> List[Dict]:
+    """``{'data', 'label'}`` for existing images of ``split`` (all rows when the split is empty)"""
+    with open(manifest, newline='') as f:
+        rows = list(csv.DictReader(f))
+    selected = [r for r in rows if r.get('split') == split] or rows
+    images = []
+    for row in selected[:limit]:
+        path = Path(row['image_path'].replace('\\', '/'))
+        path = path if path.is_absolute() else REPO_ROOT / path
+        if path.exists():
+            images.append({'data': path.read_bytes(), 'label': row['label']})
+    return images
+
+def run_variant(model: PlantDiseaseModel, images: List[Dict], max_side, leaf_roi: bool) -> Dict:
+    loop = asyncio.new_event_loop()
+    decode_ms, predict_ms = [], []
+    correct = cropped = 0
+    for image in images:
+        # Untimed: the uncropped shape tells whether the ROI stage cropped this image
+        full_shape = preprocess_image(image['data'], max_side).shape if leaf_roi else None
+        started = time.perf_counter()
+        array = preprocess_image(image['data'], max_side, leaf_roi)
+        decoded = time.perf_counter()
+        result = loop.run_until_complete(model.predict(array))
+        finished = time.perf_counter()
+        decode_ms.append((decoded - started) * 1000)
+        predict_ms.append((finished - decoded) * 1000)
+        correct += result['predicted_class'] == image['label']
+        cropped += leaf_roi and array.shape != full_shape
+    loop.close()
+    decode_ms.sort()
+    total_ms = sorted(d + p for d, p in zip(decode_ms, predict_ms))
+    return {
+        'images': len(images),
+        'accuracy': 100.0 * correct / max(len(images), 1),
+        'cropped_fraction': cropped / max(len(images), 1),
+        'decode_median_ms': statistics.median(decode_ms),
+        'decode_p95_ms': percentile(decode_ms, 95),
+        'total_median_ms': statistics.median(total_ms),
+        'total_p95_ms': percentile(total_ms, 95),
+    }
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    parser = argparse.ArgumentParser(description='Compare full/fast decode with and without the leaf ROI crop')
+    parser.add_argument('--manifest', type=Path, required=True, help='Labels CSV (image_path,label,...,split)')
+    parser.add_argument('--plant', choices=['potato', 'tomato'], default='potato')
+    parser.add_argument('--checkpoint', type=str, required=True)
+    parser.add_argument('--split', type=str, default='test')
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--max-side', type=int, default=512, help='Longest side for the fast decode variants')
+    parser.add_argument('--variants', nargs='+', choices=VARIANTS, default=list(VARIANTS))
+    parser.add_argument('--output', type=str, default=None, help='Write the report to this JSON file')
+    args = parser.parse_args()
+    logging.getLogger('app').setLevel(logging.WARNING)
+
+    model = PlantDiseaseModel()
+    asyncio.run(model.switch_plant(args.plant, args.checkpoint))
+    images = load_labelled(args.manifest, args.split, args.limit)
+    logger.info(f"{len(images)} images from {args.manifest} ({args.split})")
+
+    results = {}
+    for variant in args.variants:
+        max_side = args.max_side if variant.startswith('fast') else None
+        results[variant] = run_variant(model, images, max_side, variant.endswith('roi'))
+        r = results[variant]
+        logger.info(f"{variant:<9} acc {r['accuracy']:6.2f}%  cropped {r['cropped_fraction']:5.1%}  "
+                    f"decode {r['decode_median_ms']:7.2f} ms  total {r['total_median_ms']:7.2f} ms "
+                    f"(p95 {r['total_p95_ms']:7.2f})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'commit': git_commit(), 'config': {k: str(v) for k, v in vars(args).items()},
+                       'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Build or extend the similar-case embedding index served by ``/similar``.
+
+Embeds every image listed in the dataset manifests with the checkpoint the service
+serves (pooled pre-classifier features, the same as ``PlantDiseaseModel.embed``) and
+stores them with their labels in an ``EmbeddingIndex``. Rows are added in chunks, so
+memory stays flat however large the manifest; the IVF lists are trained afterwards
+on a sample of the stored vectors.
+
+    cd ml_service
+    python build_similarity_index.py tomato --manifests ../dataset/tomato_labels.csv \
+        --checkpoint ../ml_training/models/tomato/tomato_model_best.pth
+
+``--append`` adds new manifest rows to an existing index (assigned to the current
+IVF lists, no retraining); ``--retrain`` refits the lists after large appends.
+
+Images are decoded with the same ``DECODE_MAX_SIDE`` / ``LEAF_ROI_*`` settings as
+``/predict`` and ``/similar``, so run it with the service's environment. The settings
+are recorded in ``meta.json``; the service warns when they differ from its own, and
+``--append`` refuses to mix embeddings from different preprocessing.
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import time
+from pathlib import Path
+
+from app.config import settings
+from app.model import PlantDiseaseModel
+from app.preprocessing import preprocess_image, serving_preprocessing
+from app.similarity import EmbeddingIndex
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+def manifest_rows(manifests, plant):
+    for manifest in manifests:
+        with open(manifest, newline='') as f:
+            for row in csv.DictReader(f):
+                if row.get('plant_type', plant) != plant:
+                    continue
+                path = Path(row['image_path'].replace('\\', '/'))
+                path = path if path.is_absolute() else REPO_ROOT / path
+                if path.exists():
+                    yield path, row
+
+async def build(args):
+    model = PlantDiseaseModel()
+    await model.switch_plant(args.plant, args.checkpoint)
+    index_path = args.index or settings.similarity_index_path_for(args.plant)
+    dim = model.model.get_classifier().in_features
+    preprocessing = serving_preprocessing()
+    if args.append:
+        index = EmbeddingIndex(index_path)
+        recorded = index.meta.get('preprocessing')
+        if recorded != preprocessing:
+            raise SystemExit(f"{index_path} was built with preprocessing {recorded}, current settings give "
+                             f"{preprocessing}; rebuild it instead of appending")
+        seen = set()
+        if args.skip_existing:
+            seen = {item.get('image_path') for item in index.items(range(index.count)) if item}
+    else:
+        index = EmbeddingIndex.create(index_path, dim, model.model_version, model.architecture, preprocessing)
+        seen = set()
+
+    added, started = 0, time.perf_counter()
+    images, items = [], []
+
+    async def flush():
+        nonlocal added
+        if images:
+            index.add(await model.embed(images), items)
+            added += len(images)
+            logger.info(f"{added} images embedded ({added / (time.perf_counter() - started):.1f}/s)")
+            images.clear()
+            items.clear()
+
+    for path, row in manifest_rows(args.manifests, args.plant):
+        if str(path) in seen:
+            continue
+        # Same decode as /predict and /similar, so dataset and query embeddings are comparable
+        images.append(preprocess_image(path.read_bytes(), settings.DECODE_MAX_SIDE or None, settings.LEAF_ROI_ENABLED))
+        items.append({'image_path': str(path), 'label': row.get('label'), 'plant': args.plant,
+                      'disease': row.get('disease_type'), 'split': row.get('split'),
+                      'source': 'dataset', 'verified': True})
+        if len(images) >= args.batch_size:
+            await flush()
+    await flush()
+
+    if not args.append or args.retrain:
+        index.train(args.nlist)
+    logger.info(f"Index {index_path}: {index.count} vectors ({added} added), {index.nlist} IVF lists")
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description='Build the similar-case embedding index from labels CSVs')
+    parser.add_argument('plant', choices=['potato', 'tomato'])
+    parser.add_argument('--manifests', type=Path, nargs='+', required=True, help='dataset/*labels.csv files')
+    parser.add_argument('--checkpoint', type=str, default=None, help='Checkpoint to embed with (default: served one)')
+    parser.add_argument('--index', type=str, default=None, help='Index directory (default: from settings)')
+    parser.add_argument('--append', action='store_true', help='Add to an existing index instead of rebuilding')
+    parser.add_argument('--skip-existing', action='store_true', help='With --append, skip already indexed paths')
+    parser.add_argument('--retrain', action='store_true', help='With --append, refit the IVF lists afterwards')
+    parser.add_argument('--nlist', type=int, default=None, help='IVF lists (default: scaled to the index size)')
+    parser.add_argument('--batch-size', type=int, default=64)
+    args = parser.parse_args()
+    args.checkpoint = args.checkpoint or settings.model_path_for(args.plant)
+    logging.getLogger('app.model').setLevel(logging.WARNING)
+    asyncio.run(build(args))
+
+if __name__ == '__main__':
+    main()
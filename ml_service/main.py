@@ -1,19 +1,30 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi import Body
+from fastapi import Body, Depends, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
+import hmac
 import os
 import logging
+import time
+import asyncio
+from collections import Counter
+from typing import List, Optional
 from prometheus_fastapi_instrumentator import Instrumentator
 
 from app.model import PlantDiseaseModel
-from app.preprocessing import preprocess_image
+from app.registry import ModelRegistry
+from app.preprocessing import check_image_quality, preprocess_image
 from app.explain import generate_gradcam_explanation
-from app.config import settings
+from app.config import PLANT_NAME_PATTERN, settings
+from app.metrics import IN_FLIGHT, QUALITY_CHECKS, QUALITY_ISSUES, observe_stage
+from app.profiling import ProfilerBusy, profiler
+from app.admission import AdmissionController, DeadlineExceeded, Overloaded, request_deadline
+from app.logging_config import (REQUEST_ID_HEADER, configure_logging, incoming_request_id, request_id_var,
+                                sample_request, shutdown_logging)
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+configure_logging(settings.LOG_LEVEL, json_format=settings.LOG_FORMAT == "json")
 logger = logging.getLogger(__name__)
 
 # Set deterministic behavior for consistent predictions
@@ -50,42 +61,104 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """Attach the backend's correlation ID to every record and log one sampled summary per request"""
+    request_id = incoming_request_id(request.headers.get(REQUEST_ID_HEADER))
+    token = request_id_var.set(request_id)
+    sampled = sample_request(settings.LOG_SUCCESS_SAMPLE_RATE)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+    finally:
+        if sampled or status_code >= 400:
+            logger.log(
+                logging.WARNING if status_code >= 400 else logging.INFO,
+                "request completed",
+                extra={'method': request.method, 'path': request.url.path, 'status': status_code,
+                       'duration_ms': round((time.perf_counter() - start) * 1000, 2)}
+            )
+        request_id_var.reset(token)
+
 # Initialize Prometheus metrics
 instrumentator = Instrumentator()
 instrumentator.instrument(app).expose(app)
 
-# Global model instance
-model = None
+# Serves the active model; requests lease it for their whole duration (see app/registry.py)
+registry = ModelRegistry()
+
+async def served_model():
+    """Dependency yielding the model active when the request arrived (None before startup)"""
+    async with registry.lease() as leased:
+        yield leased
+
+# Bounds concurrent inferences and the queue behind them for /predict
+admission = AdmissionController(settings.MAX_IN_FLIGHT, settings.MAX_QUEUE)
+
+def primary_saturated() -> bool:
+    """True while every inference slot is taken; shadow batches wait meanwhile"""
+    return admission.in_flight >= admission.max_in_flight or admission.queued > 0
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize the model on startup"""
-    global model
     try:
         logger.info("Loading plant disease model...")
         model = PlantDiseaseModel()
-        await model.load_model(settings.MODEL_PATH)
+        startup_path = settings.POTATO_STUDENT_MODEL_PATH if settings.USE_STUDENT_MODEL else settings.MODEL_PATH
+        await model.load_model(startup_path)
+        if settings.CASCADE_ENABLED:
+            await model.load_cascade_model(settings.cascade_path_for('potato'))
+        registry.activate(model)
+        if settings.MODEL_WATCH_ENABLED:
+            registry.start_watching(settings.MODEL_WATCH_INTERVAL_S)
+        if settings.SHADOW_MODEL_PATH:
+            try:
+                await registry.start_shadow(settings.SHADOW_MODEL_PATH, settings.SHADOW_FRACTION, primary_saturated)
+            except Exception as e:
+                logger.error(f"Shadow model {settings.SHADOW_MODEL_PATH} not started: {e}")
         logger.info("Model loaded successfully!")
     except Exception as e:
         logger.error(f"Failed to load model: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await registry.stop()
+    shutdown_logging()
+
 @app.post("/model/switch")
 async def switch_model(plant: str = Body(..., embed=True)):
-    """Switch active plant model (potato/tomato)."""
-    if not model:
+    """Switch active plant model (potato/tomato).
+
+    The new model is loaded and self-tested alongside the current one, which keeps
+    serving until the swap and is released once its in-flight requests finish.
+    """
+    if not registry.active:
         raise HTTPException(status_code=503, detail="Model not loaded")
     try:
         plant_norm = plant.lower().strip()
-        if plant_norm == 'potato':
-            model_path = settings.POTATO_MODEL_PATH
-        elif plant_norm == 'tomato':
-            model_path = settings.TOMATO_MODEL_PATH
+        if plant_norm in ('potato', 'tomato'):
+            model_path = settings.model_path_for(plant_norm)
+        elif not PLANT_NAME_PATTERN.fullmatch(plant_norm):
+            raise HTTPException(status_code=400, detail="Invalid plant name. Use lowercase letters, digits, '_' and '-'.")
+        elif os.path.exists(settings.prototype_path_for(plant_norm)):
+            # Few-shot onboarded crop: served from its prototypes over the recorded backbone
+            model_path = None
         else:
-            raise HTTPException(status_code=400, detail="Unsupported plant. Use 'potato' or 'tomato'.")
+            raise HTTPException(status_code=400, detail="Unsupported plant. Use 'potato', 'tomato' or an onboarded crop.")
 
-        await model.switch_plant(plant_norm, model_path)
-        return {"success": True, "activePlant": plant_norm, "classes": model.class_names}
+        shadow = registry.shadow
+        model = await registry.switch(plant_norm, model_path)
+        response = {"success": True, "activePlant": plant_norm, "classes": model.class_names}
+        if shadow is not None and registry.shadow is not shadow:
+            # Shadow evaluation is per plant: report the final comparison of the one that stopped
+            response["shadowStopped"] = shadow.summary()
+        return response
     except HTTPException:
         raise
     except Exception as e:
@@ -97,14 +170,24 @@ async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "model_loaded": model is not None,
+        "model_loaded": registry.active is not None,
         "version": "1.0.0"
     }
 
 @app.post("/predict")
-async def predict_plant_disease(file: UploadFile = File(...)):
+async def predict_plant_disease(
+    request: Request,
+    file: UploadFile = File(...),
+    x_request_timeout_ms: Optional[float] = Header(None),
+    model: Optional[PlantDiseaseModel] = Depends(served_model)
+):
     """
     Predict plant disease from uploaded image
+
+    Requests beyond MAX_IN_FLIGHT + MAX_QUEUE get 503 with Retry-After; requests whose
+    X-Request-Timeout-Ms budget runs out before inference get 504 without being computed.
+    With QUALITY_GATE_MODE=reject, blurry, badly exposed, non-leaf or out-of-distribution
+    images get 422 listing the failed checks.
     """
     try:
         if not model:
@@ -114,14 +197,60 @@ async def predict_plant_disease(file: UploadFile = File(...)):
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
         
+        deadline = request_deadline(x_request_timeout_ms, settings.DEFAULT_REQUEST_TIMEOUT_S)
+        labels = (model.current_plant, model.model_version)
         # Read image data
-        image_data = await file.read()
+        with observe_stage('upload_read', *labels):
+            image_data = await file.read()
+        
+        async with admission.admit(deadline):
+            if await request.is_disconnected():
+                raise DeadlineExceeded("Client disconnected while queued")
+            with IN_FLIGHT.labels(*labels).track_inprogress():
+                # Preprocess image
+                with observe_stage('decode', *labels):
+                    processed_image = preprocess_image(image_data, settings.DECODE_MAX_SIDE or None,
+                                                       settings.LEAF_ROI_ENABLED)
+                
+                # Cheap quality gate: rejected images never reach the forward pass
+                quality = None
+                if settings.QUALITY_GATE_MODE != 'off':
+                    with observe_stage('quality', *labels):
+                        quality = check_image_quality(processed_image)
+                    if quality['issues'] and settings.QUALITY_GATE_MODE == 'reject':
+                        reject_low_quality(quality, labels[0])
+                
+                # Make prediction (transform, queue_wait, forward and postprocess are timed inside)
+                predict_started = time.perf_counter()
+                prediction_result = await model.predict(processed_image, deadline)
+                predict_seconds = time.perf_counter() - predict_started
+        
+        if quality is not None:
+            if prediction_result.get('ood'):
+                quality['issues'].append('out_of_distribution')
+                if settings.QUALITY_GATE_MODE == 'reject':
+                    reject_low_quality(quality, labels[0])
+            QUALITY_CHECKS.labels(labels[0], 'flagged' if quality['issues'] else 'passed').inc()
+            for issue in quality['issues']:
+                QUALITY_ISSUES.labels(labels[0], issue).inc()
+            quality['oodScore'] = prediction_result.get('ood_score')
         
-        # Preprocess image
-        processed_image = preprocess_image(image_data)
+        # Sampled requests are re-run on the shadow candidate later, off this request's path
+        shadow = registry.shadow
+        if shadow is not None and prediction_result.get('served_by') != 'prototypes':
+            shadow.submit(processed_image, prediction_result, model.current_plant, model.model_version, predict_seconds)
         
-        # Make prediction
-        prediction_result = await model.predict(processed_image)
+        index = model.similarity_index
+        if settings.SIMILARITY_APPEND_PREDICTIONS and index is not None and prediction_result.get('embedding') is not None:
+            await asyncio.to_thread(index.add, prediction_result['embedding'][None], [{
+                "source": "prediction",
+                "request_id": request_id_var.get(),
+                "label": prediction_result.get('predicted_class'),
+                "confidence": float(prediction_result['confidence']),
+                "model_version": model.model_version,
+                "verified": False,
+                "added": time.time(),
+            }])
         
         # Generate explanation if confidence is high enough
         explanation_url = None
@@ -149,35 +278,235 @@ async def predict_plant_disease(file: UploadFile = File(...)):
             "diseaseType": prediction_result['disease_type'],
             "predictedClass": prediction_result.get('predicted_class'),
             "allProbabilities": prediction_result.get('all_probabilities'),
+            "tta": prediction_result.get('tta', False),
+            "servedBy": prediction_result.get('served_by', 'full'),
+            "quality": quality,
             "modelAccuracy": getattr(model, 'model_val_accuracy', None),
             "explanation": explanation_url,
-            "model_version": "1.0.0"
+            "model_version": model.model_version
         }
         
     except HTTPException:
         raise
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error("Prediction failed", exc_info=True, extra={'error_type': type(e).__name__})
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.post("/similar")
+async def similar_cases(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    k: int = Query(5, ge=1, le=100),
+    nprobe: Optional[int] = Query(None, ge=1),
+    x_request_timeout_ms: Optional[float] = Header(None),
+    model: Optional[PlantDiseaseModel] = Depends(served_model)
+):
+    """
+    Past cases most similar to each uploaded leaf
+
+    All uploads are embedded in one batched forward pass and searched together. Each
+    result lists the ``k`` nearest indexed cases (cosine similarity and their stored
+    metadata) plus the label votes among them.
+    """
+    try:
+        if not model:
+            raise HTTPException(status_code=503, detail="Model not loaded")
+        index = model.similarity_index
+        if index is None or index.count == 0:
+            raise HTTPException(status_code=503, detail="Similarity index not available")
+        if len(files) > settings.SIMILARITY_MAX_BATCH:
+            raise HTTPException(status_code=400, detail=f"At most {settings.SIMILARITY_MAX_BATCH} images per request")
+        if any(not f.content_type.startswith('image/') for f in files):
+            raise HTTPException(status_code=400, detail="Files must be images")
+        
+        deadline = request_deadline(x_request_timeout_ms, settings.DEFAULT_REQUEST_TIMEOUT_S)
+        labels = (model.current_plant, model.model_version)
+        with observe_stage('upload_read', *labels):
+            uploads = [await f.read() for f in files]
+        
+        async with admission.admit(deadline):
+            if await request.is_disconnected():
+                raise DeadlineExceeded("Client disconnected while queued")
+            with IN_FLIGHT.labels(*labels).track_inprogress():
+                with observe_stage('decode', *labels):
+                    images = [preprocess_image(data, settings.DECODE_MAX_SIDE or None, settings.LEAF_ROI_ENABLED)
+                              for data in uploads]
+                embeddings = await model.embed(images, deadline)
+        
+        # Scanning the memory map is CPU-bound; keep it off the event loop
+        with observe_stage('similarity_search', *labels):
+            scores, ids = await asyncio.to_thread(index.search, embeddings, k, nprobe or settings.SIMILARITY_NPROBE)
+            items = await asyncio.to_thread(index.items, ids.ravel())
+        
+        results = []
+        for i, upload in enumerate(files):
+            neighbors = [dict(item, id=int(row), score=float(score))
+                         for row, score, item in zip(ids[i], scores[i], items[i * k:(i + 1) * k]) if item is not None]
+            votes = Counter(n.get('label') for n in neighbors if n.get('label'))
+            results.append({"filename": upload.filename, "neighbors": neighbors, "votes": dict(votes)})
+        return {"results": results, "indexSize": index.count, "model_version": model.model_version}
+    
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
-        logger.error(f"Prediction error: {e}")
-        logger.error(f"Error type: {type(e).__name__}")
-        logger.error(f"Error details: {str(e)}")
+        logger.error("Similarity search failed", exc_info=True, extra={'error_type': type(e).__name__})
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+def reject_low_quality(quality: dict, plant: str):
+    QUALITY_CHECKS.labels(plant, 'rejected').inc()
+    for issue in quality['issues']:
+        QUALITY_ISSUES.labels(plant, issue).inc()
+    raise HTTPException(status_code=422, detail={
+        "message": "Image failed quality checks",
+        "issues": quality['issues'],
+        "metrics": quality['metrics'],
+    })
+
+@app.post("/predict/tiled")
+async def predict_tiled(
+    request: Request,
+    file: UploadFile = File(...),
+    x_request_timeout_ms: Optional[float] = Header(None),
+    model: Optional[PlantDiseaseModel] = Depends(served_model)
+):
+    """
+    Tiled prediction for high-resolution photos with several leaves
+
+    Returns per-tile disease probabilities as a coarse heatmap (rows x cols, None for
+    background tiles) and an aggregate verdict. The tile count is capped by TILE_MAX_COUNT.
+    """
+    try:
+        if not model:
+            raise HTTPException(status_code=503, detail="Model not loaded")
+        if not file.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail="File must be an image")
+        
+        deadline = request_deadline(x_request_timeout_ms, settings.DEFAULT_REQUEST_TIMEOUT_S)
+        labels = (model.current_plant, model.model_version)
+        with observe_stage('upload_read', *labels):
+            image_data = await file.read()
+        
+        async with admission.admit(deadline):
+            if await request.is_disconnected():
+                raise DeadlineExceeded("Client disconnected while queued")
+            with IN_FLIGHT.labels(*labels).track_inprogress():
+                # Full resolution: lesion detail is the point of tiling
+                with observe_stage('decode', *labels):
+                    processed_image = preprocess_image(image_data)
+                result = await model.predict_tiled(processed_image, deadline)
+        
+        return {
+            "prediction": result['prediction'],
+            "confidence": float(result['confidence']),
+            "plantType": result['plant_type'],
+            "diseaseType": result['disease_type'],
+            "predictedClass": result['predicted_class'],
+            "heatmap": result['heatmap'],
+            "grid": result['grid'],
+            "diseasedFraction": result['diseased_fraction'],
+            "model_version": model.model_version
+        }
+    
+    except HTTPException:
+        raise
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error("Tiled prediction failed", exc_info=True, extra={'error_type': type(e).__name__})
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/model/info")
-async def model_info():
+async def model_info(model: Optional[PlantDiseaseModel] = Depends(served_model)):
     """Get model information"""
     if not model:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     return {
         "model_name": "Plant Disease Classifier",
-        "version": "1.0.0",
-        "architecture": "EfficientNet-B0",
+        "version": model.model_version,
+        "architecture": model.architecture,
         "num_classes": len(model.class_names),
         "class_names": model.class_names,
-        "input_size": (224, 224),
+        "input_size": (model.input_size, model.input_size),
+        "mode": "prototypes" if model.prototypes is not None else "classifier",
         "supported_formats": ["jpg", "jpeg", "png", "gif", "webp"]
     }
 
+def require_admin(token: str):
+    """Admin endpoints answer 404 when no ADMIN_TOKEN is set and 403 on a wrong token"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(token.encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/admin/profile")
+async def profile_service(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(5.0, ge=1.0, le=100.0),
+    torch_ops: bool = Query(True),
+    format: str = Query("json", pattern="^(json|folded)$"),
+    x_admin_token: str = Header("")
+):
+    """Sample all thread stacks (and torch operators during inference) for ``seconds``.
+
+    ``format=folded`` returns collapsed stacks for flamegraph.pl/speedscope directly.
+    """
+    require_admin(x_admin_token)
+    seconds = min(seconds, settings.PROFILE_MAX_SECONDS)
+    try:
+        result = await profiler.run(seconds, interval_ms / 1000.0, torch_ops)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "folded":
+        return PlainTextResponse(result['folded'])
+    return result
+
+@app.get("/model/shadow")
+async def shadow_report():
+    """Agreement, confidence deltas and latency of the shadow candidate against the served model"""
+    shadow = registry.shadow
+    if shadow is None:
+        return {"enabled": False}
+    return {"enabled": True, **shadow.summary()}
+
+@app.post("/admin/shadow")
+async def start_shadow(
+    path: str = Body(..., embed=True),
+    fraction: float = Body(None, embed=True, gt=0, le=1),
+    x_admin_token: str = Header("")
+):
+    """Start (or replace) shadow evaluation of the checkpoint at ``path`` for the active plant"""
+    require_admin(x_admin_token)
+    if not registry.active:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    try:
+        shadow = await registry.start_shadow(path, fraction or settings.SHADOW_FRACTION, primary_saturated)
+    except Exception as e:
+        logger.error(f"Failed to start shadow model: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"enabled": True, **shadow.summary()}
+
+@app.delete("/admin/shadow")
+async def stop_shadow(x_admin_token: str = Header("")):
+    """Stop shadow evaluation; returns the final report"""
+    require_admin(x_admin_token)
+    shadow = registry.shadow
+    if shadow is None:
+        return {"enabled": False}
+    report = shadow.summary()
+    await registry.stop_shadow()
+    return {"enabled": False, **report}
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
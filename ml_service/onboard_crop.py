@@ -0,0 +1,143 @@
+"""Onboard a new crop from a few hundred labelled images, without training.
+
+Embeds the images with an existing trained backbone (decoding on a thread pool while
+the model embeds the previous batch), stores one prototype per class and writes
+``<PROTOTYPE_DIR>/<plant>_prototypes.npz``. From then on ``/model/switch`` accepts
+the crop and serves it by nearest-prototype classification until a trained head
+replaces it.
+
+Labels come from a manifest CSV (``image_path,label``) or from one sub-directory per
+class. Class names should follow ``healthy_<plant>`` / ``<disease>_<plant>`` so the
+service maps them to healthy/diseased:
+
+    cd ml_service
+    python onboard_crop.py pepper --image-dir ../dataset/pepper --holdout 0.2
+    python onboard_crop.py pepper --manifest ../dataset/pepper_labels.csv
+
+With ``--holdout`` a stratified fraction is classified against prototypes built
+from the rest and the accuracy is reported (and stored) before all images are used.
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from app.config import settings
+from app.model import PlantDiseaseModel, build_inference_transform
+from app.preprocessing import preprocess_image
+from app.prototypes import PrototypeClassifier
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.webp')
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+def labelled_images(args):
+    """``(path, label)`` pairs from the manifest or the per-class directories"""
+    if args.manifest:
+        with open(args.manifest, newline='') as f:
+            rows = [(Path(r['image_path'].replace('\\', '/')), r['label']) for r in csv.DictReader(f)]
+        rows = [(p if p.is_absolute() else REPO_ROOT / p, label) for p, label in rows]
+    else:
+        rows = [(p, d.name) for d in sorted(Path(args.image_dir).iterdir()) if d.is_dir()
+                for p in sorted(d.iterdir()) if p.suffix.lower() in IMAGE_SUFFIXES]
+    rows = [(p, label) for p, label in rows if p.exists()]
+    by_class = {}
+    for path, label in rows:
+        by_class.setdefault(label, []).append(path)
+    rng = random.Random(args.seed)
+    selected = []
+    for label, paths in sorted(by_class.items()):
+        rng.shuffle(paths)
+        selected.extend((p, label) for p in paths[:args.per_class_limit])
+    return selected
+
+async def extract_embeddings(model, paths, batch_size, workers):
+    """Embeddings of ``paths``; decoding batch i+1 overlaps with embedding batch i"""
+    loop = asyncio.get_running_loop()
+    embeddings = []
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='decode') as pool:
+        def decode(batch):
+            return list(pool.map(lambda p: preprocess_image(p.read_bytes(), settings.DECODE_MAX_SIDE or None), batch))
+        pending = loop.run_in_executor(None, decode, batches[0]) if batches else None
+        for i in range(len(batches)):
+            images = await pending
+            if i + 1 < len(batches):
+                pending = loop.run_in_executor(None, decode, batches[i + 1])
+            embeddings.append(await model.embed(images))
+            logger.info(f"Embedded {sum(len(e) for e in embeddings)}/{len(paths)} images")
+    return np.concatenate(embeddings)
+
+def holdout_accuracy(embeddings, labels, backbone, fraction, seed):
+    """Accuracy of prototypes built from a stratified (1 - fraction) split on the rest"""
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    test = np.zeros(len(labels), bool)
+    for name in np.unique(labels):
+        idx = np.nonzero(labels == name)[0]
+        n_test = int(round(len(idx) * fraction))
+        if 0 < n_test < len(idx):
+            test[rng.choice(idx, n_test, replace=False)] = True
+    if not test.any():
+        return None
+    classifier = PrototypeClassifier.from_embeddings(embeddings[~test], labels[~test].tolist(), backbone)
+    probabilities = classifier.probabilities(torch.from_numpy(embeddings[test]))
+    predicted = np.asarray(classifier.class_names)[probabilities.argmax(1).numpy()]
+    return 100.0 * float((predicted == labels[test]).mean())
+
+async def onboard(args):
+    images = labelled_images(args)
+    if not images:
+        raise SystemExit("No labelled images found")
+    paths, labels = [p for p, _ in images], [label for _, label in images]
+    counts = {name: labels.count(name) for name in sorted(set(labels))}
+    logger.info(f"Onboarding {args.plant}: {len(paths)} images, classes {counts}")
+
+    model = PlantDiseaseModel()
+    model.model, model.architecture, model.input_size, model.model_version = model.load_backbone(args.backbone)
+    model.transform = build_inference_transform(model.input_size)
+    embeddings = await extract_embeddings(model, paths, args.batch_size, args.workers)
+
+    metadata = {'plant': args.plant, 'backbone_architecture': model.architecture,
+                'backbone_version': model.model_version}
+    if args.holdout:
+        accuracy = holdout_accuracy(embeddings, labels, args.backbone, args.holdout, args.seed)
+        if accuracy is not None:
+            metadata['holdout_accuracy'] = accuracy
+            logger.info(f"Hold-out accuracy ({args.holdout:.0%} per class): {accuracy:.2f}%")
+    classifier = PrototypeClassifier.from_embeddings(embeddings, labels, str(Path(args.backbone).resolve()),
+                                                     args.temperature, metadata)
+    output = args.output or settings.prototype_path_for(args.plant)
+    classifier.save(output)
+    logger.info(f"Prototypes for {classifier.class_names} written to {output}")
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description='Onboard a crop by nearest-prototype classification')
+    parser.add_argument('plant', type=str, help='Name of the new crop (used by /model/switch)')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--manifest', type=Path, help='CSV with image_path,label columns')
+    source.add_argument('--image-dir', type=Path, help='Directory with one sub-directory of images per class')
+    parser.add_argument('--backbone', type=str, default=settings.POTATO_MODEL_PATH,
+                        help='Trained checkpoint whose embeddings the prototypes live in')
+    parser.add_argument('--per-class-limit', type=int, default=500)
+    parser.add_argument('--holdout', type=float, default=0.0, help='Per-class fraction held out to report accuracy')
+    parser.add_argument('--temperature', type=float, default=0.05, help='Softmax temperature over cosine similarity')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=4, help='Decode threads')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None, help='Default: <PROTOTYPE_DIR>/<plant>_prototypes.npz')
+    args = parser.parse_args()
+    args.plant = args.plant.lower().strip()
+    logging.getLogger('app.model').setLevel(logging.WARNING)
+    asyncio.run(onboard(args))
+
+if __name__ == '__main__':
+    main()
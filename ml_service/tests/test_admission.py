@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+import pytest
+
+from app.admission import AdmissionController, DeadlineExceeded, Overloaded
+
+async def hold(controller, started, release, deadline=None):
+    async with controller.admit(deadline or time.monotonic() + 5):
+        started.append(len(started))
+        await release.wait()
+
+@pytest.mark.asyncio
+async def test_full_queue_is_shed_with_retry_after():
+    """Requests beyond in-flight plus queue capacity fail fast"""
+    controller = AdmissionController(max_in_flight=1, max_queue=1)
+    started, release = [], asyncio.Event()
+    tasks = [asyncio.create_task(hold(controller, started, release)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(Overloaded) as excinfo:
+        async with controller.admit(time.monotonic() + 5):
+            pass
+    assert excinfo.value.retry_after >= 1
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert started == [0, 1]
+    assert controller.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_queued_request_expires_at_its_deadline():
+    """Queued work whose deadline passes is dropped and never runs"""
+    controller = AdmissionController(max_in_flight=1, max_queue=4)
+    started, release = [], asyncio.Event()
+    holder = asyncio.create_task(hold(controller, started, release))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(DeadlineExceeded):
+        await hold(controller, started, release, deadline=time.monotonic() + 0.05)
+
+    release.set()
+    await holder
+    assert started == [0]
+    assert controller.in_flight == 0 and controller.queued == 0
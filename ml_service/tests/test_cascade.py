@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+import pytest
+import timm
+import torch
+
+from app.admission import DeadlineExceeded
+from app.cascade import EscalationBatcher
+from app.config import settings
+from app.model import PlantDiseaseModel
+
+@pytest.mark.asyncio
+async def test_escalations_are_batched_and_expired_ones_dropped():
+    batches = []
+
+    async def run_batch(batch):
+        batches.append(batch.shape[0])
+        return batch.flatten(1)[:, :2]
+
+    batcher = EscalationBatcher(run_batch, max_batch=2, max_wait=0.01)
+    inputs = [torch.full((1, 1, 2, 2), float(i)) for i in range(3)]
+    outputs = await asyncio.gather(*(batcher.submit(x) for x in inputs))
+    assert batches == [2, 1]
+    assert [o[0, 0].item() for o in outputs] == [0.0, 1.0, 2.0]
+
+    with pytest.raises(DeadlineExceeded):
+        await batcher.submit(inputs[0], deadline=time.monotonic() - 1)
+    assert batches == [2, 1]
+
+@pytest.mark.asyncio
+async def test_cascade_escalates_below_threshold(monkeypatch):
+    model = PlantDiseaseModel()
+    model.model = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2).eval()
+    model.cascade_model = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2).eval()
+    model.cascade_transform = model.transform
+    image = (torch.rand(64, 64, 3) * 255).byte().numpy()
+
+    monkeypatch.setattr(settings, 'CASCADE_CONFIDENCE_THRESHOLD', 0.0)
+    assert (await model.predict(image))['served_by'] == 'cascade'
+
+    monkeypatch.setattr(settings, 'CASCADE_CONFIDENCE_THRESHOLD', 1.01)
+    results = await asyncio.gather(model.predict(image), model.predict(image))
+    assert [r['served_by'] for r in results] == ['escalated', 'escalated']
@@ -0,0 +1,35 @@
+import json
+import logging
+
+from app.logging_config import (JsonFormatter, RequestContextFilter, RequestSamplingFilter, request_id_var,
+                                request_sampled_var)
+
+def make_record(level=logging.INFO, **extra):
+    record = logging.LogRecord('app.test', level, __file__, 1, 'hello %s', ('world',), None)
+    record.__dict__.update(extra)
+    return record
+
+def test_json_records_carry_request_id_and_extra_fields():
+    """Records are one JSON object with the correlation ID and ``extra`` keys"""
+    token = request_id_var.set('req-1')
+    try:
+        record = make_record(status=200)
+        RequestContextFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+
+    payload = json.loads(JsonFormatter().format(record))
+    assert payload['msg'] == 'hello world'
+    assert payload['request_id'] == 'req-1'
+    assert payload['status'] == 200
+
+def test_unsampled_requests_keep_only_warnings():
+    """INFO records of unsampled requests are dropped; warnings always pass"""
+    sampling = RequestSamplingFilter()
+    token = request_sampled_var.set(False)
+    try:
+        assert not sampling.filter(make_record(logging.INFO))
+        assert sampling.filter(make_record(logging.WARNING))
+    finally:
+        request_sampled_var.reset(token)
+    assert sampling.filter(make_record(logging.INFO))
@@ -32,3 +32,30 @@ async def test_predict_endpoint_no_file():
     """Test prediction endpoint with no file"""
     response = client.post("/predict")
     assert response.status_code == 422  # Validation error
+
+def test_admin_profile_requires_token():
+    """Profiling endpoint is hidden without ADMIN_TOKEN and rejects wrong tokens"""
+    from app.config import settings
+    response = client.post("/admin/profile?seconds=0.1")
+    assert response.status_code == 404
+
+    settings.ADMIN_TOKEN = "secret"
+    try:
+        response = client.post("/admin/profile?seconds=0.1", headers={"X-Admin-Token": "wrong"})
+        assert response.status_code == 403
+        response = client.post("/admin/profile?seconds=0.1", headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200
+        assert response.json()["samples"] > 0
+    finally:
+        settings.ADMIN_TOKEN = ""
+
+def test_request_id_is_propagated():
+    """The backend's correlation ID is echoed back, and one is minted when absent"""
+    response = client.get("/health", headers={"X-Request-ID": "backend-123"})
+    assert response.headers["X-Request-ID"] == "backend-123"
+    assert client.get("/health").headers["X-Request-ID"]
+
+def test_malformed_request_id_is_replaced():
+    for bad in ("a" * 129, "id with spaces", "x;rm -rf", "line\\nbreak"):
+        echoed = client.get("/health", headers={"X-Request-ID": bad}).headers["X-Request-ID"]
+        assert echoed != bad and len(echoed) == 32
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import timm
+from prometheus_client import REGISTRY
+
+from app.config import settings
+from app.metrics import STAGES, observe_stage
+from app.model import PlantDiseaseModel
+
+def stage_count(stage, model_version):
+    labels = {'stage': stage, 'plant': 'potato', 'model_version': model_version}
+    return REGISTRY.get_sample_value('plant_predict_stage_seconds_count', labels) or 0.0
+
+def test_observe_stage_records_histogram_sample():
+    """Stage timers add one observation under the stage, plant and model version labels"""
+    before = stage_count('decode', 'test')
+
+    with observe_stage('decode', 'potato', 'test'):
+        pass
+
+    assert stage_count('decode', 'test') == before + 1
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('cascade_threshold', [None, 0.0, 1.01])
+async def test_predict_records_transform_once(monkeypatch, cascade_threshold):
+    """Plain, cascade-accepted and escalated predictions each add one 'transform' observation"""
+    model = PlantDiseaseModel()
+    model.model = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2).eval()
+    model.model_version = f'transform-{cascade_threshold}'
+    if cascade_threshold is not None:
+        model.cascade_model = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2).eval()
+        model.cascade_transform = model.transform
+        monkeypatch.setattr(settings, 'CASCADE_CONFIDENCE_THRESHOLD', cascade_threshold)
+    monkeypatch.setattr(settings, 'TTA_ENABLED', False)
+    image = np.random.default_rng(0).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+
+    for expected in (1, 2):
+        await model.predict(image)
+        assert stage_count('transform', model.model_version) == expected
+
+def test_predict_endpoint_observes_each_stage_once(monkeypatch):
+    """One /predict request adds exactly one sample to every stage it passes through"""
+    import io
+    from fastapi.testclient import TestClient
+    from PIL import Image
+    from main import app, served_model
+
+    model = PlantDiseaseModel()
+    model.model = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2).eval()
+    model.model_version = 'stages'
+
+    async def tiny_model():
+        yield model
+    app.dependency_overrides[served_model] = tiny_model
+    monkeypatch.setattr(settings, 'QUALITY_GATE_MODE', 'flag')
+    monkeypatch.setattr(settings, 'TTA_ENABLED', False)
+    upload = io.BytesIO()
+    Image.fromarray(np.full((96, 96, 3), (60, 140, 50), np.uint8)).save(upload, format='PNG')
+
+    expected = ('upload_read', 'decode', 'quality', 'transform', 'queue_wait', 'forward', 'postprocess')
+    try:
+        response = TestClient(app).post('/predict', files={'file': ('leaf.png', upload.getvalue(), 'image/png')})
+    finally:
+        app.dependency_overrides.pop(served_model)
+    assert response.status_code == 200
+    assert {stage: stage_count(stage, 'stages') for stage in STAGES} == \
+        {stage: 1.0 if stage in expected else 0.0 for stage in STAGES}
+
+def test_unknown_stage_is_rejected():
+    with pytest.raises(ValueError):
+        with observe_stage('explanation', 'potato', 'test'):
+            pass
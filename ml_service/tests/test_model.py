@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+import timm
+import torch
+
+from app.config import settings
+from app.model import PlantDiseaseModel, build_tta_views, tile_grid
+from app.prototypes import PrototypeClassifier
+from app.pruning import shrink_inverted_residual
+
+@pytest.mark.asyncio
+async def test_load_model_uses_checkpoint_architecture(tmp_path):
+    """Student checkpoints record their architecture and input size"""
+    student = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2)
+    checkpoint_path = tmp_path / 'potato_student_best.pth'
+    torch.save({
+        'model_state_dict': student.state_dict(),
+        'class_names': ['diseased_potato', 'healthy_potato'],
+        'model_name': 'mobilenetv3_small_100',
+        'input_size': 160,
+    }, checkpoint_path)
+
+    model = PlantDiseaseModel()
+    await model.load_model(str(checkpoint_path))
+
+    assert model.architecture == 'mobilenetv3_small_100'
+    assert model.input_size == 160
+    assert model.transform.transforms[1].size == (160, 160)
+
+@pytest.mark.asyncio
+async def test_load_model_applies_pruning_spec(tmp_path):
+    """Pruned checkpoints load into a network narrowed to the recorded widths"""
+    pruned = timm.create_model('efficientnet_b0', pretrained=False, num_classes=2).eval()
+    block = pruned.blocks[1][0]
+    shrink_inverted_residual(block, torch.tensor([0, 5, 17, 42, 50, 63, 70, 90]))
+    pruned.blocks[2][1] = torch.nn.Identity()
+    spec = {'expansion_channels': {'blocks.1.0': 8}, 'dropped_blocks': ['blocks.2.1']}
+    checkpoint_path = tmp_path / 'potato_pruned_best.pth'
+    torch.save({
+        'model_state_dict': pruned.state_dict(),
+        'class_names': ['diseased_potato', 'healthy_potato'],
+        'model_name': 'efficientnet_b0',
+        'pruning': spec,
+    }, checkpoint_path)
+
+    model = PlantDiseaseModel()
+    await model.load_model(str(checkpoint_path))
+
+    x = torch.randn(1, 3, 224, 224)
+    assert model.model.blocks[1][0].conv_dw.groups == 8
+    assert torch.allclose(model.model(x), pruned(x), atol=1e-5)
+
+@pytest.mark.asyncio
+async def test_tta_only_below_confidence_threshold(monkeypatch):
+    """Low-confidence predictions average the flipped/rotated views in one extra pass"""
+    model = PlantDiseaseModel()
+    model.model = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2).eval()
+    image = (torch.rand(64, 64, 3) * 255).byte().numpy()
+    monkeypatch.setattr(settings, 'TTA_ENABLED', True)
+
+    monkeypatch.setattr(settings, 'TTA_CONFIDENCE_THRESHOLD', 0.0)
+    assert (await model.predict(image))['tta'] is False
+
+    monkeypatch.setattr(settings, 'TTA_CONFIDENCE_THRESHOLD', 1.01)
+    result = await model.predict(image)
+    assert result['tta'] is True
+    assert sum(result['all_probabilities']) == pytest.approx(1.0, abs=1e-5)
+
+    x = torch.arange(4.0).view(1, 1, 2, 2)
+    views = build_tta_views(x, ['hflip', 'rot90'])
+    assert views.shape == (2, 1, 2, 2)
+    assert views[0].flatten().tolist() == [1.0, 0.0, 3.0, 2.0]
+
+@pytest.mark.asyncio
+async def test_tta_skipped_once_deadline_has_passed(monkeypatch):
+    """An answer computed before the deadline is returned without TTA rather than failing"""
+    model = PlantDiseaseModel()
+    model.model = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2).eval()
+    image = (torch.rand(64, 64, 3) * 255).byte().numpy()
+    monkeypatch.setattr(settings, 'TTA_ENABLED', True)
+    monkeypatch.setattr(settings, 'TTA_CONFIDENCE_THRESHOLD', 1.01)
+    run_forward = model._run_forward
+
+    async def slow_forward(*args, **kwargs):
+        outputs = await run_forward(*args, **kwargs)
+        await asyncio.sleep(0.1)
+        return outputs
+
+    monkeypatch.setattr(model, '_run_forward', slow_forward)
+    result = await model.predict(image, deadline=time.monotonic() + 0.05)
+    assert result['tta'] is False
+
+def test_tile_grid_is_capped_and_covers_image():
+    boxes, rows, cols = tile_grid(3000, 4000, 512, 0.25, 16)
+    assert rows * cols == len(boxes) <= 16
+    assert boxes[0][:2] == (0, 0)
+    assert boxes[-1][2:] == (4000, 3000)
+    assert tile_grid(200, 300, 512, 0.25, 16)[0] == [(0, 0, 300, 200)]
+
+@pytest.mark.asyncio
+async def test_predict_tiled_returns_heatmap():
+    model = PlantDiseaseModel()
+    model.model = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2).eval()
+    image = np.zeros((900, 1200, 3), np.uint8)
+    image[..., 1] = 160
+    result = await model.predict_tiled(image)
+    assert result['prediction'] in ('healthy', 'diseased')
+    assert len(result['heatmap']) == result['grid']['rows']
+    assert all(len(row) == result['grid']['cols'] for row in result['heatmap'])
+
+@pytest.mark.asyncio
+async def test_switch_to_onboarded_crop_uses_prototypes(tmp_path, monkeypatch):
+    backbone = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2)
+    checkpoint_path = tmp_path / 'backbone.pth'
+    torch.save({'model_state_dict': backbone.state_dict(), 'class_names': ['diseased_potato', 'healthy_potato'],
+                'model_name': 'mobilenetv3_small_100'}, checkpoint_path)
+    dim = backbone.get_classifier().in_features
+    embeddings = np.random.default_rng(0).normal(size=(6, dim))
+    classifier = PrototypeClassifier.from_embeddings(embeddings, ['healthy_pepper'] * 3 + ['spot_pepper'] * 3,
+                                                     str(checkpoint_path))
+    monkeypatch.setattr(settings, 'PROTOTYPE_DIR', str(tmp_path))
+    classifier.save(settings.prototype_path_for('pepper'))
+
+    model = PlantDiseaseModel()
+    await model.switch_plant('pepper')
+    result = await model.predict((np.random.rand(64, 64, 3) * 255).astype(np.uint8))
+
+    assert model.class_names == ['healthy_pepper', 'spot_pepper']
+    assert result['served_by'] == 'prototypes'
+    assert result['plant_type'] == 'pepper'
+    assert sum(result['all_probabilities']) == pytest.approx(1.0, abs=1e-5)
+
+@pytest.mark.asyncio
+async def test_switch_rejects_plant_names_outside_prototype_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'PROTOTYPE_DIR', str(tmp_path / 'prototypes'))
+    for name in ('../../../tmp/evil', '..', 'Pepper/../x', ''):
+        with pytest.raises(ValueError):
+            settings.prototype_path_for(name)
+    with pytest.raises(ValueError):
+        await PlantDiseaseModel().switch_plant('../../../tmp/evil')
+
+@pytest.mark.asyncio
+async def test_self_test_leaves_serving_metrics_alone(monkeypatch):
+    """Warm-up of a new model must not show up as production traffic"""
+    from prometheus_client import REGISTRY
+    model = PlantDiseaseModel()
+    model.model = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2).eval()
+    model.model_version = 'self-test'
+    monkeypatch.setattr(settings, 'TTA_ENABLED', True)
+    monkeypatch.setattr(settings, 'TTA_CONFIDENCE_THRESHOLD', 1.01)
+
+    await model.self_test(runs=2)
+
+    labels = {'plant': model.current_plant, 'model_version': 'self-test'}
+    assert REGISTRY.get_sample_value('plant_predict_stage_seconds_count', {'stage': 'forward', **labels}) is None
+    assert REGISTRY.get_sample_value('plant_predict_tta_total', labels) is None
@@ -0,0 +1,35 @@
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.preprocessing import check_image_quality, leaf_bounding_box, preprocess_image
+
+def leaf_image(size=512):
+    rng = np.random.default_rng(0)
+    image = np.zeros((size, size, 3), np.uint8)
+    image[..., 1] = rng.integers(90, 200, (size, size))
+    image[..., 0] = rng.integers(20, 60, (size, size))
+    return image
+
+def test_quality_gate_passes_sharp_leaf():
+    assert check_image_quality(leaf_image())['issues'] == []
+
+def test_quality_gate_flags_blur_exposure_and_non_leaf():
+    leaf = leaf_image()
+    assert 'blurry' in check_image_quality(cv2.GaussianBlur(leaf, (31, 31), 10))['issues']
+    assert 'underexposed' in check_image_quality((leaf * 0.1).astype(np.uint8))['issues']
+    sky = np.full((400, 600, 3), (90, 140, 230), np.uint8)
+    assert 'not_leaf' in check_image_quality(sky)['issues']
+
+def test_leaf_roi_crops_small_leaf_at_reduced_resolution():
+    frame = np.full((1200, 1600, 3), (120, 110, 100), np.uint8)
+    cv2.ellipse(frame, (1100, 400), (150, 100), 30, 0, 360, (40, 150, 40), -1)
+    buffer = io.BytesIO()
+    Image.fromarray(frame).save(buffer, format='JPEG', quality=90)
+
+    cropped = preprocess_image(buffer.getvalue(), max_side=400, leaf_roi=True)
+    assert max(cropped.shape[:2]) < 200
+    assert abs(cropped.shape[0] - cropped.shape[1]) <= 2
+    assert leaf_bounding_box(np.full((300, 300, 3), (90, 140, 230), np.uint8)) is None
@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+import torch
+
+from app.profiling import ProfilerBusy, ProfilingController
+
+@pytest.mark.asyncio
+async def test_profile_collects_stacks_and_torch_operators():
+    """Forward passes during a session show up in the operator breakdown"""
+    controller = ProfilingController()
+    assert controller.forward_context() is controller.forward_context()  # shared no-op when idle
+
+    async def infer():
+        while not controller.active:
+            await asyncio.sleep(0)
+        with controller.forward_context():
+            torch.nn.functional.relu(torch.randn(8, 8))
+
+    result, _ = await asyncio.gather(controller.run(0.2, interval=0.01), infer())
+
+    assert result['samples'] > 0
+    assert 'MainThread' in result['folded']
+    assert result['forward_passes'] == 1
+    assert any(op['operator'] == 'aten::relu' for op in result['torch_operators'])
+
+@pytest.mark.asyncio
+async def test_concurrent_profiles_are_rejected():
+    """Only one session runs at a time"""
+    controller = ProfilingController()
+    first = asyncio.create_task(controller.run(0.2, include_torch=False))
+    await asyncio.sleep(0.05)
+    with pytest.raises(ProfilerBusy):
+        await controller.run(0.1)
+    await first
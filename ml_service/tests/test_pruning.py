@@ -0,0 +1,39 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+import timm
+import torch
+
+from app import pruning
+
+# Pruned checkpoints are written by ml_training and read here; the format must agree
+TRAINING_SPEC = Path(__file__).resolve().parents[2] / 'ml_training' / 'pruning_spec.py'
+
+@pytest.fixture(scope='module')
+def training_spec():
+    if not TRAINING_SPEC.exists():
+        pytest.skip('ml_training is not part of this checkout')
+    spec = importlib.util.spec_from_file_location('ml_training_pruning_spec', TRAINING_SPEC)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def prune(writer):
+    model = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2).eval()
+    writer.shrink_inverted_residual(model.blocks[1][0], torch.tensor([0, 5, 17, 42, 50, 63, 70, 71]))
+    model.blocks[2][1] = torch.nn.Identity()
+    spec = {'expansion_channels': {'blocks.1.0': 8}, 'dropped_blocks': ['blocks.2.1']}
+    return model, spec
+
+@pytest.mark.parametrize('direction', ['training_to_service', 'service_to_training'])
+def test_pruning_spec_round_trips_between_training_and_service(training_spec, direction):
+    writer, reader = (training_spec, pruning) if direction == 'training_to_service' else (pruning, training_spec)
+    pruned, spec = prune(writer)
+
+    rebuilt = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2).eval()
+    reader.apply_pruning_spec(rebuilt, spec)
+    rebuilt.load_state_dict(pruned.state_dict())
+
+    x = torch.randn(2, 3, 96, 96)
+    assert torch.allclose(rebuilt(x), pruned(x), atol=1e-5)
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+import timm
+import torch
+
+from app.model import PlantDiseaseModel
+from app.registry import ModelRegistry
+
+def save_checkpoint(path, version):
+    network = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2)
+    torch.save({
+        'model_state_dict': network.state_dict(),
+        'class_names': ['diseased_potato', 'healthy_potato'],
+        'model_name': 'mobilenetv3_small_100',
+        'model_version': version,
+    }, path)
+
+@pytest.mark.asyncio
+async def test_previous_model_released_only_after_leases_drain():
+    """Swapping is immediate for new requests; the old model survives until its requests finish"""
+    registry = ModelRegistry()
+    old, new = PlantDiseaseModel(), PlantDiseaseModel()
+    old.model = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2).eval()
+    registry.activate(old)
+
+    async with registry.lease() as leased:
+        registry.activate(new, 'switch')
+        await asyncio.sleep(0.2)
+        assert leased is old and old.model is not None
+        async with registry.lease() as fresh:
+            assert fresh is new
+    await asyncio.sleep(0.2)
+    assert old.model is None
+
+@pytest.mark.asyncio
+async def test_watcher_swaps_in_replaced_checkpoint(tmp_path):
+    checkpoint_path = str(tmp_path / 'potato_model_best.pth')
+    save_checkpoint(checkpoint_path, 'v1')
+    registry = ModelRegistry()
+    await registry.switch('potato', checkpoint_path)
+    assert registry.active.model_version == 'v1'
+
+    registry.start_watching(0.05)
+    try:
+        save_checkpoint(checkpoint_path, 'v2')
+        for _ in range(200):
+            if registry.active.model_version == 'v2':
+                break
+            await asyncio.sleep(0.05)
+        assert registry.active.model_version == 'v2'
+        assert registry.active.model_path == checkpoint_path
+    finally:
+        await registry.stop()
@@ -0,0 +1,92 @@
+import asyncio
+
+import numpy as np
+import pytest
+import timm
+
+from app.model import PlantDiseaseModel
+from app.registry import ModelRegistry
+from app.shadow import ShadowEvaluator
+
+def tiny_model():
+    model = PlantDiseaseModel()
+    model.model = timm.create_model('mobilenetv3_small_100', pretrained=False, num_classes=2).eval()
+    return model
+
+def leaf_images(count):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (96, 96, 3), dtype=np.uint8) for _ in range(count)]
+
+@pytest.mark.asyncio
+async def test_shadow_batches_and_compares_sampled_requests():
+    """The same network as candidate agrees with every primary prediction"""
+    primary = tiny_model()
+    candidate = PlantDiseaseModel()
+    candidate.model = primary.model
+    shadow = ShadowEvaluator(candidate, fraction=1.0, max_batch=4, max_wait=0.01, max_busy_fraction=1.0)
+
+    for image in leaf_images(6):
+        shadow.submit(image, await primary.predict(image), 'potato', primary.model_version, 0.01)
+    for _ in range(100):
+        if shadow.compared == 6:
+            break
+        await asyncio.sleep(0.05)
+
+    report = shadow.summary()
+    assert report['compared'] == 6
+    assert report['agreement'] == 1.0
+    assert abs(report['meanConfidenceDelta']) < 1e-4
+    assert report['meanBatchSize'] > 1
+    assert report['latencyMs']['shadowPerImage'] is not None
+    await shadow.close()
+
+@pytest.mark.asyncio
+async def test_shadow_drops_instead_of_competing_with_saturated_primary():
+    candidate = tiny_model()
+    shadow = ShadowEvaluator(candidate, fraction=1.0, max_queue=2, max_wait=0.01, max_delay=0.1,
+                             primary_busy=lambda: True)
+    primary = {'predicted_class': 'healthy_potato', 'confidence': 0.9}
+    for image in leaf_images(4):
+        shadow.submit(image, primary, 'potato', '1.0.0', 0.01)
+    shadow.submit(leaf_images(1)[0], primary, 'tomato', '1.0.0', 0.01)
+    await asyncio.sleep(0.3)
+
+    assert shadow.compared == 0
+    assert shadow.dropped == {'queue_full': 2, 'plant_mismatch': 1, 'stale': 2}
+    await shadow.close()
+
+@pytest.mark.asyncio
+async def test_switching_plant_stops_the_shadow(monkeypatch):
+    registry = ModelRegistry()
+
+    async def load(plant, model_path, require_checkpoint=False):
+        model = tiny_model()
+        model.current_plant = plant
+        return model
+    monkeypatch.setattr(registry, 'load', load)
+
+    await registry.switch('potato', None)
+    shadow = await registry.start_shadow('/models/candidate.pth', 1.0)
+    await registry.switch('potato', None, trigger='watch')
+    assert registry.shadow is shadow
+
+    await registry.switch('tomato', None)
+    assert registry.shadow is None
+    assert shadow.summary()['plant'] == 'potato'
+    await registry.stop()
+
+@pytest.mark.asyncio
+async def test_close_finishes_running_batch_without_waiting_out_the_idle_time():
+    candidate = tiny_model()
+    shadow = ShadowEvaluator(candidate, fraction=1.0, max_batch=2, max_wait=0.01, max_busy_fraction=0.01)
+    primary = {'predicted_class': 'healthy_potato', 'confidence': 0.9}
+    for image in leaf_images(2):
+        shadow.submit(image, primary, 'potato', '1.0.0', 0.01)
+    while shadow.batches == 0:
+        await asyncio.sleep(0)
+
+    started = asyncio.get_running_loop().time()
+    await shadow.close()
+    assert asyncio.get_running_loop().time() - started < 1.0
+    assert shadow.compared == 2
+    assert shadow._worker.done()
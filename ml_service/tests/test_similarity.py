@@ -0,0 +1,24 @@
+import numpy as np
+
+from app.similarity import EmbeddingIndex
+
+def test_index_search_append_and_reopen(tmp_path):
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32))
+    vectors = centers[rng.integers(0, 20, 2000)] + 0.3 * rng.normal(size=(2000, 32))
+    index = EmbeddingIndex.create(str(tmp_path), 32, model_version='1.0.0')
+    index.add(vectors, [{'label': f'row{i}'} for i in range(len(vectors))])
+
+    _, exact = index.search(vectors[:50], k=5)
+    assert (exact[:, 0] == np.arange(50)).all()
+
+    index.train(nlist=16)
+    scores, ids = index.search(vectors[:50], k=5, nprobe=4)
+    assert np.mean([len(set(a) & set(b)) / 5 for a, b in zip(ids, exact)]) > 0.9
+    assert index.vectors.dtype == np.float16
+
+    new = index.add(vectors[:1] * -1, [{'label': 'appended'}])
+    reopened = EmbeddingIndex(str(tmp_path))
+    _, ids = reopened.search(vectors[:1] * -1, k=1)
+    assert ids[0, 0] == new[0]
+    assert reopened.items(ids[0]) == [{'label': 'appended'}]
@@ -0,0 +1,237 @@
+"""Pick which unlabelled field images are worth labelling, and merge the labels back.
+
+``select`` scores a pool of unlabelled images with a trained checkpoint. Decoding runs
+in DataLoader workers and the forward pass is batched. Backbone features go into the
+same content-hashed ``FeatureCache`` that ``feature_cache.py`` trains heads from, so
+rescoring a growing pool only extracts the new images. Each image gets an uncertainty
+(normalised entropy, or one minus the top-2 margin). The queue is then built greedily:
+every step takes the candidate with the best mix of uncertainty and cosine distance to
+everything already labelled or queued, so near-duplicate confusing images don't take
+up the whole budget.
+
+    python active_learning.py select tomato --checkpoint models/tomato/tomato_model_best.pth \
+        --pool-dir ../field_uploads --budget 200
+
+writes ``<output-dir>/<plant>/<plant>_labelling_queue.csv`` in rank order, with empty
+``label``/``disease_type`` columns for annotators. ``merge`` appends the filled-in
+rows to the plant's labels CSV. Rows whose image is already in the manifest are
+skipped, and existing rows are never rewritten:
+
+    python active_learning.py merge tomato --queue models/tomato/tomato_labelling_queue.csv
+
+The new images' features are already cached, so ``feature_cache.py`` can retrain the
+head on the merged manifest straight away.
+"""
+import argparse
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+
+from checkpoints import load_checkpoint
+from feature_cache import FeatureCache, backbone_key, update_cache
+from manifest import load_manifest
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp'}
+MANIFEST_COLUMNS = ['image_path', 'label', 'plant_type', 'disease_type', 'split']
+
+
+def pool_images(pool_dirs=(), pool_manifests=()):
+    """Image paths under ``pool_dirs`` (recursive) and in the ``image_path`` column of ``pool_manifests``"""
+    paths = [str(p) for d in pool_dirs for p in sorted(Path(d).rglob('*')) if p.suffix.lower() in IMAGE_SUFFIXES]
+    for manifest in pool_manifests:
+        manifest = Path(manifest)
+        paths.extend(load_manifest(manifest, manifest.parent)['image_path'])
+    return list(dict.fromkeys(paths))
+
+
+def uncertainty_scores(probabilities, strategy='entropy'):
+    """Per-row uncertainty in [0, 1]: normalised entropy or ``1 - (p1 - p2)``"""
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    if strategy == 'entropy':
+        entropy = -(probabilities * np.log(np.clip(probabilities, 1e-12, 1.0))).sum(1)
+        return entropy / np.log(max(probabilities.shape[1], 2))
+    if strategy == 'margin':
+        top2 = np.sort(probabilities, axis=1)[:, -2:]
+        return 1.0 - (top2[:, 1] - top2[:, 0])
+    raise ValueError(f"Unknown uncertainty strategy: {strategy}")
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def select_diverse(embeddings, uncertainty, budget, reference=None, diversity_weight=0.5, block=4096):
+    """Greedy ranked selection of ``budget`` rows.
+
+    Each step takes the row maximising ``(1 - w) * uncertainty + w * distance``. Here
+    ``distance`` is half the cosine distance to the nearest row in ``reference`` (the
+    labelled set) or anything already picked. Returns ``(order, distance_at_pick)``.
+    """
+    embeddings = _normalize(embeddings)
+    uncertainty = np.asarray(uncertainty, dtype=np.float32)
+    # Farthest possible (cosine distance 2) when there is nothing to be near yet
+    distance = np.ones(len(embeddings), np.float32)
+    if reference is not None and len(reference):
+        reference = _normalize(reference)
+        for start in range(0, len(embeddings), block):
+            similarity = embeddings[start:start + block] @ reference.T
+            distance[start:start + block] = (1.0 - similarity.max(1)) / 2.0
+    order, picked_distance = [], []
+    available = np.ones(len(embeddings), bool)
+    for _ in range(min(budget, len(embeddings))):
+        score = np.where(available, (1 - diversity_weight) * uncertainty + diversity_weight * distance, -np.inf)
+        best = int(np.argmax(score))
+        order.append(best)
+        picked_distance.append(float(distance[best]))
+        available[best] = False
+        distance = np.minimum(distance, (1.0 - embeddings @ embeddings[best]) / 2.0)
+    return np.asarray(order, np.int64), np.asarray(picked_distance, np.float32)
+
+
+def select(args):
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model, checkpoint = load_checkpoint(args.checkpoint, device)
+    class_names = list(checkpoint['class_names'])
+    input_size = int(checkpoint.get('input_size', 224))
+    cache = FeatureCache(Path(args.cache_dir) / backbone_key(args.checkpoint, checkpoint['model_name']),
+                         model.get_classifier().in_features)
+
+    dataset_path = Path(args.dataset_path)
+    labels_file = dataset_path / f'{args.plant_type}_labels.csv'
+    labelled = load_manifest(labels_file, dataset_path) if labels_file.exists() else pd.DataFrame(columns=['image_path'])
+    labelled_hashes = update_cache(cache, model, labelled['image_path'].tolist(), input_size, device,
+                                   args.batch_size, args.num_workers)
+
+    paths = pool_images(args.pool_dir, args.pool_manifest)
+    hashes = update_cache(cache, model, paths, input_size, device, args.batch_size, args.num_workers)
+    # Drop images that are already labelled and byte-identical duplicates inside the pool
+    known = set(labelled_hashes)
+    keep = [i for i, h in enumerate(hashes) if not (h in known or known.add(h))]
+    paths, hashes = [paths[i] for i in keep], [hashes[i] for i in keep]
+    logger.info(f"Scoring {len(paths)} unlabelled images against {len(labelled_hashes)} labelled ones")
+    if not paths:
+        raise SystemExit("No unlabelled images in the pool")
+
+    features = cache.lookup(hashes)
+    with torch.no_grad():
+        logits = model.get_classifier()(torch.from_numpy(features).to(device))
+        probabilities = torch.softmax(logits.float(), dim=1).cpu().numpy()
+    entropy = uncertainty_scores(probabilities, 'entropy')
+    margin = uncertainty_scores(probabilities, 'margin')
+    uncertainty = entropy if args.strategy == 'entropy' else margin
+
+    # Diversity only among the most uncertain candidates keeps the greedy pass cheap
+    candidates = np.argsort(-uncertainty, kind='stable')[:max(args.budget * args.candidate_factor, args.budget)]
+    reference = cache.lookup(labelled_hashes) if labelled_hashes else None
+    order, distance = select_diverse(features[candidates], uncertainty[candidates], args.budget,
+                                     reference, args.diversity_weight)
+    chosen = candidates[order]
+
+    queue = pd.DataFrame({
+        'rank': np.arange(1, len(chosen) + 1),
+        'image_path': [paths[i] for i in chosen],
+        'image_hash': [hashes[i] for i in chosen],
+        'score': (1 - args.diversity_weight) * uncertainty[chosen] + args.diversity_weight * distance,
+        'uncertainty': uncertainty[chosen],
+        'diversity': distance,
+        'entropy': entropy[chosen],
+        'margin': 1.0 - margin[chosen],
+        'predicted_label': [class_names[i] for i in probabilities[chosen].argmax(1)],
+        'confidence': probabilities[chosen].max(1),
+        'label': '',
+        'disease_type': '',
+    })
+    output = Path(args.output) if args.output else Path(args.output_dir) / args.plant_type / f'{args.plant_type}_labelling_queue.csv'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    queue.to_csv(output, index=False, float_format='%.4f')
+    logger.info(f"Labelling queue of {len(queue)} images written to {output} "
+                f"(mean {args.strategy} uncertainty {queue['uncertainty'].mean():.3f} vs pool "
+                f"{uncertainty.mean():.3f})")
+
+
+def merge(args):
+    dataset_path = Path(args.dataset_path)
+    labels_file = dataset_path / f'{args.plant_type}_labels.csv'
+    queue = pd.read_csv(args.queue, dtype={'label': str, 'disease_type': str}, keep_default_na=False)
+    queue = queue[queue['label'].str.strip() != '']
+    if queue.empty:
+        logger.info(f"No labelled rows in {args.queue}")
+        return
+
+    existing = pd.read_csv(labels_file) if labels_file.exists() else pd.DataFrame(columns=MANIFEST_COLUMNS)
+    repo_root = dataset_path.resolve().parent
+
+    def manifest_path(path):
+        # Same convention as the generated manifests: relative to the repository root when inside it
+        path = Path(path).resolve()
+        return str(path.relative_to(repo_root)) if path.is_relative_to(repo_root) else str(path)
+
+    present = {str(Path(p.replace('\\', '/'))) for p in existing['image_path'].astype(str)}
+    rows = []
+    for _, item in queue.iterrows():
+        path = manifest_path(item['image_path'])
+        if path in present:
+            continue
+        present.add(path)
+        label = item['label'].strip()
+        disease = item['disease_type'].strip() or ('none' if label.startswith('healthy') else 'unknown')
+        rows.append({'image_path': path, 'label': label, 'plant_type': args.plant_type,
+                     'disease_type': disease, 'split': args.split})
+    if not rows:
+        logger.info(f"All {len(queue)} labelled rows are already in {labels_file}")
+        return
+
+    new_labels = sorted({r['label'] for r in rows} - set(existing['label'].astype(str)))
+    if new_labels:
+        logger.info(f"New classes: {new_labels}")
+    merged = pd.concat([existing, pd.DataFrame(rows)], ignore_index=True)
+    tmp_path = labels_file.with_name(labels_file.name + f'.{os.getpid()}.tmp')
+    merged.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, labels_file)
+    logger.info(f"Merged {len(rows)} labelled images into {labels_file} ({len(merged)} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Active-learning labelling queue and manifest merge')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    select_parser = commands.add_parser('select', help='Rank unlabelled images by uncertainty and diversity')
+    select_parser.add_argument('plant_type', type=str, choices=['potato', 'tomato'])
+    select_parser.add_argument('--checkpoint', type=str, required=True, help='Checkpoint used to score the pool')
+    select_parser.add_argument('--pool-dir', type=str, nargs='*', default=[], help='Directories of unlabelled images')
+    select_parser.add_argument('--pool-manifest', type=str, nargs='*', default=[],
+                               help='CSVs with an image_path column (e.g. exported production uploads)')
+    select_parser.add_argument('--dataset-path', type=str, default='../dataset', help='Path to dataset')
+    select_parser.add_argument('--budget', type=int, default=200, help='Number of images to queue for labelling')
+    select_parser.add_argument('--strategy', type=str, default='entropy', choices=['entropy', 'margin'])
+    select_parser.add_argument('--diversity-weight', type=float, default=0.5,
+                               help='0 ranks by uncertainty only, 1 by distance to labelled/queued images only')
+    select_parser.add_argument('--candidate-factor', type=int, default=10,
+                               help='Diversity is applied to the budget x factor most uncertain images')
+    select_parser.add_argument('--cache-dir', type=str, default='feature_cache', help='Root of the feature caches')
+    select_parser.add_argument('--output-dir', type=str, default='models', help='Queue goes to <output-dir>/<plant>/')
+    select_parser.add_argument('--output', type=str, default=None, help='Explicit queue CSV path')
+    select_parser.add_argument('--batch-size', type=int, default=64)
+    select_parser.add_argument('--num-workers', type=int, default=4)
+    select_parser.set_defaults(run=select)
+
+    merge_parser = commands.add_parser('merge', help='Append labelled queue rows to the labels CSV')
+    merge_parser.add_argument('plant_type', type=str, choices=['potato', 'tomato'])
+    merge_parser.add_argument('--queue', type=str, required=True, help='Labelling queue with the label column filled in')
+    merge_parser.add_argument('--dataset-path', type=str, default='../dataset', help='Path to dataset')
+    merge_parser.add_argument('--split', type=str, default='train', help='Split assigned to merged images')
+    merge_parser.set_defaults(run=merge)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
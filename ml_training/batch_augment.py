@@ -0,0 +1,256 @@
+import json
+import logging
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from PIL import Image
+from torch.utils.data import Dataset, default_collate
+
+logger = logging.getLogger(__name__)
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+@dataclass
+class AugmentPolicy:
+    """Probabilities and ranges of the training augmentation chain.
+
+    Defaults mirror the albumentations chain built in ``train.build_train_transform``.
+    """
+    hflip_p: float = 0.5
+    vflip_p: float = 0.2
+    rotate90_p: float = 0.3
+    brightness_contrast_p: float = 0.3
+    brightness_limit: Tuple[float, float] = (-0.2, 0.2)
+    contrast_limit: Tuple[float, float] = (-0.2, 0.2)
+    gamma_p: float = 0.2
+    gamma_limit: Tuple[float, float] = (80.0, 120.0)
+    noise_p: float = 0.2
+    noise_std_range: Tuple[float, float] = (0.2, 0.44)
+    blur_p: float = 0.1
+    blur_kernel: int = 3
+
+    @classmethod
+    def from_albumentations(cls, compose) -> 'AugmentPolicy':
+        """Read probabilities and limits off an albumentations ``Compose`` so both engines
+        stay in sync across albumentations versions."""
+        policy = cls()
+        for t in compose.transforms:
+            name = type(t).__name__
+            if name == 'HorizontalFlip':
+                policy.hflip_p = t.p
+            elif name == 'VerticalFlip':
+                policy.vflip_p = t.p
+            elif name == 'RandomRotate90':
+                policy.rotate90_p = t.p
+            elif name == 'RandomBrightnessContrast':
+                policy.brightness_contrast_p = t.p
+                policy.brightness_limit = tuple(t.brightness_limit)
+                policy.contrast_limit = tuple(t.contrast_limit)
+            elif name == 'RandomGamma':
+                policy.gamma_p = t.p
+                policy.gamma_limit = tuple(t.gamma_limit)
+            elif name == 'GaussNoise':
+                policy.noise_p = t.p
+                if hasattr(t, 'std_range'):
+                    policy.noise_std_range = tuple(t.std_range)
+                else:
+                    # albumentations < 2.0 expresses noise as a variance in uint8 units
+                    lo, hi = t.var_limit
+                    policy.noise_std_range = (lo ** 0.5 / 255.0, hi ** 0.5 / 255.0)
+            elif name == 'Blur':
+                policy.blur_p = t.p
+                policy.blur_kernel = int(t.blur_limit[1] if isinstance(t.blur_limit, (tuple, list)) else t.blur_limit)
+        return policy
+
+
+def load_downscaled(image_path, size: int = 224) -> np.ndarray:
+    """Decode an image straight to ``size x size`` RGB uint8.
+
+    For JPEGs ``Image.draft`` lets libjpeg decode at 1/2, 1/4 or 1/8 scale, so the
+    full-resolution bitmap is never materialised.
+    """
+    with Image.open(image_path) as image:
+        image.draft('RGB', (size, size))
+        image = image.convert('RGB').resize((size, size), Image.BILINEAR)
+        return np.array(image)
+
+
+class DecodedImageDataset(Dataset):
+    """Dataset yielding downscaled uint8 CHW tensors; augmentation happens per batch."""
+
+    def __init__(self, image_paths, labels, image_size: int = 224):
+        self.image_paths = image_paths
+        self.labels = labels
+        self.image_size = image_size
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, idx):
+        image = load_downscaled(self.image_paths[idx], self.image_size)
+        return torch.from_numpy(image).permute(2, 0, 1).contiguous(), self.labels[idx]
+
+
+class CachedImageDataset(Dataset):
+    """``DecodedImageDataset`` served from a ``DecodedImageCache`` file.
+
+    The memmap is opened lazily so loader workers share the page cache instead of
+    receiving a pickled copy of the array.
+    """
+
+    def __init__(self, cache_path, rows, labels):
+        self.cache_path = str(cache_path)
+        self.rows = rows
+        self.labels = labels
+        self._array = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, idx):
+        if self._array is None:
+            self._array = np.load(self.cache_path, mmap_mode='r')
+        image = np.array(self._array[self.rows[idx]])
+        return torch.from_numpy(image).permute(2, 0, 1).contiguous(), self.labels[idx]
+
+
+class DecodedImageCache:
+    """Downscaled uint8 images in one ``.npy`` file plus a ``path -> row`` JSON index.
+
+    Decoding happens once; every later run (or every parallel sweep trial) memory-maps
+    the same file read-only.
+    """
+
+    def __init__(self, cache_path: Path, index: dict):
+        self.cache_path = Path(cache_path)
+        self.index = index
+
+    @staticmethod
+    def _index_path(cache_path: Path) -> Path:
+        return cache_path.with_suffix('.index.json')
+
+    @classmethod
+    def open_or_build(cls, cache_path, image_paths, size: int = 224) -> 'DecodedImageCache':
+        cache_path = Path(cache_path)
+        index_path = cls._index_path(cache_path)
+        index = {}
+        if cache_path.exists() and index_path.exists():
+            with open(index_path) as f:
+                index = json.load(f)
+            if all(str(p) in index for p in image_paths):
+                return cls(cache_path, index)
+
+        paths = sorted(set(index) | {str(p) for p in image_paths})
+        logger.info(f"Decoding {len(paths)} images into {cache_path}")
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + f'.{os.getpid()}.tmp')
+        array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=(len(paths), size, size, 3))
+        for row, path in enumerate(paths):
+            array[row] = load_downscaled(path, size)
+        array.flush()
+        del array
+        # Replace atomically so concurrent readers never see a half-written cache
+        os.replace(tmp_path, cache_path)
+        index = {path: row for row, path in enumerate(paths)}
+        tmp_index = index_path.with_name(index_path.name + f'.{os.getpid()}.tmp')
+        with open(tmp_index, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_index, index_path)
+        return cls(cache_path, index)
+
+    def dataset(self, image_paths, labels) -> CachedImageDataset:
+        return CachedImageDataset(self.cache_path, [self.index[str(p)] for p in image_paths], labels)
+
+
+class BatchAugment(nn.Module):
+    """Applies ``AugmentPolicy`` to a uint8 ``(N, 3, H, W)`` batch and normalizes it.
+
+    Every op draws one random decision per sample and runs once on the selected
+    sub-batch, so the cost is a handful of kernels per batch instead of per image. Photometric
+    ops clip to ``[0, 1]`` after each step, matching albumentations on uint8 input.
+    """
+
+    def __init__(self, policy: Optional[AugmentPolicy] = None, train: bool = True,
+                 generator: Optional[torch.Generator] = None):
+        super().__init__()
+        self.policy = policy or AugmentPolicy()
+        self.train_mode = train
+        self.generator = generator
+        self.register_buffer('mean', torch.tensor(IMAGENET_MEAN).view(1, 3, 1, 1), persistent=False)
+        self.register_buffer('std', torch.tensor(IMAGENET_STD).view(1, 3, 1, 1), persistent=False)
+
+    def _uniform(self, n, low, high, device):
+        return (low + (high - low) * torch.rand(n, generator=self.generator)).to(device).view(n, 1, 1, 1)
+
+    def _select(self, n, p, device):
+        """Indices of the samples an op with probability ``p`` applies to"""
+        return (torch.rand(n, generator=self.generator) < p).nonzero(as_tuple=True)[0].to(device)
+
+    def forward(self, batch: torch.Tensor) -> torch.Tensor:
+        x = batch.float().div_(255.0)
+        if self.train_mode:
+            x = self._augment(x)
+        return x.sub_(self.mean.to(x.device)).div_(self.std.to(x.device))
+
+    def _augment(self, x: torch.Tensor) -> torch.Tensor:
+        p = self.policy
+        n, device = x.shape[0], x.device
+
+        idx = self._select(n, p.hflip_p, device)
+        x[idx] = x[idx].flip(3)
+        idx = self._select(n, p.vflip_p, device)
+        x[idx] = x[idx].flip(2)
+
+        if x.shape[2] == x.shape[3]:
+            idx = self._select(n, p.rotate90_p, device)
+            turns = torch.randint(0, 4, (len(idx),), generator=self.generator).to(device)
+            for k in (1, 2, 3):
+                sub = idx[turns == k]
+                if sub.numel():
+                    x[sub] = torch.rot90(x[sub], k, dims=(2, 3))
+
+        # Photometric ops only touch the selected rows, so their cost scales with p
+        idx = self._select(n, p.brightness_contrast_p, device)
+        if idx.numel():
+            alpha = 1.0 + self._uniform(len(idx), *p.contrast_limit, device)
+            beta = self._uniform(len(idx), *p.brightness_limit, device)
+            x[idx] = (x[idx] * alpha + beta).clamp_(0.0, 1.0)
+
+        idx = self._select(n, p.gamma_p, device)
+        if idx.numel():
+            gamma = self._uniform(len(idx), *p.gamma_limit, device) / 100.0
+            x[idx] = x[idx].pow(gamma)
+
+        idx = self._select(n, p.noise_p, device)
+        if idx.numel():
+            sigma = self._uniform(len(idx), *p.noise_std_range, device)
+            noise = torch.randn(x[idx].shape, generator=self.generator).to(device)
+            x[idx] = (x[idx] + noise * sigma).clamp_(0.0, 1.0)
+
+        idx = self._select(n, p.blur_p, device)
+        if idx.numel():
+            pad = p.blur_kernel // 2
+            padded = F.pad(x[idx], (pad, pad, pad, pad), mode='reflect')
+            x[idx] = F.avg_pool2d(padded, p.blur_kernel, stride=1)
+
+        return x
+
+
+class BatchAugmentCollate:
+    """``collate_fn`` that stacks uint8 samples and runs ``BatchAugment`` in the loader worker."""
+
+    def __init__(self, augment: BatchAugment):
+        self.augment = augment
+
+    def __call__(self, samples):
+        images, labels = default_collate(samples)
+        with torch.no_grad():
+            return self.augment(images), labels
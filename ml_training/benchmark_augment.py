@@ -0,0 +1,198 @@
+"""Compare the albumentations and batched augmentation engines.
+
+Reports loader throughput for both engines and checks that they sample the same
+augmentation distribution:
+
+* photometric statistics (per-image brightness, contrast, high-frequency energy)
+  are compared with two-sample Kolmogorov-Smirnov tests;
+* geometric outcomes (the 8 flip/rotation orientations of an asymmetric probe)
+  are compared with a chi-square test on the orientation counts.
+
+Both engines see identical downscaled inputs for the statistical check, so any
+difference is down to the augmentation policy rather than the resize path.
+"""
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+
+import albumentations as A
+import numpy as np
+import torch
+from scipy import stats
+from torch.utils.data import DataLoader
+
+from batch_augment import (IMAGENET_MEAN, IMAGENET_STD, AugmentPolicy, BatchAugment,
+                           BatchAugmentCollate, DecodedImageDataset, load_downscaled)
+from manifest import load_manifest
+from train import PlantDiseaseDataset, build_train_transform
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def measure_throughput(loader, max_batches=None):
+    """Images per second for one pass over ``loader``"""
+    images = 0
+    start = time.perf_counter()
+    for batch_idx, (data, _) in enumerate(loader):
+        images += data.shape[0]
+        if max_batches and batch_idx + 1 >= max_batches:
+            break
+    return images / (time.perf_counter() - start)
+
+
+def _denormalize(batch: torch.Tensor) -> np.ndarray:
+    mean = torch.tensor(IMAGENET_MEAN).view(1, 3, 1, 1)
+    std = torch.tensor(IMAGENET_STD).view(1, 3, 1, 1)
+    return (batch * std + mean).clamp(0, 1).numpy()
+
+
+def image_statistics(images: np.ndarray) -> dict:
+    """Per-image summary statistics of a ``(N, 3, H, W)`` batch in ``[0, 1]``"""
+    gray = images.mean(axis=1)
+    laplacian = (4 * gray[:, 1:-1, 1:-1] - gray[:, :-2, 1:-1] - gray[:, 2:, 1:-1]
+                 - gray[:, 1:-1, :-2] - gray[:, 1:-1, 2:])
+    return {
+        'brightness': gray.mean(axis=(1, 2)),
+        'contrast': gray.std(axis=(1, 2)),
+        'high_frequency': np.abs(laplacian).mean(axis=(1, 2)),
+    }
+
+
+def _probe_image(size: int) -> np.ndarray:
+    """Asymmetric probe whose 8 dihedral variants are mutually distinguishable"""
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    probe = np.stack([xx, yy, (xx * yy) ** 0.5], axis=-1)
+    probe[: size // 4, : size // 2] = 1.0
+    return (probe * 255).astype(np.uint8)
+
+
+def _dihedral_variants(image: np.ndarray) -> list:
+    variants = []
+    for flipped in (image, image[:, ::-1]):
+        for k in range(4):
+            variants.append(np.rot90(flipped, k).astype(np.float32).mean(axis=-1).ravel())
+    return variants
+
+
+def orientation_counts(images: np.ndarray, probe: np.ndarray) -> np.ndarray:
+    """Count which dihedral variant of ``probe`` each augmented image matches best"""
+    variants = np.stack(_dihedral_variants(probe))
+    variants = (variants - variants.mean(axis=1, keepdims=True)) / variants.std(axis=1, keepdims=True)
+    flat = images.mean(axis=1).reshape(len(images), -1)
+    flat = (flat - flat.mean(axis=1, keepdims=True)) / (flat.std(axis=1, keepdims=True) + 1e-8)
+    matches = (flat @ variants.T).argmax(axis=1)
+    return np.bincount(matches, minlength=len(variants))
+
+
+def sample_albumentations(images, repeats):
+    compose = build_train_transform()
+    # Inputs are already downscaled; drop Resize so only the policy is compared
+    chain = A.Compose([t for t in compose.transforms if type(t).__name__ != 'Resize'])
+    out = [chain(image=image)['image'] for _ in range(repeats) for image in images]
+    return _denormalize(torch.stack(out))
+
+
+def sample_batched(images, repeats, seed):
+    policy = AugmentPolicy.from_albumentations(build_train_transform())
+    augment = BatchAugment(policy, train=True, generator=torch.Generator().manual_seed(seed))
+    batch = torch.from_numpy(np.stack(images)).permute(0, 3, 1, 2).contiguous()
+    with torch.no_grad():
+        out = [augment(batch) for _ in range(repeats)]
+    return _denormalize(torch.cat(out))
+
+
+def compare_distributions(images, repeats, alpha, seed):
+    reference = image_statistics(sample_albumentations(images, repeats))
+    candidate = image_statistics(sample_batched(images, repeats, seed))
+    report = {}
+    for name in reference:
+        result = stats.ks_2samp(reference[name], candidate[name])
+        report[name] = {
+            'ks_statistic': float(result.statistic),
+            'p_value': float(result.pvalue),
+            'reference_mean': float(reference[name].mean()),
+            'batched_mean': float(candidate[name].mean()),
+            'match': bool(result.pvalue >= alpha),
+        }
+
+    probe = _probe_image(images[0].shape[0])
+    probe_repeats = max(repeats * len(images), 400)
+    counts = np.stack([
+        orientation_counts(sample_albumentations([probe], probe_repeats), probe),
+        orientation_counts(sample_batched([probe], probe_repeats, seed), probe),
+    ])
+    observed = counts[:, counts.sum(axis=0) > 0]
+    _, p_value, _, _ = stats.chi2_contingency(observed)
+    report['orientation'] = {
+        'albumentations_counts': counts[0].tolist(),
+        'batched_counts': counts[1].tolist(),
+        'p_value': float(p_value),
+        'match': bool(p_value >= alpha),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark augmentation engines')
+    parser.add_argument('plant_type', type=str, choices=['potato', 'tomato'], help='Manifest to sample images from')
+    parser.add_argument('--dataset-path', type=str, default='../dataset', help='Path to dataset')
+    parser.add_argument('--num-images', type=int, default=256, help='Images used for the throughput pass')
+    parser.add_argument('--batch-size', type=int, default=32, help='Batch size')
+    parser.add_argument('--num-workers', type=int, default=4, help='Number of workers')
+    parser.add_argument('--stat-images', type=int, default=64, help='Images used for the distribution check')
+    parser.add_argument('--repeats', type=int, default=8, help='Augmented draws per image for the distribution check')
+    parser.add_argument('--alpha', type=float, default=0.01, help='Significance level for the distribution tests')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--output', type=str, default='augment_benchmark.json', help='Where to write the JSON report')
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    np.random.seed(args.seed)
+
+    dataset_path = Path(args.dataset_path)
+    labels_file = dataset_path / f'{args.plant_type}_labels.csv'
+    df = load_manifest(labels_file, dataset_path)
+    df = df[df['split'] == 'train'].sample(frac=1.0, random_state=args.seed)
+    paths = df['image_path'].values[:args.num_images]
+    labels = np.zeros(len(paths), dtype=np.int64)
+
+    loaders = {
+        'albumentations': DataLoader(
+            PlantDiseaseDataset(paths, labels, build_train_transform()),
+            batch_size=args.batch_size, num_workers=args.num_workers
+        ),
+        'batched': DataLoader(
+            DecodedImageDataset(paths, labels),
+            batch_size=args.batch_size, num_workers=args.num_workers,
+            collate_fn=BatchAugmentCollate(BatchAugment(AugmentPolicy.from_albumentations(build_train_transform())))
+        ),
+    }
+    throughput = {}
+    for name, loader in loaders.items():
+        throughput[name] = measure_throughput(loader)
+        logger.info(f"{name}: {throughput[name]:.1f} images/s")
+    throughput['speedup'] = throughput['batched'] / throughput['albumentations']
+
+    stat_images = [load_downscaled(p) for p in df['image_path'].values[:args.stat_images]]
+    distributions = compare_distributions(stat_images, args.repeats, args.alpha, args.seed)
+    for name, result in distributions.items():
+        logger.info(f"{name}: p={result['p_value']:.4f} {'OK' if result['match'] else 'MISMATCH'}")
+
+    report = {
+        'plant_type': args.plant_type,
+        'num_images': len(paths),
+        'batch_size': args.batch_size,
+        'num_workers': args.num_workers,
+        'throughput_images_per_sec': throughput,
+        'distribution_check': distributions,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
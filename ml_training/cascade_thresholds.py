@@ -0,0 +1,126 @@
+"""Pick the confidence threshold for the ML service's two-stage cascade.
+
+Runs the cheap first-stage model (the distilled student) and the full model over the
+held-out split, then sweeps the threshold below which a prediction is escalated. For
+every threshold the report lists cascade accuracy, escalation rate and the expected
+per-image CPU latency (student + escalation rate x full model). The recommended
+threshold is the one with the lowest escalation rate whose accuracy stays within
+``--accuracy-tolerance`` points of the full model alone.
+
+    python cascade_thresholds.py tomato --student models/tomato/tomato_student_best.pth \
+        --full models/tomato/tomato_model_best.pth --accuracy-tolerance 0.5
+
+Set the result as ``CASCADE_CONFIDENCE_THRESHOLD`` for the service.
+"""
+import argparse
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from distill import ResizeTo, build_test_loader, load_classifier, measure_latency
+
+logger = logging.getLogger(__name__)
+
+
+@torch.no_grad()
+def collect_probabilities(model, loader, input_size, device, class_index=None):
+    """Softmax outputs over ``loader`` in its class order, plus the targets"""
+    resize = ResizeTo(input_size)
+    probabilities, targets = [], []
+    for data, target in loader:
+        logits = model(resize(data.to(device)))
+        if class_index is not None:
+            logits = logits[:, class_index]
+        probabilities.append(torch.softmax(logits, dim=1).cpu())
+        targets.append(target)
+    return torch.cat(probabilities).numpy(), torch.cat(targets).numpy()
+
+
+def sweep_thresholds(student_probs, full_probs, targets, student_ms, full_ms, thresholds):
+    """Accuracy, escalation rate and expected latency of the cascade at each threshold"""
+    student_conf = student_probs.max(1)
+    student_pred = student_probs.argmax(1)
+    full_pred = full_probs.argmax(1)
+    rows = []
+    for threshold in thresholds:
+        escalate = student_conf < threshold
+        pred = np.where(escalate, full_pred, student_pred)
+        rate = float(escalate.mean()) if len(escalate) else 0.0
+        rows.append({
+            'threshold': float(threshold),
+            'accuracy': 100.0 * float((pred == targets).mean()) if len(targets) else 0.0,
+            'escalation_rate': rate,
+            'expected_latency_ms': student_ms + rate * full_ms,
+        })
+    return rows
+
+
+def recommend(rows, full_accuracy, tolerance):
+    """Lowest-escalation row within ``tolerance`` points of the full model (always-escalate as fallback)"""
+    eligible = [r for r in rows if r['accuracy'] >= full_accuracy - tolerance]
+    return min(eligible, key=lambda r: (r['escalation_rate'], r['threshold'])) if eligible else rows[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Choose the cascade escalation threshold on the test split')
+    parser.add_argument('plant_type', type=str, choices=['potato', 'tomato'])
+    parser.add_argument('--student', type=str, required=True, help='First-stage checkpoint (*_student_best.pth)')
+    parser.add_argument('--full', type=str, required=True, help='Full model checkpoint (*_model_best.pth)')
+    parser.add_argument('--dataset-path', type=str, default='../dataset', help='Path to dataset')
+    parser.add_argument('--output-dir', type=str, default='models', help='Report goes to <output-dir>/<plant>/')
+    parser.add_argument('--accuracy-tolerance', type=float, default=0.5,
+                        help='Max accuracy drop (percentage points) against the full model')
+    parser.add_argument('--steps', type=int, default=101, help='Thresholds swept between 0 and 1')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--latency-threads', type=int, default=1, help='torch threads for latency measurement')
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    student, student_classes, student_size = load_classifier(args.student, device)
+    full, full_classes, full_size = load_classifier(args.full, device)
+    class_names = sorted(full_classes)
+    config = argparse.Namespace(plant_type=args.plant_type, dataset_path=Path(args.dataset_path))
+    loader = build_test_loader(config, class_names, args.batch_size)
+
+    def index(classes):
+        return torch.tensor([classes.index(c) for c in class_names], device=device)
+
+    student_probs, targets = collect_probabilities(student, loader, student_size, device, index(student_classes))
+    full_probs, _ = collect_probabilities(full, loader, full_size, device, index(full_classes))
+    full_accuracy = 100.0 * float((full_probs.argmax(1) == targets).mean()) if len(targets) else 0.0
+
+    torch.set_num_threads(args.latency_threads)
+    student_ms = measure_latency(student, student_size)
+    full_ms = measure_latency(full, full_size)
+
+    # Thresholds above 1 escalate everything (the full model alone)
+    rows = sweep_thresholds(student_probs, full_probs, targets, student_ms, full_ms,
+                            np.append(np.linspace(0.0, 1.0, args.steps), 1.01))
+    best = recommend(rows, full_accuracy, args.accuracy_tolerance)
+    logger.info(f"Full model: acc {full_accuracy:.2f}% at {full_ms:.2f} ms; student {student_ms:.2f} ms")
+    logger.info(f"Recommended CASCADE_CONFIDENCE_THRESHOLD={best['threshold']:.2f}: acc {best['accuracy']:.2f}%, "
+                f"escalation {best['escalation_rate']:.1%}, expected {best['expected_latency_ms']:.2f} ms/image")
+
+    output_dir = Path(args.output_dir) / args.plant_type
+    output_dir.mkdir(parents=True, exist_ok=True)
+    report = {
+        'student': args.student,
+        'full': args.full,
+        'samples': int(len(targets)),
+        'full_accuracy': full_accuracy,
+        'student_latency_ms': student_ms,
+        'full_latency_ms': full_ms,
+        'accuracy_tolerance': args.accuracy_tolerance,
+        'recommended': best,
+        'sweep': rows,
+    }
+    with open(output_dir / 'cascade_report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Cascade report written to {output_dir / 'cascade_report.json'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+import torch
+import timm
+
+from pruning_spec import apply_pruning_spec
+
+
+def load_checkpoint(checkpoint_path, device, default_architecture='efficientnet_b0'):
+    """Rebuild the network a trained checkpoint was saved from; returns ``(model, checkpoint)``.
+
+    Handles every checkpoint the training scripts write: the architecture comes from
+    ``model_name`` (``model_architecture`` in older ones), and structurally pruned
+    checkpoints are reshaped to their ``pruning`` spec before the weights load. The
+    returned checkpoint always has ``model_name`` set.
+    """
+    checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=False)
+    architecture = checkpoint.get('model_name') or checkpoint.get('model_architecture') or default_architecture
+    model = timm.create_model(architecture, pretrained=False, num_classes=len(checkpoint['class_names']))
+    if checkpoint.get('pruning'):
+        apply_pruning_spec(model, checkpoint['pruning'])
+    model.load_state_dict(checkpoint.get('model_state_dict', checkpoint))
+    checkpoint['model_name'] = architecture
+    return model.to(device).eval(), checkpoint
@@ -0,0 +1,239 @@
+"""Knowledge distillation of the trained classifiers into compact students.
+
+Trains one or more students (architecture + input resolution) against an existing
+``*_model_best.pth`` teacher, then measures test-split accuracy and CPU latency for
+the teacher and every student and writes an accuracy/latency Pareto report.
+
+    python distill.py tomato --teacher models/tomato/tomato_model_best.pth \
+        --students mobilenetv3_small_100:224 mobilenetv3_small_100:160 --epochs 20
+
+The fastest student within ``--accuracy-tolerance`` of the teacher is also written to
+``<output-dir>/<plant>/<plant>_student_best.pth``, the path the ML service serves when
+``USE_STUDENT_MODEL`` is enabled.
+"""
+import json
+import logging
+import shutil
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+
+from checkpoints import load_checkpoint
+from manifest import load_manifest
+from train import (PlantDiseaseDataset, PlantDiseaseTrainer, TrainingConfig, build_arg_parser,
+                   build_val_transform)
+
+logger = logging.getLogger(__name__)
+
+
+class ResizeTo(nn.Module):
+    """Resizes a normalized batch to the student resolution after an optional batch transform"""
+
+    def __init__(self, size, inner=None):
+        super().__init__()
+        self.size = size
+        self.inner = inner
+
+    def forward(self, x):
+        if self.inner is not None:
+            x = self.inner(x)
+        if x.shape[-1] == self.size and x.shape[-2] == self.size:
+            return x
+        return F.interpolate(x, size=(self.size, self.size), mode='bilinear', align_corners=False, antialias=True)
+
+
+def load_classifier(checkpoint_path, device, default_architecture='efficientnet_b0'):
+    """Rebuild a trained classifier from a checkpoint; returns ``(model, class_names, input_size)``"""
+    model, checkpoint = load_checkpoint(checkpoint_path, device, default_architecture)
+    return model, list(checkpoint['class_names']), int(checkpoint.get('input_size', 224))
+
+
+def distillation_loss(student_logits, teacher_logits, target, temperature, alpha):
+    """``alpha`` * hard-label CE + ``(1 - alpha)`` * T^2-scaled KL to the softened teacher"""
+    hard = F.cross_entropy(student_logits, target)
+    soft = F.kl_div(
+        F.log_softmax(student_logits / temperature, dim=1),
+        F.softmax(teacher_logits / temperature, dim=1),
+        reduction='batchmean'
+    ) * temperature ** 2
+    return alpha * hard + (1 - alpha) * soft
+
+
+class DistillationTrainer(PlantDiseaseTrainer):
+    """``PlantDiseaseTrainer`` whose model is a student trained against a frozen teacher"""
+
+    def __init__(self, config, teacher, teacher_classes, input_size, temperature=4.0, alpha=0.5):
+        super().__init__(config)
+        self.teacher = teacher.to(self.device).eval()
+        for p in self.teacher.parameters():
+            p.requires_grad_(False)
+        self.teacher_classes = teacher_classes
+        self.teacher_index = None
+        self.input_size = input_size
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def prepare_data(self):
+        super().prepare_data()
+        missing = set(self.class_names) - set(self.teacher_classes)
+        if missing:
+            raise ValueError(f"Teacher checkpoint has no logits for classes {sorted(missing)}")
+        # Reorder teacher logits into the student's class order
+        self.teacher_index = torch.tensor([self.teacher_classes.index(c) for c in self.class_names],
+                                          device=self.device)
+        self.val_batch_transform = ResizeTo(self.input_size, self.val_batch_transform)
+
+    def compute_loss(self, data, target, criterion):
+        with torch.no_grad():
+            teacher_logits = self.teacher(data)[:, self.teacher_index]
+        output = self.model(ResizeTo(self.input_size)(data))
+        return output, distillation_loss(output, teacher_logits, target, self.temperature, self.alpha)
+
+    def checkpoint_metadata(self):
+        metadata = super().checkpoint_metadata()
+        metadata.update({'input_size': self.input_size, 'distilled_from': str(self.config.teacher)})
+        return metadata
+
+
+def build_test_loader(config, class_names, batch_size=32, num_workers=0):
+    """Held-out split of the manifest ('test', falling back to 'validation')"""
+    df = load_manifest(config.dataset_path / f'{config.plant_type}_labels.csv', config.dataset_path)
+    test_df = df[df['split'] == 'test']
+    if len(test_df) == 0:
+        test_df = df[df['split'] == 'validation']
+    test_df = test_df[test_df['label'].isin(class_names)]
+    labels = test_df['label'].map({c: i for i, c in enumerate(class_names)}).values
+    dataset = PlantDiseaseDataset(test_df['image_path'].values, labels, build_val_transform())
+    return DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+
+
+@torch.no_grad()
+def evaluate_accuracy(model, loader, input_size, device, class_index=None):
+    resize = ResizeTo(input_size)
+    correct = total = 0
+    for data, target in loader:
+        logits = model(resize(data.to(device)))
+        if class_index is not None:
+            logits = logits[:, class_index]
+        correct += logits.argmax(1).eq(target.to(device)).sum().item()
+        total += target.size(0)
+    return 100.0 * correct / max(total, 1)
+
+
+@torch.inference_mode()
+def measure_latency(model, input_size, batch_size=1, runs=50, warmup=10):
+    """Median wall-clock milliseconds per forward pass on CPU"""
+    model = model.to('cpu').eval()
+    x = torch.randn(batch_size, 3, input_size, input_size)
+    for _ in range(warmup):
+        model(x)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model(x)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def pareto_front(candidates):
+    """Names of candidates no other candidate beats on both accuracy and latency"""
+    front, best_acc = [], -np.inf
+    for c in sorted(candidates, key=lambda c: (c['latency_ms'], -c['accuracy'])):
+        if c['accuracy'] > best_acc:
+            front.append(c['name'])
+            best_acc = c['accuracy']
+    return front
+
+
+def parse_student(spec):
+    """``arch[:size]`` -> ``(arch, size)``"""
+    arch, _, size = spec.partition(':')
+    return arch, int(size) if size else 224
+
+
+def main():
+    parser = build_arg_parser()
+    parser.description = 'Distill a trained classifier into compact student models'
+    parser.add_argument('--teacher', type=str, required=True, help='Teacher checkpoint (*_model_best.pth)')
+    parser.add_argument('--students', type=str, nargs='+', default=['mobilenetv3_small_100:224'],
+                        help='Student specs as timm_name[:input_size]')
+    parser.add_argument('--temperature', type=float, default=4.0, help='Softmax temperature for distillation')
+    parser.add_argument('--alpha', type=float, default=0.5, help='Weight of the hard-label loss')
+    parser.add_argument('--accuracy-tolerance', type=float, default=2.0,
+                        help='Max test accuracy drop (percentage points) for the promoted student')
+    parser.add_argument('--latency-threads', type=int, default=1, help='torch threads for latency measurement')
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    teacher, teacher_classes, teacher_size = load_classifier(args.teacher, device)
+    base_output = Path(args.output_dir) / args.plant_type
+
+    candidates = []
+    students = {}
+    for spec in args.students:
+        arch, size = parse_student(spec)
+        name = f'{arch}_{size}'
+        logger.info(f"Distilling {args.teacher} into {name}")
+        config = TrainingConfig(args)
+        config.model_name = arch
+        config.teacher = args.teacher
+        config.output_dir = base_output / f'student_{name}'
+        config.output_dir.mkdir(parents=True, exist_ok=True)
+        trainer = DistillationTrainer(config, teacher, teacher_classes, size, args.temperature, args.alpha)
+        trainer.prepare_data()
+        trainer.train()
+        students[name] = (trainer._unwrapped_model(), size, config.output_dir / 'model_best.pth')
+
+    # Evaluate everyone on the held-out split with the same class order
+    eval_config = TrainingConfig(args)
+    class_names = sorted(teacher_classes)
+    test_loader = build_test_loader(eval_config, class_names, args.batch_size)
+    teacher_index = torch.tensor([teacher_classes.index(c) for c in class_names], device=device)
+
+    torch.set_num_threads(args.latency_threads)
+    entries = [('teacher', teacher, teacher_size, teacher_index, args.teacher)]
+    for name, (_, size, path) in students.items():
+        student, _, _ = load_classifier(path, device)
+        entries.append((name, student, size, None, str(path)))
+    for name, model, size, index, path in entries:
+        candidates.append({
+            'name': name,
+            'checkpoint': str(path),
+            'input_size': size,
+            'params_m': sum(p.numel() for p in model.parameters()) / 1e6,
+            'accuracy': evaluate_accuracy(model.to(device), test_loader, size, device, index),
+            'latency_ms': measure_latency(model, size),
+            'latency_ms_batch16': measure_latency(model, size, batch_size=16, runs=10, warmup=2),
+        })
+        logger.info(f"{name}: acc {candidates[-1]['accuracy']:.2f}% latency {candidates[-1]['latency_ms']:.2f} ms")
+
+    front = pareto_front(candidates)
+    teacher_acc = candidates[0]['accuracy']
+    eligible = [c for c in candidates[1:] if c['accuracy'] >= teacher_acc - args.accuracy_tolerance]
+    promoted = min(eligible, key=lambda c: c['latency_ms']) if eligible else None
+    if promoted:
+        shutil.copyfile(promoted['checkpoint'], base_output / f'{args.plant_type}_student_best.pth')
+        logger.info(f"Promoted {promoted['name']} to {base_output / f'{args.plant_type}_student_best.pth'}")
+    else:
+        logger.warning(f"No student within {args.accuracy_tolerance} points of the teacher; nothing promoted")
+
+    report = {
+        'teacher': args.teacher,
+        'latency_threads': args.latency_threads,
+        'candidates': [dict(c, pareto=c['name'] in front) for c in candidates],
+        'pareto_front': front,
+        'promoted': promoted['name'] if promoted else None,
+    }
+    with open(base_output / 'distillation_report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Pareto report written to {base_output / 'distillation_report.json'}")
+
+
+if __name__ == '__main__':
+    main()
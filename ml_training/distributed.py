@@ -0,0 +1,99 @@
+import logging
+import os
+import socket
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+logger = logging.getLogger(__name__)
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process():
+    return get_rank() == 0
+
+
+def launched_with_torchrun():
+    """True when RANK/WORLD_SIZE were exported by torchrun or a cluster launcher"""
+    return 'RANK' in os.environ and 'WORLD_SIZE' in os.environ
+
+
+def init_process_group(backend='gloo', rank=None, world_size=None):
+    """Join the default process group.
+
+    ``rank``/``world_size`` default to the torchrun environment variables;
+    MASTER_ADDR and MASTER_PORT must already be set.
+    """
+    rank = int(os.environ['RANK']) if rank is None else rank
+    world_size = int(os.environ['WORLD_SIZE']) if world_size is None else world_size
+    dist.init_process_group(backend=backend, rank=rank, world_size=world_size)
+    logger.info(f"Initialized {backend} process group: rank {rank}/{world_size}")
+
+
+def cleanup():
+    if is_distributed():
+        dist.barrier()
+        dist.destroy_process_group()
+
+
+def local_device(local_rank):
+    """CUDA device for this process when available, otherwise CPU"""
+    if torch.cuda.is_available():
+        device = torch.device('cuda', local_rank % torch.cuda.device_count())
+        torch.cuda.set_device(device)
+        return device
+    return torch.device('cpu')
+
+
+def all_reduce_sum(*values, device=torch.device('cpu')):
+    """Sum python scalars across ranks; a no-op outside a process group"""
+    if not is_distributed():
+        return values
+    tensor = torch.tensor(values, dtype=torch.float64, device=device)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tuple(tensor.tolist())
+
+
+def any_rank(flag, device=torch.device('cpu')):
+    """True on every rank if ``flag`` is True on any rank, so ranks stop together"""
+    if not is_distributed():
+        return flag
+    tensor = torch.tensor([1 if flag else 0], device=device)
+    dist.all_reduce(tensor, op=dist.ReduceOp.MAX)
+    return bool(tensor.item())
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _spawn_entry(local_rank, fn, nprocs, backend, args):
+    os.environ['RANK'] = str(local_rank)
+    os.environ['LOCAL_RANK'] = str(local_rank)
+    os.environ['WORLD_SIZE'] = str(nprocs)
+    init_process_group(backend, local_rank, nprocs)
+    try:
+        fn(local_rank, *args)
+    finally:
+        cleanup()
+
+
+def spawn(fn, nprocs, backend='gloo', args=()):
+    """Run ``fn(local_rank, *args)`` in ``nprocs`` processes on this host"""
+    os.environ.setdefault('MASTER_ADDR', '127.0.0.1')
+    os.environ.setdefault('MASTER_PORT', str(_free_port()))
+    mp.spawn(_spawn_entry, args=(fn, nprocs, backend, args), nprocs=nprocs, join=True)
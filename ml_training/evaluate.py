@@ -0,0 +1,250 @@
+"""Batched offline evaluation of trained checkpoints.
+
+Streams the whole held-out split of ``<plant>_labels.csv`` through a DataLoader
+whose workers decode images straight to the model's input size, and accumulates a
+confusion matrix, per-class precision/recall/F1 and calibration statistics batch by
+batch. Results are written as Parquet tables next to a JSON summary:
+
+    <output-dir>/<checkpoint>/predictions.parquet   one row per image with class probabilities
+    <output-dir>/<checkpoint>/per_class.parquet     precision, recall, f1, support
+    <output-dir>/<checkpoint>/confusion.parquet     true x predicted counts
+    <output-dir>/<checkpoint>/calibration.parquet   reliability-diagram bins
+    <output-dir>/<checkpoint>/summary.json
+    <output-dir>/summary.parquet                    one row per evaluated checkpoint
+
+    python evaluate.py tomato --checkpoints models/tomato/*.pth --dataset-path ../dataset
+"""
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset
+
+from batch_augment import IMAGENET_MEAN, IMAGENET_STD, load_downscaled
+from checkpoints import load_checkpoint
+from manifest import load_manifest
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingClassificationMetrics:
+    """Confusion matrix, calibration bins and proper scoring rules updated per batch"""
+
+    def __init__(self, num_classes, n_bins=15):
+        self.num_classes = num_classes
+        self.n_bins = n_bins
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.bin_count = np.zeros(n_bins, dtype=np.int64)
+        self.bin_confidence = np.zeros(n_bins)
+        self.bin_correct = np.zeros(n_bins)
+        self.brier_sum = 0.0
+        self.nll_sum = 0.0
+        self.total = 0
+
+    def update(self, probs, targets):
+        """``probs`` is an ``(N, C)`` float tensor of softmax outputs, ``targets`` ``(N,)`` ints"""
+        probs = probs.detach().double().cpu()
+        targets = targets.detach().long().cpu()
+        confidence, predicted = probs.max(1)
+        n = self.num_classes
+        self.confusion += torch.bincount(targets * n + predicted, minlength=n * n).view(n, n).numpy()
+
+        bins = (confidence * self.n_bins).long().clamp_(max=self.n_bins - 1)
+        self.bin_count += torch.bincount(bins, minlength=self.n_bins).numpy()
+        self.bin_confidence += torch.bincount(bins, weights=confidence, minlength=self.n_bins).numpy()
+        self.bin_correct += torch.bincount(bins, weights=predicted.eq(targets).double(),
+                                           minlength=self.n_bins).numpy()
+
+        one_hot = F.one_hot(targets, n).double()
+        self.brier_sum += (probs - one_hot).pow(2).sum().item()
+        self.nll_sum += -probs.gather(1, targets[:, None]).clamp_min(1e-12).log().sum().item()
+        self.total += len(targets)
+
+    def per_class(self, class_names):
+        true_positive = np.diag(self.confusion).astype(float)
+        predicted = self.confusion.sum(0)
+        support = self.confusion.sum(1)
+        precision = np.divide(true_positive, predicted, out=np.zeros_like(true_positive), where=predicted > 0)
+        recall = np.divide(true_positive, support, out=np.zeros_like(true_positive), where=support > 0)
+        denom = precision + recall
+        f1 = np.divide(2 * precision * recall, denom, out=np.zeros_like(denom), where=denom > 0)
+        return pd.DataFrame({'class_name': class_names, 'precision': precision, 'recall': recall,
+                             'f1': f1, 'support': support})
+
+    def calibration(self):
+        count = np.maximum(self.bin_count, 1)
+        return pd.DataFrame({
+            'bin_lower': np.arange(self.n_bins) / self.n_bins,
+            'bin_upper': np.arange(1, self.n_bins + 1) / self.n_bins,
+            'count': self.bin_count,
+            'mean_confidence': self.bin_confidence / count,
+            'accuracy': self.bin_correct / count,
+        })
+
+    def summary(self):
+        total = max(self.total, 1)
+        gaps = np.abs(self.bin_correct - self.bin_confidence)
+        nonempty = self.bin_count > 0
+        return {
+            'samples': int(self.total),
+            'accuracy': float(np.trace(self.confusion) / total),
+            'ece': float(gaps.sum() / total),
+            'mce': float((gaps[nonempty] / self.bin_count[nonempty]).max()) if nonempty.any() else 0.0,
+            'brier': self.brier_sum / total,
+            'nll': self.nll_sum / total,
+        }
+
+
+class EvaluationDataset(Dataset):
+    """Held-out images decoded straight to ``size`` in the loader workers"""
+
+    def __init__(self, image_paths, labels, size=224):
+        self.image_paths = image_paths
+        self.labels = labels
+        self.size = size
+
+    def __len__(self):
+        return len(self.image_paths)
+
+    def __getitem__(self, idx):
+        try:
+            image = torch.from_numpy(load_downscaled(self.image_paths[idx], self.size)).permute(2, 0, 1)
+            valid = True
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not decode {self.image_paths[idx]}: {e}")
+            image = torch.zeros(3, self.size, self.size, dtype=torch.uint8)
+            valid = False
+        return image, self.labels[idx], idx, valid
+
+
+def load_eval_model(checkpoint_path, device):
+    """Model, class names and input size recorded in a checkpoint (pruned ones included)"""
+    model, checkpoint = load_checkpoint(checkpoint_path, device)
+    return model, list(checkpoint['class_names']), int(checkpoint.get('input_size', 224))
+
+
+def held_out_split(labels_file, dataset_path, split='test'):
+    """Rows of ``split``, falling back to 'validation' when the manifest has no test rows"""
+    df = load_manifest(labels_file, dataset_path)
+    held_out = df[df['split'] == split]
+    if len(held_out) == 0 and split == 'test':
+        logger.warning("No test data found, using validation data instead")
+        held_out = df[df['split'] == 'validation']
+    return held_out.reset_index(drop=True)
+
+
+@torch.inference_mode()
+def evaluate_checkpoint(checkpoint_path, held_out, output_dir, batch_size=64, num_workers=4, n_bins=15,
+                        device=None, class_names=None, invert_output=False):
+    """Evaluate one checkpoint on ``held_out`` and write its tables; returns the summary dict
+
+    ``class_names`` overrides the names stored in the checkpoint, in output order.
+    ``invert_output`` swaps the two outputs of a binary head the way the service does
+    for ``TOMATO_INVERT_OUTPUT``, so offline numbers match what it serves.
+    """
+    device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model, checkpoint_classes, input_size = load_eval_model(checkpoint_path, device)
+    class_names = list(class_names) if class_names is not None else checkpoint_classes
+    if len(class_names) != len(checkpoint_classes):
+        raise ValueError(f"{checkpoint_path} has {len(checkpoint_classes)} outputs, got {len(class_names)} class names")
+    class_to_idx = {c: i for i, c in enumerate(class_names)}
+    unknown = set(held_out['label']) - set(class_names)
+    if unknown:
+        logger.warning(f"Skipping rows with labels the checkpoint does not know: {sorted(unknown)}")
+    rows = held_out[held_out['label'].isin(class_names)].reset_index(drop=True)
+
+    dataset = EvaluationDataset(rows['image_path'].tolist(), rows['label'].map(class_to_idx).to_numpy(), input_size)
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                        pin_memory=device.type == 'cuda', persistent_workers=False)
+    mean = torch.tensor(IMAGENET_MEAN, device=device).view(1, 3, 1, 1)
+    std = torch.tensor(IMAGENET_STD, device=device).view(1, 3, 1, 1)
+
+    metrics = StreamingClassificationMetrics(len(class_names), n_bins)
+    all_probs = np.zeros((len(dataset), len(class_names)), dtype=np.float32)
+    decoded = np.zeros(len(dataset), dtype=bool)
+    start = time.perf_counter()
+    for images, targets, indices, valid in loader:
+        images = images.to(device, non_blocking=True).float().div_(255.0).sub_(mean).div_(std)
+        probs = F.softmax(model(images), dim=1)
+        if invert_output and probs.shape[1] == 2:
+            probs = probs[:, [1, 0]]
+        valid = valid.to(device)
+        metrics.update(probs[valid], targets.to(device)[valid])
+        all_probs[indices.numpy()] = probs.float().cpu().numpy()
+        decoded[indices.numpy()] = valid.cpu().numpy()
+    elapsed = time.perf_counter() - start
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    predicted = all_probs.argmax(1)
+    predictions = pd.DataFrame({
+        'image_path': rows['image_path'],
+        'true_label': rows['label'],
+        'predicted_class': np.asarray(class_names)[predicted],
+        'confidence': all_probs.max(1),
+        'correct': rows['label'].to_numpy() == np.asarray(class_names)[predicted],
+        'decoded': decoded,
+    })
+    for i, name in enumerate(class_names):
+        predictions[f'prob_{name}'] = all_probs[:, i]
+    predictions[decoded].reset_index(drop=True).to_parquet(output_dir / 'predictions.parquet', index=False)
+    metrics.per_class(class_names).to_parquet(output_dir / 'per_class.parquet', index=False)
+    confusion = pd.DataFrame(metrics.confusion, index=pd.Index(class_names, name='true_label'),
+                             columns=[f'pred_{c}' for c in class_names])
+    confusion.reset_index().to_parquet(output_dir / 'confusion.parquet', index=False)
+    metrics.calibration().to_parquet(output_dir / 'calibration.parquet', index=False)
+
+    summary = {
+        'checkpoint': str(checkpoint_path),
+        **metrics.summary(),
+        'undecodable': int((~decoded).sum()),
+        'seconds': elapsed,
+        'images_per_second': len(dataset) / elapsed if elapsed > 0 else 0.0,
+    }
+    with open(output_dir / 'summary.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+    logger.info(f"{checkpoint_path}: accuracy {summary['accuracy']:.4f}, ECE {summary['ece']:.4f} "
+                f"on {summary['samples']} images in {elapsed:.1f}s ({summary['images_per_second']:.0f} img/s)")
+    return summary
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Batched evaluation of trained checkpoints on the held-out split')
+    parser.add_argument('plant_type', type=str, choices=['potato', 'tomato'], help='Type of plant')
+    parser.add_argument('--checkpoints', type=str, nargs='+', required=True, help='Checkpoints to evaluate')
+    parser.add_argument('--dataset-path', type=str, default='../dataset', help='Path to dataset')
+    parser.add_argument('--labels-file', type=str, default=None,
+                        help='Manifest CSV (default: <dataset-path>/<plant>_labels.csv)')
+    parser.add_argument('--split', type=str, default='test', help='Manifest split to evaluate')
+    parser.add_argument('--output-dir', type=str, default='evaluation', help='Directory for result tables')
+    parser.add_argument('--batch-size', type=int, default=64, help='Evaluation batch size')
+    parser.add_argument('--num-workers', type=int, default=4, help='Decoding workers')
+    parser.add_argument('--calibration-bins', type=int, default=15, help='Bins for ECE and the reliability table')
+    parser.add_argument('--invert-output', action='store_true',
+                        help="Swap a binary head's outputs, as the service's TOMATO_INVERT_OUTPUT does")
+    args = parser.parse_args()
+
+    dataset_path = Path(args.dataset_path)
+    labels_file = Path(args.labels_file) if args.labels_file else dataset_path / f'{args.plant_type}_labels.csv'
+    held_out = held_out_split(labels_file, dataset_path, args.split)
+    logger.info(f"Evaluating {len(args.checkpoints)} checkpoint(s) on {len(held_out)} images")
+
+    output_dir = Path(args.output_dir) / args.plant_type
+    summaries = []
+    for checkpoint in args.checkpoints:
+        run_dir = output_dir / Path(checkpoint).stem
+        summaries.append(evaluate_checkpoint(checkpoint, held_out, run_dir, args.batch_size, args.num_workers,
+                                             args.calibration_bins, invert_output=args.invert_output))
+    pd.DataFrame(summaries).to_parquet(output_dir / 'summary.parquet', index=False)
+    logger.info(f"Results written to {output_dir}")
+
+
+if __name__ == '__main__':
+    main()
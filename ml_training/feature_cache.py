@@ -0,0 +1,231 @@
+"""Head-only retraining from cached backbone features.
+
+Relabelling images or adding a disease class does not need the backbone to change,
+only the classifier head. This computes the frozen backbone's pooled features for
+every image in the manifest once, stores them in a memory-mapped float16 array keyed
+by image content hash, and trains a new linear head on them in seconds.
+
+The cache lives in ``<cache-dir>/<architecture>-<weights hash>/`` so features from a
+different backbone are never mixed in; within it, only images whose content hash is
+not cached yet are extracted, so adding images costs only the new ones.
+
+    python feature_cache.py tomato --checkpoint models/tomato/tomato_model_best.pth \
+        --cache-dir feature_cache --epochs 200
+
+The result is a full checkpoint (backbone + new head) at
+``<output-dir>/<plant>/<plant>_head_best.pth`` in the format the ML service loads.
+"""
+import copy
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+import timm
+from sklearn.model_selection import train_test_split
+from torch.utils.data import DataLoader
+
+from checkpoints import load_checkpoint
+from distill import ResizeTo
+from manifest import load_manifest
+from pruning_spec import apply_pruning_spec
+from train import PlantDiseaseDataset, build_arg_parser, build_val_transform
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """SHA-1 of a file's bytes: the cache key survives renames and changes with the content"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def backbone_key(checkpoint_path, architecture):
+    """Cache namespace for a backbone: architecture plus a hash of its weights file"""
+    return f"{architecture}-{hash_file(checkpoint_path)[:12]}"
+
+
+class FeatureCache:
+    """Append-only float16 feature matrix (``features.f16``) plus a ``hash -> row`` JSON index"""
+
+    def __init__(self, directory, dim):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.features_path = self.directory / 'features.f16'
+        self.index_path = self.directory / 'index.json'
+        self.index = {}
+        if self.index_path.exists():
+            with open(self.index_path) as f:
+                stored = json.load(f)
+            if stored['dim'] != dim:
+                raise ValueError(f"{self.directory} holds {stored['dim']}-d features, expected {dim}")
+            self.index = stored['rows']
+        # Rows past the index (an interrupted append) are overwritten by the next one
+        with open(self.features_path, 'ab') as f:
+            f.truncate(len(self.index) * dim * 2)
+
+    def __len__(self):
+        return len(self.index)
+
+    def missing(self, hashes):
+        return sorted({h for h in hashes if h not in self.index})
+
+    def append(self, hashes, features):
+        features = np.asarray(features, dtype=np.float16).reshape(len(hashes), self.dim)
+        with open(self.features_path, 'ab') as f:
+            features.tofile(f)
+        for h in hashes:
+            self.index[h] = len(self.index)
+        tmp_path = self.index_path.with_name(self.index_path.name + f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'dim': self.dim, 'rows': self.index}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def lookup(self, hashes):
+        """Features of ``hashes`` as float32, in order"""
+        features = np.memmap(self.features_path, dtype=np.float16, mode='r', shape=(len(self.index), self.dim))
+        return np.asarray(features[[self.index[h] for h in hashes]], dtype=np.float32)
+
+
+@torch.no_grad()
+def extract_features(model, image_paths, input_size, device, batch_size=64, num_workers=4):
+    """Pooled pre-classifier features of ``image_paths`` with the deterministic eval transform"""
+    dataset = PlantDiseaseDataset(list(image_paths), np.zeros(len(image_paths), dtype=np.int64), build_val_transform())
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    resize = ResizeTo(input_size)
+    features = []
+    for data, _ in loader:
+        pooled = model.forward_head(model.forward_features(resize(data.to(device))), pre_logits=True)
+        features.append(pooled.cpu().numpy())
+    return np.concatenate(features) if features else np.zeros((0, model.get_classifier().in_features), np.float32)
+
+
+def update_cache(cache, model, image_paths, input_size, device, batch_size=64, num_workers=4):
+    """Hash every image and extract features only for content not cached yet; returns the hashes"""
+    hashes = [hash_file(p) for p in image_paths]
+    first_path = dict(zip(hashes, image_paths))
+    missing = cache.missing(hashes)
+    if missing:
+        logger.info(f"Extracting features for {len(missing)} new images ({len(cache)} cached)")
+        cache.append(missing, extract_features(model, [first_path[h] for h in missing], input_size, device,
+                                               batch_size, num_workers))
+    else:
+        logger.info(f"All {len(set(hashes))} images already cached")
+    return hashes
+
+
+def train_head(train_x, train_y, val_x, val_y, num_classes, epochs=200, lr=1e-2, weight_decay=1e-4,
+               batch_size=256, seed=0):
+    """Linear head on cached features; returns ``(head, best_val_acc)`` keeping the best epoch"""
+    torch.manual_seed(seed)
+    train_x, val_x = torch.from_numpy(train_x), torch.from_numpy(val_x)
+    train_y, val_y = torch.as_tensor(train_y, dtype=torch.long), torch.as_tensor(val_y, dtype=torch.long)
+    head = nn.Linear(train_x.shape[1], num_classes)
+    optimizer = torch.optim.AdamW(head.parameters(), lr=lr, weight_decay=weight_decay)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=max(epochs, 1))
+    criterion = nn.CrossEntropyLoss()
+    best_acc, best_state = -1.0, None
+    for _ in range(epochs):
+        head.train()
+        for idx in torch.randperm(len(train_x)).split(batch_size):
+            optimizer.zero_grad()
+            criterion(head(train_x[idx]), train_y[idx]).backward()
+            optimizer.step()
+        scheduler.step()
+        head.eval()
+        with torch.no_grad():
+            val_acc = 100.0 * (head(val_x).argmax(1) == val_y).float().mean().item() if len(val_x) else 0.0
+        if val_acc > best_acc:
+            best_acc, best_state = val_acc, copy.deepcopy(head.state_dict())
+    head.load_state_dict(best_state)
+    return head, best_acc
+
+
+def export_checkpoint(backbone_checkpoint, head, class_names, val_acc, output_path):
+    """Backbone weights with the new head, in the format ``PlantDiseaseModel.load_model`` reads"""
+    architecture = backbone_checkpoint['model_name']
+    model = timm.create_model(architecture, pretrained=False, num_classes=len(class_names))
+    if backbone_checkpoint.get('pruning'):
+        apply_pruning_spec(model, backbone_checkpoint['pruning'])
+    classifier_name = model.default_cfg.get('classifier', 'classifier')
+    state = {k: v for k, v in backbone_checkpoint['model_state_dict'].items()
+             if not k.startswith(classifier_name + '.')}
+    state.update({f'{classifier_name}.{k}': v for k, v in head.state_dict().items()})
+    model.load_state_dict(state)
+    checkpoint = {
+        'model_state_dict': model.state_dict(),
+        'class_names': list(class_names),
+        'val_acc': val_acc,
+        'model_name': architecture,
+        'input_size': int(backbone_checkpoint.get('input_size', 224)),
+        'head_only': True,
+    }
+    # The backbone (and its pruned shape) is unchanged, so its version and spec carry over
+    for key in ('pruning', 'model_version'):
+        if backbone_checkpoint.get(key) is not None:
+            checkpoint[key] = backbone_checkpoint[key]
+    torch.save(checkpoint, output_path)
+
+
+def main():
+    parser = build_arg_parser()
+    parser.description = 'Retrain only the classifier head from cached backbone features'
+    parser.add_argument('--checkpoint', type=str, required=True, help='Trained checkpoint providing the backbone')
+    parser.add_argument('--cache-dir', type=str, default='feature_cache', help='Root of the feature caches')
+    parser.add_argument('--head-lr', type=float, default=1e-2, help='Learning rate for the linear head')
+    parser.set_defaults(epochs=200)
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    dataset_path = Path(args.dataset_path)
+    df = load_manifest(dataset_path / f'{args.plant_type}_labels.csv', dataset_path)
+    train_df = df[df['split'] == 'train']
+    class_names = sorted(train_df['label'].unique())
+    class_to_idx = {c: i for i, c in enumerate(class_names)}
+
+    model, checkpoint = load_checkpoint(args.checkpoint, device)
+    input_size = int(checkpoint.get('input_size', 224))
+    cache = FeatureCache(Path(args.cache_dir) / backbone_key(args.checkpoint, checkpoint['model_name']),
+                         model.get_classifier().in_features)
+
+    started = time.perf_counter()
+    hashes = update_cache(cache, model, train_df['image_path'].tolist(), input_size, device,
+                          args.batch_size, args.num_workers)
+    extracted = time.perf_counter()
+
+    # Same stratified split as PlantDiseaseTrainer.prepare_data
+    labels = train_df['label'].map(class_to_idx).values
+    train_idx, val_idx = train_test_split(np.arange(len(hashes)), test_size=0.2, random_state=42, stratify=labels)
+    features = cache.lookup(hashes)
+    head, val_acc = train_head(features[train_idx], labels[train_idx], features[val_idx], labels[val_idx],
+                               len(class_names), args.epochs, args.head_lr, args.weight_decay)
+    trained = time.perf_counter()
+    logger.info(f"Head val acc {val_acc:.2f}% (features {extracted - started:.1f}s, head {trained - extracted:.1f}s)")
+
+    test_df = df[(df['split'] == 'test') & df['label'].isin(class_names)]
+    if len(test_df):
+        test_hashes = update_cache(cache, model, test_df['image_path'].tolist(), input_size, device,
+                                   args.batch_size, args.num_workers)
+        with torch.no_grad():
+            predicted = head(torch.from_numpy(cache.lookup(test_hashes))).argmax(1).numpy()
+        test_acc = 100.0 * float((predicted == test_df['label'].map(class_to_idx).values).mean())
+        logger.info(f"Head test acc {test_acc:.2f}% on {len(test_df)} images")
+
+    output_dir = Path(args.output_dir) / args.plant_type
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = output_dir / f'{args.plant_type}_head_best.pth'
+    export_checkpoint(checkpoint, head, class_names, val_acc, output_path)
+    logger.info(f"Checkpoint with retrained head written to {output_path}")
+
+
+if __name__ == '__main__':
+    main()
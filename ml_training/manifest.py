@@ -0,0 +1,31 @@
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_image_path(image_path, dataset_path: Path) -> str:
+    """Resolve a manifest ``image_path`` on the current OS.
+
+    Manifests are written on Windows relative to the repository root
+    (``dataset\\healthy\\...``), so normalise separators and fall back to the
+    parent of ``dataset_path`` when the path does not exist as given.
+    """
+    path = Path(str(image_path).replace('\\', '/'))
+    if path.is_absolute() or path.exists():
+        return str(path)
+    candidate = Path(dataset_path).parent / path
+    return str(candidate if candidate.exists() else path)
+
+
+def load_manifest(labels_file: Path, dataset_path: Path) -> pd.DataFrame:
+    """Read a labels CSV, resolve its image paths and drop rows whose file is missing"""
+    df = pd.read_csv(labels_file)
+    df['image_path'] = [resolve_image_path(p, dataset_path) for p in df['image_path']]
+    exists = df['image_path'].map(os.path.exists)
+    if not exists.all():
+        logger.warning(f"Filtered out {int((~exists).sum())} missing images from {labels_file}")
+    return df[exists].reset_index(drop=True)
@@ -0,0 +1,98 @@
+"""Build the embedding-distance OOD reference used by the ML service's quality gate.
+
+Embeds the training split with a trained classifier (pooled features feeding its
+classifier head), stores one L2-normalised centroid per class, and calibrates the
+cosine-distance threshold as a high quantile of the held-out split's distances to
+its nearest centroid. Inputs farther than that from every centroid are reported as
+out of distribution.
+
+    python ood_reference.py tomato --checkpoint models/tomato/tomato_model_best.pth
+
+The reference is written to ``<output-dir>/<plant>/<plant>_ood_reference.npz``, the
+path the service loads by default (``TOMATO_OOD_REFERENCE_PATH``).
+"""
+import argparse
+import logging
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+
+from distill import ResizeTo, load_classifier
+from manifest import load_manifest
+from train import PlantDiseaseDataset, build_val_transform
+
+logger = logging.getLogger(__name__)
+
+
+@torch.no_grad()
+def embed_split(model, df, class_names, input_size, device, batch_size=32, num_workers=0):
+    """L2-normalised pre-classifier embeddings and label indices for the rows of ``df``"""
+    labels = df['label'].map({c: i for i, c in enumerate(class_names)}).values
+    loader = DataLoader(PlantDiseaseDataset(df['image_path'].values, labels, build_val_transform()),
+                        batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    resize = ResizeTo(input_size)
+    embeddings, targets = [], []
+    for data, target in loader:
+        features = model.forward_head(model.forward_features(resize(data.to(device))), pre_logits=True)
+        embeddings.append(F.normalize(features, dim=1).cpu())
+        targets.append(target)
+    return torch.cat(embeddings).numpy(), torch.cat(targets).numpy()
+
+
+def class_centroids(embeddings, targets, num_classes):
+    """One L2-normalised mean embedding per class"""
+    centroids = np.stack([embeddings[targets == c].mean(0) for c in range(num_classes)])
+    return centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+
+def nearest_centroid_distance(embeddings, centroids):
+    """Cosine distance from each embedding to its closest centroid"""
+    return 1.0 - (embeddings @ centroids.T).max(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the OOD reference (class centroids + threshold)')
+    parser.add_argument('plant_type', type=str, choices=['potato', 'tomato'])
+    parser.add_argument('--checkpoint', type=str, required=True, help='Checkpoint served by the ML service')
+    parser.add_argument('--dataset-path', type=str, default='../dataset', help='Path to dataset')
+    parser.add_argument('--output-dir', type=str, default='models', help='Reference goes to <output-dir>/<plant>/')
+    parser.add_argument('--quantile', type=float, default=0.99,
+                        help='Quantile of held-out distances used as the OOD threshold')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--num-workers', type=int, default=0)
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model, class_names, input_size = load_classifier(args.checkpoint, device)
+    dataset_path = Path(args.dataset_path)
+    df = load_manifest(dataset_path / f'{args.plant_type}_labels.csv', dataset_path)
+    df = df[df['label'].isin(class_names)]
+    train_df = df[df['split'] == 'train']
+    held_out = df[df['split'] == 'validation']
+    if len(held_out) == 0:
+        held_out = df[df['split'] == 'test']
+
+    train_embeddings, train_targets = embed_split(model, train_df, class_names, input_size, device,
+                                                  args.batch_size, args.num_workers)
+    centroids = class_centroids(train_embeddings, train_targets, len(class_names))
+    calibration = held_out if len(held_out) else train_df
+    held_out_embeddings, _ = embed_split(model, calibration, class_names, input_size, device,
+                                         args.batch_size, args.num_workers)
+    distances = nearest_centroid_distance(held_out_embeddings, centroids)
+    threshold = float(np.quantile(distances, args.quantile))
+    logger.info(f"{len(class_names)} centroids from {len(train_df)} images; OOD threshold {threshold:.4f} "
+                f"(q{args.quantile:g} of {len(distances)} held-out distances)")
+
+    output_dir = Path(args.output_dir) / args.plant_type
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = output_dir / f'{args.plant_type}_ood_reference.npz'
+    np.savez(output_path, centroids=centroids.astype(np.float32), threshold=threshold,
+             class_names=np.array(class_names), quantile=args.quantile)
+    logger.info(f"OOD reference written to {output_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""Structured pruning of trained checkpoints with latency-aware evaluation.
+
+Works on timm EfficientNet/MobileNetV3 checkpoints in two kinds of steps, each
+followed by a short fine-tune:
+
+* channel steps narrow the expansion width of every ``InvertedResidual`` block,
+  keeping the channels with the largest depthwise BN scale; widths are rounded to
+  multiples of 8 so the remaining convolutions stay on fast CPU kernel paths;
+* block steps replace one residual block by an identity, greedily choosing the block
+  whose removal costs the least validation accuracy for the most measured latency.
+
+After every step the held-out split of ``<plant>_labels.csv`` is evaluated and the
+real CPU latency measured, so the report shows the accuracy change next to the
+speed-up. The last step within ``--accuracy-tolerance`` of the original is exported
+to ``<output-dir>/<plant>/<plant>_pruned_best.pth``; its ``pruning`` spec lets
+``PlantDiseaseModel.load_model`` rebuild the narrower network.
+
+    python prune.py tomato --checkpoint models/tomato/tomato_model_best.pth \
+        --channel-ratios 0.25 0.5 --drop-blocks 2 --finetune-epochs 3
+"""
+import copy
+import json
+import logging
+import shutil
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+
+from checkpoints import load_checkpoint
+from distill import ResizeTo, build_test_loader, evaluate_accuracy, measure_latency
+from pruning_spec import drop_block, shrink_inverted_residual
+from train import PlantDiseaseTrainer, TrainingConfig, build_arg_parser
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_MULTIPLE = 8
+
+
+def inverted_residuals(model):
+    """``(name, block)`` for every prunable block still in the network"""
+    return [(name, m) for name, m in model.named_modules()
+            if hasattr(m, 'conv_pw') and hasattr(m, 'conv_pwl') and hasattr(m, 'bn2')]
+
+
+def round_channels(width, multiple=CHANNEL_MULTIPLE):
+    return max(multiple, int(round(width / multiple)) * multiple)
+
+
+def prune_channels(model, original_widths, ratio):
+    """Narrow every block to ``(1 - ratio)`` of its original expansion width"""
+    for name, block in inverted_residuals(model):
+        current = block.bn2.num_features
+        target = min(current, round_channels(original_widths[name] * (1 - ratio)))
+        if target < current:
+            importance = block.bn2.weight.detach().abs()
+            keep = importance.topk(target).indices.sort().values
+            shrink_inverted_residual(block, keep)
+
+
+def pruning_spec(model, dropped_blocks):
+    return {
+        'expansion_channels': {name: block.bn2.num_features for name, block in inverted_residuals(model)},
+        'dropped_blocks': list(dropped_blocks),
+    }
+
+
+def skip_blocks(model):
+    """Residual blocks that can be removed without changing tensor shapes"""
+    return [name for name, m in model.named_modules() if getattr(m, 'has_skip', False)]
+
+
+class FineTuneTrainer(PlantDiseaseTrainer):
+    """Trainer that fine-tunes an existing (pruned) model instead of creating one"""
+
+    def __init__(self, config, spec_fn):
+        super().__init__(config)
+        self.base_model = None
+        self.spec_fn = spec_fn
+        self.input_size = 224
+
+    def use_input_size(self, input_size):
+        """Train and validate at the resolution the checkpoint was trained at (call after prepare_data)"""
+        self.input_size = input_size
+        self.train_batch_transform = ResizeTo(input_size, self.train_batch_transform)
+        self.val_batch_transform = ResizeTo(input_size, self.val_batch_transform)
+
+    def create_model(self):
+        self.model = self.base_model.to(self.device)
+        logger.info(f"Fine-tuning pruned model: {sum(p.numel() for p in self.model.parameters()):,} parameters")
+
+    def checkpoint_metadata(self):
+        metadata = super().checkpoint_metadata()
+        metadata.update({'pruning': self.spec_fn(), 'input_size': self.input_size})
+        return metadata
+
+
+def load_checkpoint_model(path, class_names, device):
+    """Rebuild a (possibly already pruned) checkpoint with its classifier in ``class_names`` order
+
+    Returns ``(model, architecture, dropped_blocks, input_size)``.
+    """
+    model, checkpoint = load_checkpoint(path, device)
+    ckpt_classes = list(checkpoint['class_names'])
+    spec = checkpoint.get('pruning') or {}
+    if ckpt_classes != list(class_names):
+        order = torch.tensor([ckpt_classes.index(c) for c in class_names])
+        classifier = model.get_classifier()
+        classifier.weight = nn.Parameter(classifier.weight.data[order].clone())
+        classifier.bias = nn.Parameter(classifier.bias.data[order].clone())
+    return (model, checkpoint['model_name'], list(spec.get('dropped_blocks', [])),
+            int(checkpoint.get('input_size', 224)))
+
+
+def main():
+    parser = build_arg_parser()
+    parser.description = 'Structured pruning with fine-tuning and latency-aware evaluation'
+    parser.add_argument('--checkpoint', type=str, required=True, help='Trained checkpoint to prune')
+    parser.add_argument('--channel-ratios', type=float, nargs='*', default=[0.25, 0.5],
+                        help='Cumulative fractions of expansion channels to remove, one step each')
+    parser.add_argument('--drop-blocks', type=int, default=0, help='Residual blocks to remove, one step each')
+    parser.add_argument('--finetune-epochs', type=int, default=2, help='Fine-tuning epochs after every step')
+    parser.add_argument('--accuracy-tolerance', type=float, default=1.0,
+                        help='Max held-out accuracy drop (percentage points) for the exported model')
+    parser.add_argument('--latency-threads', type=int, default=1, help='torch threads for latency measurement')
+    args = parser.parse_args()
+    args.epochs = args.finetune_epochs
+
+    config = TrainingConfig(args)
+    base_output = config.output_dir
+    dropped = []
+    trainer = FineTuneTrainer(config, lambda: pruning_spec(trainer.base_model, dropped))
+    trainer.prepare_data()
+    device = trainer.device
+    model, config.model_name, dropped[:], input_size = load_checkpoint_model(args.checkpoint, trainer.class_names,
+                                                                            device)
+    trainer.use_input_size(input_size)
+    test_loader = build_test_loader(config, trainer.class_names, args.batch_size)
+    original_widths = {name: block.bn2.num_features for name, block in inverted_residuals(model)}
+
+    def measure(name, checkpoint):
+        model.eval()
+        accuracy = evaluate_accuracy(model, test_loader, input_size, device)
+        threads = torch.get_num_threads()
+        torch.set_num_threads(args.latency_threads)
+        latency = measure_latency(model, input_size)
+        torch.set_num_threads(threads)
+        model.to(device)
+        step = {
+            'step': name,
+            'checkpoint': str(checkpoint),
+            'params_m': sum(p.numel() for p in model.parameters()) / 1e6,
+            'latency_ms': latency,
+            'accuracy': accuracy,
+        }
+        if steps:
+            step['accuracy_change'] = accuracy - steps[0]['accuracy']
+            step['accuracy_change_vs_previous'] = accuracy - steps[-1]['accuracy']
+            step['speedup'] = steps[0]['latency_ms'] / latency
+        logger.info(f"[{name}] acc {accuracy:.2f}% ({step.get('accuracy_change', 0.0):+.2f}) "
+                    f"latency {latency:.2f} ms, {step['params_m']:.2f}M params")
+        steps.append(step)
+
+    def finetune(name):
+        config.output_dir = base_output / f'pruned_{name}'
+        config.output_dir.mkdir(parents=True, exist_ok=True)
+        trainer.base_model = model
+        trainer.train()
+        best = torch.load(config.output_dir / 'model_best.pth', map_location=device, weights_only=False)
+        model.load_state_dict(best['model_state_dict'])
+        measure(name, config.output_dir / 'model_best.pth')
+
+    steps = []
+    measure('original', args.checkpoint)
+
+    for ratio in args.channel_ratios:
+        prune_channels(model, original_widths, ratio)
+        finetune(f'channels_{ratio:g}')
+
+    for _ in range(args.drop_blocks):
+        candidates = [name for name in skip_blocks(model) if name not in dropped]
+        if not candidates:
+            break
+        # Score every candidate by validation accuracy lost per millisecond saved
+        base_val = evaluate_accuracy(model, trainer.val_loader, input_size, device)
+        base_latency = measure_latency(model, input_size, runs=20, warmup=3)
+        model.to(device)
+        scores = []
+        for name in candidates:
+            trial = copy.deepcopy(model)
+            drop_block(trial, name)
+            val_drop = base_val - evaluate_accuracy(trial, trainer.val_loader, input_size, device)
+            saved = max(base_latency - measure_latency(trial, input_size, runs=20, warmup=3), 1e-3)
+            scores.append((max(val_drop, 0.0) / saved, -saved, name))
+        _, _, name = min(scores)
+        logger.info(f"Dropping {name}")
+        drop_block(model, name)
+        dropped.append(name)
+        finetune(f'drop_{name.replace(".", "_")}')
+
+    eligible = [s for s in steps[1:] if s['accuracy_change'] >= -args.accuracy_tolerance]
+    exported = eligible[-1] if eligible else None
+    if exported:
+        export_path = base_output / f'{args.plant_type}_pruned_best.pth'
+        shutil.copyfile(exported['checkpoint'], export_path)
+        logger.info(f"Exported {exported['step']} ({exported['speedup']:.2f}x faster) to {export_path}")
+    else:
+        logger.warning(f"No pruning step within {args.accuracy_tolerance} points of the original; nothing exported")
+
+    report = {
+        'checkpoint': args.checkpoint,
+        'latency_threads': args.latency_threads,
+        'steps': steps,
+        'exported': exported['step'] if exported else None,
+    }
+    with open(base_output / 'pruning_report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Pruning report written to {base_output / 'pruning_report.json'}")
+
+
+if __name__ == '__main__':
+    main()
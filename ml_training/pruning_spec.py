@@ -0,0 +1,58 @@
+"""Pruning spec of structurally pruned checkpoints: shrinking blocks and rebuilding them.
+
+A pruned checkpoint stores ``pruning = {'expansion_channels': {block: width},
+'dropped_blocks': [block, ...]}``. ``apply_pruning_spec`` reshapes a freshly created
+timm model so the pruned state dict loads into it. The ML service reads the same
+format with ``ml_service/app/pruning.py``; ``ml_service/tests/test_pruning.py``
+round-trips checkpoints between the two so the format cannot drift. This module
+only depends on torch so that test can load it.
+"""
+import torch
+import torch.nn as nn
+
+
+def _slice_conv(conv, keep, dim):
+    conv.weight = nn.Parameter(conv.weight.data.index_select(dim, keep).clone())
+    if dim == 0:
+        if conv.bias is not None:
+            conv.bias = nn.Parameter(conv.bias.data.index_select(0, keep).clone())
+        conv.out_channels = len(keep)
+    else:
+        conv.in_channels = len(keep)
+
+
+def _slice_bn(bn, keep):
+    bn.weight = nn.Parameter(bn.weight.data.index_select(0, keep).clone())
+    bn.bias = nn.Parameter(bn.bias.data.index_select(0, keep).clone())
+    bn.running_mean = bn.running_mean.index_select(0, keep).clone()
+    bn.running_var = bn.running_var.index_select(0, keep).clone()
+    bn.num_features = len(keep)
+
+
+def shrink_inverted_residual(block, keep):
+    """Keep only the expansion channels ``keep`` of a timm ``InvertedResidual`` block in place"""
+    keep = keep.to(block.conv_pw.weight.device)
+    _slice_conv(block.conv_pw, keep, dim=0)
+    _slice_bn(block.bn1, keep)
+    _slice_conv(block.conv_dw, keep, dim=0)
+    block.conv_dw.in_channels = block.conv_dw.groups = len(keep)
+    _slice_bn(block.bn2, keep)
+    se = getattr(block, 'se', None)
+    if se is not None and hasattr(se, 'conv_reduce'):
+        _slice_conv(se.conv_reduce, keep, dim=1)
+        _slice_conv(se.conv_expand, keep, dim=0)
+    _slice_conv(block.conv_pwl, keep, dim=1)
+
+
+def drop_block(model, name):
+    parent_name, _, index = name.rpartition('.')
+    model.get_submodule(parent_name)[int(index)] = nn.Identity()
+
+
+def apply_pruning_spec(model, spec):
+    """Reshape a fresh model to ``spec`` so a pruned state dict loads into it"""
+    for name, width in spec.get('expansion_channels', {}).items():
+        shrink_inverted_residual(model.get_submodule(name), torch.arange(int(width)))
+    for name in spec.get('dropped_blocks', []):
+        drop_block(model, name)
+    return model
@@ -0,0 +1,251 @@
+"""Hyperparameter sweeps for train.py.
+
+Trials run in parallel in a local process pool and share one decoded-image cache.
+Each trial reports its per-epoch validation metrics to a SQLite store in the sweep
+directory; a median rule prunes trials that fall behind their peers. No MLflow
+server is involved.
+
+    python sweep.py tomato --trials 12 --epochs 15 --model-names efficientnet_b0 mobilenetv3_small_100
+"""
+import argparse
+import json
+import logging
+import math
+import multiprocessing as mp
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SweepStore:
+    """SQLite-backed record of trials and their per-epoch metrics.
+
+    Every call opens its own connection so the store can be shared by trial processes.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS trials (
+                    trial_id INTEGER PRIMARY KEY,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    best_val_acc REAL,
+                    epochs INTEGER,
+                    duration_s REAL,
+                    checkpoint TEXT,
+                    error TEXT
+                );
+                CREATE TABLE IF NOT EXISTS metrics (
+                    trial_id INTEGER NOT NULL,
+                    epoch INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    PRIMARY KEY (trial_id, epoch, name)
+                );
+            ''')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def create_trial(self, params):
+        with self._connect() as conn:
+            cursor = conn.execute('INSERT INTO trials (params, status) VALUES (?, ?)',
+                                  (json.dumps(params), 'pending'))
+            return cursor.lastrowid
+
+    def set_status(self, trial_id, status):
+        with self._connect() as conn:
+            conn.execute('UPDATE trials SET status = ? WHERE trial_id = ?', (status, trial_id))
+
+    def report(self, trial_id, epoch, metrics):
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO metrics (trial_id, epoch, name, value) VALUES (?, ?, ?, ?)',
+                [(trial_id, epoch, name, float(value)) for name, value in metrics.items()]
+            )
+
+    def finish(self, trial_id, status, best_val_acc=None, epochs=None, duration_s=None,
+               checkpoint=None, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE trials SET status = ?, best_val_acc = ?, epochs = ?, duration_s = ?, '
+                'checkpoint = ?, error = ? WHERE trial_id = ?',
+                (status, best_val_acc, epochs, duration_s, checkpoint, error, trial_id)
+            )
+
+    def best_so_far(self, epoch, metric, exclude_trial):
+        """Each other trial's best ``metric`` up to ``epoch``, for trials that reached it"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT MAX(value) FROM metrics WHERE name = ? AND epoch <= ? AND trial_id != ? '
+                'GROUP BY trial_id HAVING MAX(epoch) >= ?',
+                (metric, epoch, exclude_trial, epoch)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def results(self):
+        with self._connect() as conn:
+            return pd.read_sql_query('SELECT * FROM trials ORDER BY best_val_acc DESC', conn)
+
+
+class MedianPruner:
+    """Prune a trial whose best metric so far is below the median of its peers at the same epoch"""
+
+    def __init__(self, store, metric='val_acc', warmup_epochs=2, min_peers=2):
+        self.store = store
+        self.metric = metric
+        self.warmup_epochs = warmup_epochs
+        self.min_peers = min_peers
+
+    def should_prune(self, trial_id, epoch, best_value):
+        if epoch + 1 < self.warmup_epochs:
+            return False
+        peers = self.store.best_so_far(epoch, self.metric, trial_id)
+        if len(peers) < self.min_peers:
+            return False
+        return best_value < float(np.median(peers))
+
+
+def sample_params(rng, args):
+    """Draw one configuration from the search space given on the command line"""
+    def log_uniform(low, high):
+        return float(math.exp(rng.uniform(math.log(low), math.log(high))))
+
+    return {
+        'learning_rate': log_uniform(*args.lr_range),
+        'weight_decay': log_uniform(*args.wd_range),
+        'batch_size': rng.choice(args.batch_sizes),
+        'model_name': rng.choice(args.model_names),
+    }
+
+
+def run_trial(trial_id, params, base_argv, store_path, threads):
+    """Train one configuration; runs inside a pool worker process"""
+    import torch
+    import train
+
+    torch.set_num_threads(threads)
+    store = SweepStore(store_path)
+    pruner = MedianPruner(store, warmup_epochs=base_argv['warmup_epochs'])
+    store.set_status(trial_id, 'running')
+
+    args = train.build_arg_parser().parse_args(base_argv['argv'])
+    for key, value in params.items():
+        setattr(args, key, value)
+    args.output_dir = str(Path(base_argv['sweep_dir']) / f'trial_{trial_id}')
+    args.tracking_dir = str(Path(args.output_dir) / 'tracking')
+
+    state = {'best': -math.inf, 'epochs': 0, 'pruned': False}
+
+    def on_epoch(epoch, metrics):
+        store.report(trial_id, epoch, metrics)
+        state['best'] = max(state['best'], metrics['val_acc'])
+        state['epochs'] = epoch + 1
+        if pruner.should_prune(trial_id, epoch, state['best']):
+            state['pruned'] = True
+            return True
+        return False
+
+    start = time.monotonic()
+    try:
+        config = train.TrainingConfig(args)
+        config.output_dir.mkdir(parents=True, exist_ok=True)
+        trainer = train.PlantDiseaseTrainer(config)
+        trainer.prepare_data()
+        _, best_val_acc = trainer.train(epoch_callback=on_epoch)
+        status = 'pruned' if state['pruned'] else 'completed'
+        store.finish(trial_id, status, best_val_acc, state['epochs'], time.monotonic() - start,
+                     str(config.output_dir / 'model_best.pth'))
+        return trial_id, status, best_val_acc
+    except Exception as e:
+        store.finish(trial_id, 'failed', duration_s=time.monotonic() - start, error=str(e))
+        return trial_id, 'failed', None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a parallel hyperparameter sweep over train.py')
+    parser.add_argument('plant_type', type=str, choices=['potato', 'tomato'], help='Type of plant to train')
+    parser.add_argument('--dataset-path', type=str, default='../dataset', help='Path to dataset')
+    parser.add_argument('--sweep-dir', type=str, default='sweeps/latest', help='Directory for the store, cache and checkpoints')
+    parser.add_argument('--trials', type=int, default=8, help='Number of trials')
+    parser.add_argument('--epochs', type=int, default=15, help='Maximum epochs per trial')
+    parser.add_argument('--patience', type=int, default=5, help='Early-stopping patience per trial')
+    parser.add_argument('--warmup-epochs', type=int, default=2, help='Epochs before a trial can be pruned')
+    parser.add_argument('--lr-range', type=float, nargs=2, default=[1e-4, 3e-3], help='Log-uniform learning-rate range')
+    parser.add_argument('--wd-range', type=float, nargs=2, default=[1e-4, 1e-1], help='Log-uniform weight-decay range')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[16, 32], help='Batch sizes to sample from')
+    parser.add_argument('--model-names', type=str, nargs='+', default=['efficientnet_b0'], help='timm models to sample from')
+    parser.add_argument('--threads-per-trial', type=int, default=2, help='torch threads per trial')
+    parser.add_argument('--parallel', type=int, default=None,
+                        help='Concurrent trials (default: available cores // threads-per-trial)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the search')
+    args = parser.parse_args()
+
+    sweep_dir = Path(args.sweep_dir)
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+    store_path = sweep_dir / 'sweep.db'
+    store = SweepStore(store_path)
+
+    # Decode the manifest once; every trial memory-maps the same cache
+    from batch_augment import DecodedImageCache
+    from manifest import load_manifest
+    dataset_path = Path(args.dataset_path)
+    df = load_manifest(dataset_path / f'{args.plant_type}_labels.csv', dataset_path)
+    cache_path = sweep_dir / 'decoded_cache.npy'
+    DecodedImageCache.open_or_build(cache_path, df[df['split'] == 'train']['image_path'].tolist())
+
+    base_argv = {
+        'argv': [
+            args.plant_type,
+            '--dataset-path', args.dataset_path,
+            '--epochs', str(args.epochs),
+            '--patience', str(args.patience),
+            '--num-workers', '0',
+            '--mlflow-uri', '',
+            '--decoded-cache', str(cache_path),
+        ],
+        'sweep_dir': str(sweep_dir),
+        'warmup_epochs': args.warmup_epochs,
+    }
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    parallel = args.parallel or max(1, cores // args.threads_per_trial)
+    logger.info(f"Running {args.trials} trials, {parallel} at a time, {args.threads_per_trial} threads each")
+
+    rng = random.Random(args.seed)
+    with ProcessPoolExecutor(max_workers=parallel, mp_context=mp.get_context('spawn')) as pool:
+        futures = []
+        for _ in range(args.trials):
+            params = sample_params(rng, args)
+            trial_id = store.create_trial(params)
+            futures.append(pool.submit(run_trial, trial_id, params, base_argv, str(store_path), args.threads_per_trial))
+        for future in as_completed(futures):
+            trial_id, status, best = future.result()
+            logger.info(f"Trial {trial_id} {status}" + (f": best val acc {best:.2f}%" if best is not None else ''))
+
+    results = store.results()
+    results.to_csv(sweep_dir / 'results.csv', index=False)
+    completed = results[results['status'].isin(['completed', 'pruned'])]
+    if len(completed):
+        best = completed.iloc[0]
+        logger.info(f"Best trial {best['trial_id']}: {best['best_val_acc']:.2f}% with {best['params']}")
+        with open(sweep_dir / 'best_params.json', 'w') as f:
+            json.dump({'trial_id': int(best['trial_id']), 'best_val_acc': float(best['best_val_acc']),
+                       'params': json.loads(best['params'])}, f, indent=2)
+    logger.info(f"Results written to {sweep_dir / 'results.csv'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""Buffered, non-blocking experiment tracking.
+
+``ExperimentTracker`` records params, metrics and artifact paths to a local run
+directory first and uploads them to MLflow from a background thread, batching
+metric writes. When the MLflow server cannot be reached the tracker stays in
+local-only mode and training continues; ``python tracking.py sync <run_dir>``
+uploads a local run later.
+
+Local run layout::
+
+    <tracking_dir>/<run_id>/meta.json       run id, experiment, status, remote run id
+    <tracking_dir>/<run_id>/params.json
+    <tracking_dir>/<run_id>/metrics.jsonl   one {"key", "value", "step", "timestamp"} per line
+    <tracking_dir>/<run_id>/artifacts.jsonl one {"path"} per line
+"""
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def server_reachable(tracking_uri, timeout=2.0):
+    """Whether an HTTP(S) tracking server answers; non-HTTP stores count as reachable"""
+    if urlparse(tracking_uri).scheme not in ('http', 'https'):
+        return True
+    import requests
+    try:
+        return requests.get(tracking_uri.rstrip('/') + '/health', timeout=timeout).ok
+    except requests.RequestException:
+        return False
+
+
+class _MlflowUploader:
+    """Thin wrapper over ``MlflowClient`` used only from the tracker's worker thread"""
+
+    def __init__(self, tracking_uri, experiment_name, run_name=None):
+        from mlflow.tracking import MlflowClient
+        self.client = MlflowClient(tracking_uri)
+        experiment = self.client.get_experiment_by_name(experiment_name)
+        experiment_id = experiment.experiment_id if experiment else self.client.create_experiment(experiment_name)
+        self.run_id = self.client.create_run(experiment_id, run_name=run_name).info.run_id
+
+    def log_batch(self, metrics=(), params=None):
+        from mlflow.entities import Metric, Param
+        self.client.log_batch(
+            self.run_id,
+            metrics=[Metric(m['key'], m['value'], m['timestamp'], m['step']) for m in metrics],
+            params=[Param(k, str(v)) for k, v in (params or {}).items()]
+        )
+
+    def log_artifact(self, path):
+        self.client.log_artifact(self.run_id, path)
+
+    def terminate(self, status):
+        self.client.set_terminated(self.run_id, status)
+
+
+class ExperimentTracker:
+    """Drop-in for the ``mlflow.log_*`` calls in the trainer that never blocks a step.
+
+    ``log_*`` methods append to local files and enqueue work; a daemon thread uploads
+    metrics in batches of up to ``batch_size`` every ``flush_interval`` seconds and
+    artifacts one by one. Any upload failure switches the tracker to local-only mode.
+    """
+
+    MAX_BATCH = 1000  # MLflow's log_batch limit
+
+    def __init__(self, tracking_uri, experiment_name, tracking_dir, run_name=None,
+                 flush_interval=5.0, batch_size=200):
+        self.tracking_uri = tracking_uri
+        self.experiment_name = experiment_name
+        self.run_name = run_name
+        self.flush_interval = flush_interval
+        self.batch_size = min(batch_size, self.MAX_BATCH)
+        self.run_id = uuid.uuid4().hex
+        self.run_dir = Path(tracking_dir) / self.run_id
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        self.local_only = not tracking_uri
+        self.remote_run_id = None
+        self._params = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._write_meta('RUNNING')
+        self._thread = None
+        if not self.local_only:
+            self._thread = threading.Thread(target=self._worker, name='experiment-tracker', daemon=True)
+            self._thread.start()
+
+    # -- public API ---------------------------------------------------------------
+
+    def log_params(self, params):
+        self._params.update(params)
+        with open(self.run_dir / 'params.json', 'w') as f:
+            json.dump({k: str(v) for k, v in self._params.items()}, f, indent=2)
+        self._enqueue(('params', dict(params)))
+
+    def log_metrics(self, metrics, step=0):
+        timestamp = int(time.time() * 1000)
+        records = [{'key': k, 'value': float(v), 'step': int(step), 'timestamp': timestamp}
+                   for k, v in metrics.items()]
+        with self._lock, open(self.run_dir / 'metrics.jsonl', 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        for record in records:
+            self._enqueue(('metric', record))
+
+    def log_artifact(self, path):
+        """Record ``path`` and upload it in the background; the file must not be rewritten"""
+        with self._lock, open(self.run_dir / 'artifacts.jsonl', 'a') as f:
+            f.write(json.dumps({'path': str(path)}) + '\n')
+        self._enqueue(('artifact', str(path)))
+
+    def end_run(self, status='FINISHED', timeout=300.0):
+        """Flush pending uploads (waiting at most ``timeout`` seconds) and close the run"""
+        if self._thread is not None:
+            self._queue.put(('end', status))
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning(f"Tracker still uploading after {timeout:.0f}s; sync later with "
+                               f"`python tracking.py sync {self.run_dir}`")
+        self._write_meta(status)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_run('FAILED' if exc_type else 'FINISHED')
+        return False
+
+    # -- internals ----------------------------------------------------------------
+
+    def _enqueue(self, item):
+        if not self.local_only:
+            self._queue.put(item)
+
+    def _write_meta(self, status):
+        meta = {
+            'run_id': self.run_id,
+            'run_name': self.run_name,
+            'experiment_name': self.experiment_name,
+            'tracking_uri': self.tracking_uri,
+            'remote_run_id': self.remote_run_id,
+            'local_only': self.local_only,
+            'status': status,
+        }
+        with open(self.run_dir / 'meta.json', 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    def _go_local(self, reason):
+        if not self.local_only:
+            logger.warning(f"MLflow tracking unavailable ({reason}); continuing in local-only mode at {self.run_dir}")
+        self.local_only = True
+
+    def _worker(self):
+        uploader = None
+        if server_reachable(self.tracking_uri):
+            try:
+                uploader = _MlflowUploader(self.tracking_uri, self.experiment_name, self.run_name)
+                self.remote_run_id = uploader.run_id
+                self._write_meta('RUNNING')
+            except Exception as e:
+                self._go_local(e)
+        else:
+            self._go_local(f"{self.tracking_uri} not reachable")
+
+        metrics, params = [], {}
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.0))
+            except queue.Empty:
+                item = None
+            kind, payload = item if item not in (None, _STOP) else (None, None)
+            if kind == 'metric':
+                metrics.append(payload)
+            elif kind == 'params':
+                params.update(payload)
+
+            # Flush buffered metrics before anything that must be ordered after them
+            if (item is _STOP or kind in ('artifact', 'end') or len(metrics) >= self.batch_size
+                    or time.monotonic() >= deadline):
+                if metrics or params:
+                    self._upload(uploader, self._log_batches, uploader, metrics, params)
+                metrics, params = [], {}
+                deadline = time.monotonic() + self.flush_interval
+
+            if kind == 'artifact':
+                self._upload(uploader, lambda: uploader.log_artifact(payload))
+            elif kind == 'end':
+                self._upload(uploader, lambda: uploader.terminate(payload))
+            elif item is _STOP:
+                return
+
+    def _upload(self, uploader, fn, *args):
+        if uploader is None or self.local_only:
+            return
+        try:
+            fn(*args)
+        except Exception as e:
+            self._go_local(e)
+
+    def _log_batches(self, uploader, metrics, params):
+        for start in range(0, max(len(metrics), 1), self.batch_size):
+            uploader.log_batch(metrics[start:start + self.batch_size], params if start == 0 else None)
+
+
+def sync_local_run(run_dir, tracking_uri, experiment_name=None):
+    """Upload a local-only run directory to an MLflow server; returns the remote run id"""
+    run_dir = Path(run_dir)
+    with open(run_dir / 'meta.json') as f:
+        meta = json.load(f)
+    uploader = _MlflowUploader(tracking_uri, experiment_name or meta['experiment_name'], meta.get('run_name'))
+
+    params_file = run_dir / 'params.json'
+    params = json.loads(params_file.read_text()) if params_file.exists() else {}
+    metrics = []
+    metrics_file = run_dir / 'metrics.jsonl'
+    if metrics_file.exists():
+        metrics = [json.loads(line) for line in metrics_file.read_text().splitlines() if line]
+    for start in range(0, max(len(metrics), 1), ExperimentTracker.MAX_BATCH):
+        uploader.log_batch(metrics[start:start + ExperimentTracker.MAX_BATCH], params if start == 0 else None)
+
+    artifacts_file = run_dir / 'artifacts.jsonl'
+    if artifacts_file.exists():
+        for line in artifacts_file.read_text().splitlines():
+            path = json.loads(line)['path']
+            if Path(path).exists():
+                uploader.log_artifact(path)
+            else:
+                logger.warning(f"Artifact {path} no longer exists; skipping")
+    uploader.terminate(meta.get('status', 'FINISHED'))
+
+    meta.update({'remote_run_id': uploader.run_id, 'tracking_uri': tracking_uri, 'local_only': False})
+    with open(run_dir / 'meta.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+    return uploader.run_id
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Experiment tracking utilities')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    sync = subparsers.add_parser('sync', help='Upload local-only runs to an MLflow server')
+    sync.add_argument('run_dirs', nargs='+', help='Local run directories')
+    sync.add_argument('--mlflow-uri', type=str, default='http://localhost:5000', help='MLflow tracking URI')
+    sync.add_argument('--experiment-name', type=str, default=None, help='Override the recorded experiment name')
+    args = parser.parse_args()
+
+    for run_dir in args.run_dirs:
+        remote_id = sync_local_run(run_dir, args.mlflow_uri, args.experiment_name)
+        logger.info(f"Synced {run_dir} -> run {remote_id}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,9 @@ import os
 import torch
 import torch.nn as nn
 import torch.optim as optim
+from torch.nn.parallel import DistributedDataParallel
 from torch.utils.data import DataLoader, Dataset
+from torch.utils.data.distributed import DistributedSampler
 import torchvision.transforms as transforms
 from PIL import Image
 import pandas as pd
@@ -10,8 +12,6 @@ import numpy as np
 import albumentations as A
 from albumentations.pytorch import ToTensorV2
 import timm
-import mlflow
-import mlflow.pytorch
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix
 import matplotlib.pyplot as plt
@@ -20,14 +20,46 @@ from tqdm import tqdm
 import logging
 from pathlib import Path
 import json
+import argparse
+import time
+from contextlib import nullcontext
 from datetime import datetime
 
 import sys
 
+from batch_augment import (AugmentPolicy, BatchAugment, BatchAugmentCollate, DecodedImageCache,
+                           DecodedImageDataset)
+from manifest import load_manifest
+import distributed
+from tracking import ExperimentTracker
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def build_train_transform():
+    """Per-sample albumentations training chain"""
+    return A.Compose([
+        A.Resize(224, 224),
+        A.HorizontalFlip(p=0.5),
+        A.VerticalFlip(p=0.2),
+        A.RandomRotate90(p=0.3),
+        A.RandomBrightnessContrast(p=0.3),
+        A.RandomGamma(p=0.2),
+        A.GaussNoise(p=0.2),
+        A.Blur(blur_limit=3, p=0.1),
+        A.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        ToTensorV2()
+    ])
+
+def build_val_transform():
+    """Deterministic evaluation chain"""
+    return A.Compose([
+        A.Resize(224, 224),
+        A.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        ToTensorV2()
+    ])
+
 class PlantDiseaseDataset(Dataset):
     def __init__(self, image_paths, labels, transform=None):
         self.image_paths = image_paths
@@ -50,19 +82,69 @@ class PlantDiseaseDataset(Dataset):
         
         return image, label
 
+class EarlyStopping:
+    """Signals a stop once validation accuracy has not improved by ``min_delta`` for ``patience`` epochs"""
+    def __init__(self, patience, min_delta=0.0):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best = None
+        self.epochs_without_improvement = 0
+        
+    def step(self, metric):
+        """Record an epoch's metric; returns True when training should stop"""
+        if self.best is None or metric > self.best + self.min_delta:
+            self.best = metric
+            self.epochs_without_improvement = 0
+            return False
+        self.epochs_without_improvement += 1
+        return self.patience > 0 and self.epochs_without_improvement >= self.patience
+
+class TrainingBudget:
+    """Wall-clock and optimizer-step limits for a training run"""
+    def __init__(self, max_minutes=None, max_steps=None):
+        self.max_seconds = max_minutes * 60 if max_minutes else None
+        self.max_steps = max_steps
+        self.steps = 0
+        self.start_time = time.monotonic()
+        
+    def elapsed(self):
+        return time.monotonic() - self.start_time
+        
+    def steps_exhausted(self):
+        """Step limit reached; ranks step in lockstep, so they all agree without communicating"""
+        return self.max_steps is not None and self.steps >= self.max_steps
+        
+    def exhausted(self):
+        if self.steps_exhausted():
+            return True
+        return self.max_seconds is not None and self.elapsed() >= self.max_seconds
+        
+    def allows_epoch(self, epoch_seconds):
+        """Whether another epoch of roughly ``epoch_seconds`` fits in the remaining time"""
+        if self.exhausted():
+            return False
+        return self.max_seconds is None or self.elapsed() + epoch_seconds <= self.max_seconds
+
 class PlantDiseaseTrainer:
-    def __init__(self, config):
+    def __init__(self, config, local_rank=0):
         self.config = config
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.distributed = distributed.is_distributed()
+        self.is_main = distributed.is_main_process()
+        if self.distributed:
+            self.device = distributed.local_device(local_rank)
+        else:
+            self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.model = None
         self.class_names = []
         self.train_loader = None
         self.val_loader = None
         self.test_loader = None
+        self.train_batch_transform = None
+        self.val_batch_transform = None
         
-        # Setup MLflow
-        mlflow.set_tracking_uri(config.mlflow_uri)
-        mlflow.set_experiment(config.experiment_name)
+        # Experiment tracking: only rank 0 logs when distributed. Records go to a local
+        # directory and are uploaded in the background; an empty URI keeps them local.
+        self.tracker = None
         
     def prepare_data(self):
         """Prepare datasets and data loaders"""
@@ -73,7 +155,7 @@ class PlantDiseaseTrainer:
         if not labels_file.exists():
             logger.error(f"Labels file not found for {self.config.plant_type}. Please run the organization script first.")
             sys.exit(1)
-        df = pd.read_csv(labels_file)
+        df = load_manifest(labels_file, self.config.dataset_path)
         
         # Filter out test and validation sets if they exist
         train_df = df[df['split'] == 'train'].copy()
@@ -95,51 +177,68 @@ class PlantDiseaseTrainer:
             stratify=train_df['class_idx']
         )
         
-        # Define transforms
-        train_transform = A.Compose([
-            A.Resize(224, 224),
-            A.HorizontalFlip(p=0.5),
-            A.VerticalFlip(p=0.2),
-            A.RandomRotate90(p=0.3),
-            A.RandomBrightnessContrast(p=0.3),
-            A.RandomGamma(p=0.2),
-            A.GaussNoise(p=0.2),
-            A.Blur(blur_limit=3, p=0.1),
-            A.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-            ToTensorV2()
-        ])
-        
-        val_transform = A.Compose([
-            A.Resize(224, 224),
-            A.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-            ToTensorV2()
-        ])
-        
-        # Create datasets
-        train_dataset = PlantDiseaseDataset(train_paths, train_labels, train_transform)
-        val_dataset = PlantDiseaseDataset(val_paths, val_labels, val_transform)
-        
-        # Create data loaders
-        self.train_loader = DataLoader(
-            train_dataset,
-            batch_size=self.config.batch_size,
-            shuffle=True,
-            num_workers=self.config.num_workers,
-            pin_memory=True
-        )
-        
-        self.val_loader = DataLoader(
-            val_dataset,
+        if self.config.decoded_cache or self.config.augment_engine == 'batched':
+            self._build_batched_loaders(train_paths, val_paths, train_labels, val_labels)
+        else:
+            # Create datasets
+            train_dataset = PlantDiseaseDataset(train_paths, train_labels, build_train_transform())
+            val_dataset = PlantDiseaseDataset(val_paths, val_labels, build_val_transform())
+            
+            # Create data loaders
+            self.train_loader = self._make_loader(train_dataset, shuffle=True)
+            self.val_loader = self._make_loader(val_dataset, shuffle=False)
+        
+        if self.is_main:
+            logger.info(f"Training samples: {len(self.train_loader.dataset)}")
+            logger.info(f"Validation samples: {len(self.val_loader.dataset)}")
+            logger.info(f"Number of classes: {len(self.class_names)}")
+            if self.distributed:
+                logger.info(f"Sharded across {distributed.get_world_size()} processes")
+        
+    def _build_batched_loaders(self, train_paths, val_paths, train_labels, val_labels):
+        """Loaders for the batched augmentation engine.
+
+        Workers only decode (downscaled) and stack uint8 tensors, or read them from the
+        shared decoded cache when ``--decoded-cache`` is set. The augmentation policy
+        runs as batched tensor ops: on the GPU when training there, otherwise inside the
+        worker collate so it overlaps with the training step.
+        """
+        policy = AugmentPolicy.from_albumentations(build_train_transform())
+        train_augment = BatchAugment(policy, train=True)
+        val_augment = BatchAugment(policy, train=False)
+        
+        if self.device.type == 'cuda':
+            self.train_batch_transform = train_augment.to(self.device)
+            self.val_batch_transform = val_augment.to(self.device)
+            train_collate = val_collate = None
+        else:
+            train_collate = BatchAugmentCollate(train_augment)
+            val_collate = BatchAugmentCollate(val_augment)
+        
+        if self.config.decoded_cache:
+            cache = DecodedImageCache.open_or_build(self.config.decoded_cache, list(train_paths) + list(val_paths))
+            train_dataset = cache.dataset(train_paths, train_labels)
+            val_dataset = cache.dataset(val_paths, val_labels)
+        else:
+            train_dataset = DecodedImageDataset(train_paths, train_labels)
+            val_dataset = DecodedImageDataset(val_paths, val_labels)
+        
+        self.train_loader = self._make_loader(train_dataset, True, train_collate)
+        self.val_loader = self._make_loader(val_dataset, False, val_collate)
+        
+    def _make_loader(self, dataset, shuffle, collate_fn=None):
+        """DataLoader that shards ``dataset`` across ranks when running distributed"""
+        sampler = DistributedSampler(dataset, shuffle=shuffle) if self.distributed else None
+        return DataLoader(
+            dataset,
             batch_size=self.config.batch_size,
-            shuffle=False,
+            shuffle=shuffle and sampler is None,
+            sampler=sampler,
             num_workers=self.config.num_workers,
-            pin_memory=True
+            pin_memory=self.device.type == 'cuda',
+            collate_fn=collate_fn
         )
         
-        logger.info(f"Training samples: {len(train_dataset)}")
-        logger.info(f"Validation samples: {len(val_dataset)}")
-        logger.info(f"Number of classes: {len(self.class_names)}")
-        
     def create_model(self):
         """Create and initialize the model"""
         logger.info("Creating model...")
@@ -153,6 +252,9 @@ class PlantDiseaseTrainer:
         
         # Move to device
         self.model = self.model.to(self.device)
+        if self.distributed:
+            device_ids = [self.device.index] if self.device.type == 'cuda' else None
+            self.model = DistributedDataParallel(self.model, device_ids=device_ids)
         
         # Count parameters
         total_params = sum(p.numel() for p in self.model.parameters())
@@ -161,20 +263,35 @@ class PlantDiseaseTrainer:
         logger.info(f"Total parameters: {total_params:,}")
         logger.info(f"Trainable parameters: {trainable_params:,}")
         
-    def train_epoch(self, optimizer, criterion, scheduler=None):
-        """Train for one epoch"""
+    def checkpoint_metadata(self):
+        """Fields the ML service reads to rebuild the network for inference"""
+        return {'model_name': self.config.model_name, 'input_size': 224}
+        
+    def _unwrapped_model(self):
+        """The underlying model, so checkpoints never carry DDP's ``module.`` prefix"""
+        return self.model.module if isinstance(self.model, DistributedDataParallel) else self.model
+        
+    def compute_loss(self, data, target, criterion):
+        """Forward pass and training loss for one batch; returns ``(output, loss)``"""
+        output = self.model(data)
+        return output, criterion(output, target)
+        
+    def train_epoch(self, optimizer, criterion, scheduler=None, budget=None):
+        """Train for one epoch, stopping early if ``budget`` runs out"""
         self.model.train()
         running_loss = 0.0
         correct = 0
         total = 0
+        batches = 0
         
-        pbar = tqdm(self.train_loader, desc="Training")
+        pbar = tqdm(self.train_loader, desc="Training", disable=not self.is_main)
         for batch_idx, (data, target) in enumerate(pbar):
             data, target = data.to(self.device), target.to(self.device)
+            if self.train_batch_transform is not None:
+                data = self.train_batch_transform(data)
             
             optimizer.zero_grad()
-            output = self.model(data)
-            loss = criterion(output, target)
+            output, loss = self.compute_loss(data, target, criterion)
             loss.backward()
             optimizer.step()
             
@@ -191,9 +308,21 @@ class PlantDiseaseTrainer:
             
             if scheduler:
                 scheduler.step()
-        
-        epoch_loss = running_loss / len(self.train_loader)
-        epoch_acc = 100. * correct / total
+            
+            batches += 1
+            if budget is not None:
+                budget.steps += 1
+                # Ranks must leave the loop together or DDP's gradient all-reduce deadlocks. The
+                # step count is the same on every rank; wall time is only synced between epochs.
+                if budget.steps_exhausted():
+                    logger.info("Step budget exhausted mid-epoch")
+                    break
+        
+        running_loss, batches, correct, total = distributed.all_reduce_sum(
+            running_loss, batches, correct, total, device=self.device
+        )
+        epoch_loss = running_loss / max(batches, 1)
+        epoch_acc = 100. * correct / max(total, 1)
         
         return epoch_loss, epoch_acc
     
@@ -205,9 +334,11 @@ class PlantDiseaseTrainer:
         total = 0
         
         with torch.no_grad():
-            pbar = tqdm(self.val_loader, desc="Validation")
+            pbar = tqdm(self.val_loader, desc="Validation", disable=not self.is_main)
             for data, target in pbar:
                 data, target = data.to(self.device), target.to(self.device)
+                if self.val_batch_transform is not None:
+                    data = self.val_batch_transform(data)
                 output = self.model(data)
                 loss = criterion(output, target)
                 
@@ -221,13 +352,21 @@ class PlantDiseaseTrainer:
                     'Acc': f'{100.*correct/total:.2f}%'
                 })
         
-        epoch_loss = running_loss / len(self.val_loader)
+        batches = len(self.val_loader)
+        running_loss, batches, correct, total = distributed.all_reduce_sum(
+            running_loss, batches, correct, total, device=self.device
+        )
+        epoch_loss = running_loss / batches
         epoch_acc = 100. * correct / total
         
         return epoch_loss, epoch_acc
     
-    def train(self):
-        """Main training loop"""
+    def train(self, epoch_callback=None):
+        """Main training loop
+
+        ``epoch_callback(epoch, metrics)`` is called after every epoch; returning True
+        stops training (used by the sweep runner to prune trials).
+        """
         logger.info("Starting training...")
         
         # Create model
@@ -241,13 +380,19 @@ class PlantDiseaseTrainer:
             weight_decay=self.config.weight_decay
         )
         
-        # Learning rate scheduler
+        # Learning rate scheduler, stepped once per batch so the horizon is in optimizer steps
+        total_steps = self.config.epochs * len(self.train_loader)
+        if self.config.max_steps:
+            total_steps = min(total_steps, self.config.max_steps)
         scheduler = optim.lr_scheduler.CosineAnnealingLR(
             optimizer,
-            T_max=self.config.epochs,
+            T_max=max(total_steps, 1),
             eta_min=self.config.learning_rate * 0.01
         )
         
+        early_stopping = EarlyStopping(self.config.patience, self.config.min_delta)
+        budget = TrainingBudget(self.config.time_budget_minutes, self.config.max_steps)
+        
         # Training history
         history = {
             'train_loss': [],
@@ -259,25 +404,42 @@ class PlantDiseaseTrainer:
         best_val_acc = 0.0
         best_model_state = None
         
-        # Start MLflow run
-        with mlflow.start_run():
+        # Start tracking run (rank 0 only when distributed)
+        if self.is_main:
+            self.tracker = ExperimentTracker(self.config.mlflow_uri, self.config.experiment_name,
+                                             self.config.tracking_dir, run_name=self.config.plant_type)
+        with self.tracker or nullcontext():
             # Log parameters
-            mlflow.log_params({
-                'model_name': self.config.model_name,
-                'batch_size': self.config.batch_size,
-                'learning_rate': self.config.learning_rate,
-                'weight_decay': self.config.weight_decay,
-                'epochs': self.config.epochs,
-                'num_classes': len(self.class_names),
-                'class_names': json.dumps(self.class_names)
-            })
+            if self.tracker:
+                self.tracker.log_params({
+                    'model_name': self.config.model_name,
+                    'batch_size': self.config.batch_size,
+                    'learning_rate': self.config.learning_rate,
+                    'weight_decay': self.config.weight_decay,
+                    'epochs': self.config.epochs,
+                    'patience': self.config.patience,
+                    'min_delta': self.config.min_delta,
+                    'time_budget_minutes': self.config.time_budget_minutes,
+                    'max_steps': self.config.max_steps,
+                    'world_size': distributed.get_world_size(),
+                    'num_classes': len(self.class_names),
+                    'class_names': json.dumps(self.class_names)
+                })
             
             # Training loop
+            epoch_seconds = 0.0
             for epoch in range(self.config.epochs):
-                logger.info(f"Epoch {epoch+1}/{self.config.epochs}")
+                if epoch > 0 and distributed.any_rank(not budget.allows_epoch(epoch_seconds), self.device):
+                    logger.info(f"Stopping before epoch {epoch+1}: training budget would be exceeded")
+                    break
+                if self.is_main:
+                    logger.info(f"Epoch {epoch+1}/{self.config.epochs}")
+                if isinstance(self.train_loader.sampler, DistributedSampler):
+                    self.train_loader.sampler.set_epoch(epoch)
+                epoch_start = time.monotonic()
                 
                 # Train
-                train_loss, train_acc = self.train_epoch(optimizer, criterion, scheduler)
+                train_loss, train_acc = self.train_epoch(optimizer, criterion, scheduler, budget)
                 
                 # Validate
                 val_loss, val_acc = self.validate_epoch(criterion)
@@ -288,108 +450,164 @@ class PlantDiseaseTrainer:
                 history['val_loss'].append(val_loss)
                 history['val_acc'].append(val_acc)
                 
-                # Log metrics
-                mlflow.log_metrics({
+                # Metrics are already reduced across ranks, so every rank agrees on "best".
+                # The first epoch always counts, so model_best.pth never lacks weights.
+                if best_model_state is None or val_acc > best_val_acc:
+                    best_val_acc = val_acc
+                    best_model_state = {k: v.detach().clone() for k, v in self._unwrapped_model().state_dict().items()}
+                    
+                    # Save model checkpoint
+                    if self.is_main:
+                        checkpoint_path = self.config.output_dir / f'model_epoch_{epoch+1}.pth'
+                        torch.save({
+                            'epoch': epoch,
+                            'model_state_dict': best_model_state,
+                            'optimizer_state_dict': optimizer.state_dict(),
+                            'val_acc': val_acc,
+                            'class_names': self.class_names,
+                            **self.checkpoint_metadata()
+                        }, checkpoint_path)
+                        
+                        self.tracker.log_artifact(checkpoint_path)
+                
+                epoch_metrics = {
                     'train_loss': train_loss,
                     'train_acc': train_acc,
                     'val_loss': val_loss,
                     'val_acc': val_acc,
                     'learning_rate': optimizer.param_groups[0]['lr']
-                }, step=epoch)
-                
-                # Save best model
-                if val_acc > best_val_acc:
-                    best_val_acc = val_acc
-                    best_model_state = self.model.state_dict().copy()
-                    
-                    # Save model checkpoint
-                    checkpoint_path = self.config.output_dir / f'model_epoch_{epoch+1}.pth'
-                    torch.save({
-                        'epoch': epoch,
-                        'model_state_dict': self.model.state_dict(),
-                        'optimizer_state_dict': optimizer.state_dict(),
-                        'val_acc': val_acc,
-                        'class_names': self.class_names
-                    }, checkpoint_path)
+                }
+                if self.is_main:
+                    # Log metrics
+                    self.tracker.log_metrics(epoch_metrics, step=epoch)
                     
-                    mlflow.log_artifact(str(checkpoint_path))
+                    logger.info(f"Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.2f}%")
+                    logger.info(f"Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}%")
+                    logger.info(f"Best Val Acc: {best_val_acc:.2f}%")
                 
-                logger.info(f"Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.2f}%")
-                logger.info(f"Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}%")
-                logger.info(f"Best Val Acc: {best_val_acc:.2f}%")
-            
-            # Save final model
-            final_model_path = self.config.output_dir / 'model_best.pth'
-            torch.save({
-                'model_state_dict': best_model_state,
-                'class_names': self.class_names,
-                'val_acc': best_val_acc,
-                'config': self.config
-            }, final_model_path)
+                epoch_seconds = time.monotonic() - epoch_start
+                if epoch_callback is not None and epoch_callback(epoch, epoch_metrics):
+                    logger.info(f"Stopped by epoch callback after epoch {epoch+1}")
+                    break
+                if early_stopping.step(val_acc):
+                    if self.is_main:
+                        logger.info(f"Early stopping: no improvement > {self.config.min_delta} for {self.config.patience} epochs")
+                    break
+                # The budget is synced across ranks once per epoch, at the top of the next one
             
-            mlflow.log_artifact(str(final_model_path))
-            
-            # Log final metrics
-            mlflow.log_metrics({
-                'final_train_acc': history['train_acc'][-1],
-                'final_val_acc': history['val_acc'][-1],
-                'best_val_acc': best_val_acc
-            })
-            
-            logger.info(f"Training completed! Best validation accuracy: {best_val_acc:.2f}%")
+            if self.is_main:
+                # Save final model
+                final_model_path = self.config.output_dir / 'model_best.pth'
+                torch.save({
+                    'model_state_dict': best_model_state,
+                    'class_names': self.class_names,
+                    'val_acc': best_val_acc,
+                    'epochs_trained': len(history['val_acc']),
+                    'config': {k: str(v) for k, v in vars(self.config).items()},
+                    **self.checkpoint_metadata()
+                }, final_model_path)
+                
+                self.tracker.log_artifact(final_model_path)
+                
+                # Log final metrics
+                self.tracker.log_metrics({
+                    'final_train_acc': history['train_acc'][-1],
+                    'final_val_acc': history['val_acc'][-1],
+                    'best_val_acc': best_val_acc
+                })
+                
+                logger.info(f"Training completed! Best validation accuracy: {best_val_acc:.2f}%")
             
             return history, best_val_acc
 
-def main():
-    """Main training function"""
-    import argparse
+class TrainingConfig:
+    def __init__(self, args):
+        self.plant_type = args.plant_type
+        self.dataset_path = Path(args.dataset_path)
+        self.output_dir = Path(args.output_dir) / self.plant_type
+        self.model_name = args.model_name
+        self.batch_size = args.batch_size
+        self.epochs = args.epochs
+        self.learning_rate = args.learning_rate
+        self.weight_decay = args.weight_decay
+        self.num_workers = args.num_workers
+        self.mlflow_uri = args.mlflow_uri
+        self.experiment_name = args.experiment_name
+        self.augment_engine = args.augment_engine
+        self.patience = args.patience
+        self.min_delta = args.min_delta
+        self.time_budget_minutes = args.time_budget_minutes
+        self.max_steps = args.max_steps
+        self.decoded_cache = args.decoded_cache
+        self.tracking_dir = Path(args.tracking_dir)
+
+def run_training(local_rank, args):
+    """Prepare data and train; runs once per process when distributed"""
+    config = TrainingConfig(args)
+    
+    # Initialize trainer
+    trainer = PlantDiseaseTrainer(config, local_rank)
+    
+    # Prepare data
+    trainer.prepare_data()
     
+    # Train model
+    history, best_acc = trainer.train()
+    
+    if trainer.is_main:
+        logger.info("Training completed successfully!")
+    return history, best_acc
+
+def build_arg_parser():
     parser = argparse.ArgumentParser(description='Train Plant Disease Classification Model')
     parser.add_argument('plant_type', type=str, choices=['potato', 'tomato'], help='Type of plant to train (potato or tomato)')
     parser.add_argument('--dataset-path', type=str, default='../dataset', help='Path to dataset')
     parser.add_argument('--output-dir', type=str, default='models', help='Output directory for models')
     parser.add_argument('--model-name', type=str, default='efficientnet_b0', help='Model name')
-    parser.add_argument('--batch-size', type=int, default=32, help='Batch size')
+    parser.add_argument('--batch-size', type=int, default=32, help='Batch size (per process when distributed)')
     parser.add_argument('--epochs', type=int, default=50, help='Number of epochs')
     parser.add_argument('--learning-rate', type=float, default=0.001, help='Learning rate')
     parser.add_argument('--weight-decay', type=float, default=0.01, help='Weight decay')
     parser.add_argument('--num-workers', type=int, default=4, help='Number of workers')
-    parser.add_argument('--mlflow-uri', type=str, default='http://localhost:5000', help='MLflow tracking URI')
+    parser.add_argument('--mlflow-uri', type=str, default='http://localhost:5000',
+                        help='MLflow tracking URI (empty keeps tracking local-only)')
+    parser.add_argument('--tracking-dir', type=str, default='tracking',
+                        help='Local directory runs are buffered in before upload')
     parser.add_argument('--experiment-name', type=str, default='plant-disease-classification', help='MLflow experiment name')
-    
-    args = parser.parse_args()
+    parser.add_argument('--patience', type=int, default=10,
+                        help='Stop after this many epochs without val accuracy improvement (0 disables)')
+    parser.add_argument('--min-delta', type=float, default=0.0,
+                        help='Minimum val accuracy gain (percentage points) that counts as improvement')
+    parser.add_argument('--time-budget-minutes', type=float, default=None, help='Wall-clock budget for training')
+    parser.add_argument('--max-steps', type=int, default=None, help='Optimizer step budget for training')
+    parser.add_argument('--augment-engine', type=str, default='albumentations', choices=['albumentations', 'batched'],
+                        help='Per-sample albumentations chain or batched tensor augmentation after early downscale')
+    parser.add_argument('--nproc-per-node', type=int, default=1,
+                        help='Spawn this many DistributedDataParallel processes on this host')
+    parser.add_argument('--dist-backend', type=str, default='gloo', help='torch.distributed backend')
+    parser.add_argument('--decoded-cache', type=str, default=None,
+                        help='Memory-mapped cache of decoded 224x224 images, built on first use (implies batched augmentation)')
+    return parser
+
+def main():
+    """Main training function"""
+    args = build_arg_parser().parse_args()
     
     # Create output directory
     output_dir = Path(args.output_dir) / args.plant_type
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Create config object
-    class Config:
-        def __init__(self, args):
-            self.plant_type = args.plant_type
-            self.dataset_path = Path(args.dataset_path)
-            self.output_dir = Path(args.output_dir) / self.plant_type
-            self.model_name = args.model_name
-            self.batch_size = args.batch_size
-            self.epochs = args.epochs
-            self.learning_rate = args.learning_rate
-            self.weight_decay = args.weight_decay
-            self.num_workers = args.num_workers
-            self.mlflow_uri = args.mlflow_uri
-            self.experiment_name = args.experiment_name
-    
-    config = Config(args)
-    
-    # Initialize trainer
-    trainer = PlantDiseaseTrainer(config)
-    
-    # Prepare data
-    trainer.prepare_data()
-    
-    # Train model
-    history, best_acc = trainer.train()
-    
-    logger.info("Training completed successfully!")
+    if distributed.launched_with_torchrun():
+        # Multi-node: torchrun exports RANK/WORLD_SIZE/MASTER_ADDR for every process
+        distributed.init_process_group(args.dist_backend)
+        try:
+            run_training(int(os.environ.get('LOCAL_RANK', 0)), args)
+        finally:
+            distributed.cleanup()
+    elif args.nproc_per_node > 1:
+        distributed.spawn(run_training, args.nproc_per_node, args.dist_backend, args=(args,))
+    else:
+        run_training(0, args)
 
 if __name__ == '__main__':
     main()
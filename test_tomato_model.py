@@ -10,16 +10,26 @@ from pathlib import Path
 import json
 import argparse
 import logging
+import os
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'ml_training'))
+from evaluate import evaluate_checkpoint, held_out_split
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Same setting and default as the ML service: tomato checkpoints with a flipped two-class head
+TOMATO_INVERT_OUTPUT = os.getenv('TOMATO_INVERT_OUTPUT', 'true').lower() in ('1', 'true', 'yes')
+
 class TomatoDiseasePredictor:
-    def __init__(self, model_path, class_names):
+    def __init__(self, model_path, class_names, invert_output=TOMATO_INVERT_OUTPUT):
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.class_names = class_names
+        self.invert_output = invert_output
         self.model = None
+        self.model_path = model_path
         self.load_model(model_path)
         
         # Define transforms for inference
@@ -53,6 +63,8 @@ class TomatoDiseasePredictor:
             with torch.no_grad():
                 outputs = self.model(image_tensor)
                 probabilities = F.softmax(outputs, dim=1)
+                if self.invert_output and probabilities.shape[1] == 2:
+                    probabilities = probabilities[:, [1, 0]]
                 confidence, predicted = torch.max(probabilities, 1)
                 
                 predicted_class = self.class_names[predicted.item()]
@@ -71,60 +83,22 @@ class TomatoDiseasePredictor:
             logger.error(f"Error predicting image {image_path}: {e}")
             return None
     
-    def test_on_dataset(self, test_data_path, num_samples=10):
-        """Test the model on a subset of the test dataset"""
-        logger.info(f"Testing model on {num_samples} samples from test dataset...")
-        
-        # Load test data
-        df = pd.read_csv(test_data_path)
-        test_df = df[df['split'] == 'test'].copy()
-        
-        if len(test_df) == 0:
-            logger.warning("No test data found, using validation data instead")
-            test_df = df[df['split'] == 'validation'].copy()
+    def test_on_dataset(self, test_data_path, num_samples=None, output_dir='evaluation/tomato'):
+        """Evaluate the model on the test split with the batched harness in ml_training/evaluate.py"""
+        held_out = held_out_split(Path(test_data_path), Path(test_data_path).parent)
+        if num_samples:
+            held_out = held_out.sample(n=min(num_samples, len(held_out)), random_state=42)
+        logger.info(f"Testing model on {len(held_out)} samples from test dataset...")
         
-        # Sample random test images
-        test_samples = test_df.sample(n=min(num_samples, len(test_df)), random_state=42)
+        summary = evaluate_checkpoint(self.model_path, held_out, output_dir, device=self.device,
+                                      class_names=self.class_names, invert_output=self.invert_output)
+        results = pd.read_parquet(Path(output_dir) / 'predictions.parquet')
         
-        correct_predictions = 0
-        total_predictions = 0
-        
-        results = []
-        
-        for idx, row in test_samples.iterrows():
-            image_path = row['image_path']
-            true_label = row['label']
-            
-            # Make prediction
-            prediction = self.predict_single_image(image_path)
-            
-            if prediction:
-                predicted_class = prediction['predicted_class']
-                confidence = prediction['confidence']
-                
-                is_correct = predicted_class == true_label
-                if is_correct:
-                    correct_predictions += 1
-                total_predictions += 1
-                
-                results.append({
-                    'image_path': image_path,
-                    'true_label': true_label,
-                    'predicted_class': predicted_class,
-                    'confidence': confidence,
-                    'correct': is_correct
-                })
-                
-                logger.info(f"Image: {Path(image_path).name}")
-                logger.info(f"True: {true_label}, Predicted: {predicted_class}, Confidence: {confidence:.3f}")
-                logger.info(f"Correct: {'✓' if is_correct else '✗'}")
-                logger.info("-" * 50)
-        
-        accuracy = correct_predictions / total_predictions if total_predictions > 0 else 0
         logger.info(f"\nTest Results:")
-        logger.info(f"Accuracy: {accuracy:.3f} ({correct_predictions}/{total_predictions})")
+        logger.info(f"Accuracy: {summary['accuracy']:.3f} ({int(results['correct'].sum())}/{len(results)})")
+        logger.info(f"Expected calibration error: {summary['ece']:.3f}")
         
-        return results, accuracy
+        return results, summary['accuracy']
 
 def main():
     parser = argparse.ArgumentParser(description='Test Tomato Disease Classification Model')
@@ -132,8 +106,8 @@ def main():
                        help='Path to trained model')
     parser.add_argument('--test-data', type=str, default='dataset/tomato_labels.csv', 
                        help='Path to test data')
-    parser.add_argument('--num-samples', type=int, default=20, 
-                       help='Number of test samples to evaluate')
+    parser.add_argument('--num-samples', type=int, default=None, 
+                       help='Evaluate a random subset of this size (default: the whole test split)')
     parser.add_argument('--image-path', type=str, default=None, 
                        help='Path to single image for prediction')
     
@@ -168,12 +142,7 @@ def main():
             return
         
         results, accuracy = predictor.test_on_dataset(test_data_path, args.num_samples)
-        
-        # Save results
-        results_df = pd.DataFrame(results)
-        results_file = 'tomato_test_results.csv'
-        results_df.to_csv(results_file, index=False)
-        logger.info(f"Test results saved to {results_file}")
+        logger.info("Test results saved to evaluation/tomato")
 
 if __name__ == '__main__':
     main()